@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Benchmark: event -> X latency with the embedded broker against the usual
+external-broker setup. The simulated modules talk MQTT over TCP in both:
+
+- embedded: modules -> broker inside the orchestrator -> game logic (one hop)
+- external: modules -> broker -> orchestrator client over TCP (two hops)
+
+The external broker is MQTT_BROKER/MQTT_PORT if set (paho needed), otherwise
+a standalone EmbeddedBroker on localhost standing in for Mosquitto.
+"""
+
+import contextlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+from clock import VirtualClock
+from embedded_broker import EmbeddedBroker, EmbeddedTransport, SocketClient
+from simulated_modules import MODULES, SimulatedModule
+from transport import PahoTransport, get_broker_address
+
+EVENTS = 2000
+
+
+def prepare_config():
+    config_dir = tempfile.mkdtemp()
+    config_file = os.path.join(config_dir, "config.json")
+    shutil.copy(os.path.join(os.path.dirname(orchestrator.__file__), "config.json"), config_file)
+    # Keep the admission stage in the path but let every event through
+    with open(config_file) as f:
+        config = json.load(f)
+    config["admission"] = {"rate": 1e9, "burst": 1e9}
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    orchestrator.CONFIG_FILE = config_file
+
+
+def external_client():
+    try:
+        return PahoTransport(), "paho"
+    except ImportError:
+        return SocketClient(client_id="orchestrator"), "socket client, paho not installed"
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise RuntimeError("Timed out waiting for the rig to settle")
+        time.sleep(0.005)
+
+
+def measure(client, host, port, events):
+    # Simulated time for the orchestrator so no heartbeat thread runs
+    orchestrator.clock = VirtualClock()
+    orchestrator.reset_all_games(client)
+    for module in orchestrator.modules_connected:
+        orchestrator.modules_connected[module] = False
+
+    subscribed = threading.Event()
+
+    def on_connect(client, userdata, flags, rc):
+        orchestrator.on_connect(client, userdata, flags, rc)
+        subscribed.set()
+
+    client.on_connect = on_connect
+    client.on_message = orchestrator.on_message
+    client.connect(host, port, 60)
+    client.loop_start()
+    subscribed.wait(5)
+    if isinstance(client, EmbeddedTransport):
+        # Listening on an ephemeral port
+        port = client.broker.port
+
+    modules = {}
+    for name in MODULES:
+        module = SimulatedModule(name, SocketClient(client_id=f"bench-{name}"))
+        module.connect(host, port)
+        module.transport.loop_start()
+        modules[name] = module
+    wait_until(lambda: all(module.transport.is_connected() for module in modules.values()))
+    # Give the SUBSCRIBEs sent from on_connect time to land
+    time.sleep(0.1)
+    for module in modules.values():
+        module.announce()
+    wait_until(lambda: all(orchestrator.modules_connected.values()))
+
+    display = modules["display"]
+    maze = modules["maze"]
+    received = threading.Event()
+    display.on_command = lambda module, command, data: command == "X" and received.set()
+
+    latencies = []
+    for event in range(events):
+        received.clear()
+        # Keep the display below the X limit so every event is answered
+        display.x_count = 0
+        start = time.perf_counter()
+        # Distinct timestamps so the dedup window doesn't drop them
+        maze.send("WALL_HIT", maze_id="maze_2", position_x=2, position_y=1, timestamp=event + 1)
+        received.wait(1.0)
+        latencies.append(time.perf_counter() - start)
+
+    for module in modules.values():
+        module.transport.loop_stop()
+    client.loop_stop()
+    client.disconnect()
+    return sorted(latencies)
+
+
+def report(label, latencies):
+    print(f"{label}: event -> X latency over {len(latencies)} events")
+    print(f"  mean: {statistics.mean(latencies) * 1e6:8.1f} us")
+    print(f"  p50:  {latencies[len(latencies) // 2] * 1e6:8.1f} us")
+    print(f"  p99:  {latencies[int(len(latencies) * 0.99)] * 1e6:8.1f} us")
+    print(f"  max:  {latencies[-1] * 1e6:8.1f} us")
+
+
+def run_benchmark(events=EVENTS):
+    prepare_config()
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        client = EmbeddedTransport(EmbeddedBroker("127.0.0.1", 0))
+        results["embedded broker"] = measure(client, "127.0.0.1", 0, events)
+        client.broker.stop()
+
+        standalone = None
+        if "MQTT_BROKER" in os.environ:
+            client, kind = PahoTransport(), "paho"
+            host, port = get_broker_address()
+        else:
+            standalone = EmbeddedBroker("127.0.0.1", 0).start()
+            client, kind = external_client()
+            host, port = "127.0.0.1", standalone.port
+        results[f"external broker ({kind})"] = measure(client, host, port, events)
+        if standalone is not None:
+            standalone.stop()
+
+    for label, latencies in results.items():
+        report(label, latencies)
+    return results
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else EVENTS)
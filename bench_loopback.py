@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark: event -> X latency through the orchestrator on the in-process
+loopback transport. Runs the orchestrator and simulated modules on their own
+loop threads in a single process, no broker needed.
+"""
+
+import contextlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+from simulated_modules import create_loopback_modules, pump
+from transport import LoopbackBroker, LoopbackTransport
+
+EVENTS = 2000
+
+
+def run_benchmark(events=EVENTS):
+    config_dir = tempfile.mkdtemp()
+    config_file = os.path.join(config_dir, "config.json")
+    shutil.copy(os.path.join(os.path.dirname(orchestrator.__file__), "config.json"), config_file)
+    # Keep the admission stage in the path but let every event through
+    with open(config_file) as f:
+        config = json.load(f)
+    config["admission"] = {"rate": 1e9, "burst": 1e9}
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    orchestrator.CONFIG_FILE = config_file
+
+    broker = LoopbackBroker()
+    client = LoopbackTransport(broker)
+    client.on_connect = orchestrator.on_connect
+    client.on_message = orchestrator.on_message
+    client.connect()
+    modules = create_loopback_modules(broker)
+    display = modules["display"]
+    maze = modules["maze"]
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        pump(client, *[m.transport for m in modules.values()])
+        for module in modules.values():
+            module.announce()
+        pump(client, *[m.transport for m in modules.values()])
+
+        received = threading.Event()
+        latencies = []
+
+        def on_command(module, command, data):
+            if command == "X":
+                received.set()
+
+        display.on_command = on_command
+        client.loop_start()
+        display.transport.loop_start()
+
+        for event in range(events):
+            received.clear()
+            # Keep the display below the X limit so every event is answered
+            display.x_count = 0
+            start = time.perf_counter()
+            # Distinct timestamps so the dedup window doesn't drop them
+            maze.send("WALL_HIT", maze_id="maze_2", position_x=2, position_y=1, timestamp=event + 1)
+            received.wait(1.0)
+            latencies.append(time.perf_counter() - start)
+
+        display.transport.loop_stop()
+        client.loop_stop()
+
+    latencies.sort()
+    print(f"Loopback event -> X latency over {events} events")
+    print(f"  mean: {statistics.mean(latencies) * 1e6:8.1f} us")
+    print(f"  p50:  {latencies[len(latencies) // 2] * 1e6:8.1f} us")
+    print(f"  p99:  {latencies[int(len(latencies) * 0.99)] * 1e6:8.1f} us")
+    print(f"  max:  {latencies[-1] * 1e6:8.1f} us")
+    return latencies
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else EVENTS)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GAME_OVER latency while the outbound link is saturated with
+bulk traffic (UPDATE_MAZE_CONFIG/UPDATE_BUTTON_CONFIG pushes, config
+responses and routine resets), with priority lanes against one FIFO queue.
+
+Both runs use the same OutboundScheduler, link rate and queue bound. The
+only difference is that the FIFO run puts every message in a single lane.
+The bulk producers offer more than the link can carry, so the queues stay
+full for the whole run. In the FIFO run a GAME_OVER waits behind a full
+queue, or is dropped at its bound. With lanes it only waits for the link
+to finish the message already on it.
+"""
+
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from config_model import compile_config
+from outbound import DIAGNOSTICS, OutboundScheduler
+from transport import LoopbackBroker, LoopbackTransport
+
+RATE = 40000         # link budget in bytes per second, as in config.json
+OVERLOAD = 1.5       # offered bulk load relative to RATE
+DURATION = 5.0       # seconds per run
+PROBE_INTERVAL = 0.05
+QUEUE_BOUND = 64
+
+
+def bulk_messages():
+    """The bulk traffic mix, built from the shipped config.json"""
+    config_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi", "config.json")
+    with open(config_file) as f:
+        config = json.load(f)
+    model = compile_config(config)
+    maze = dict(model.maze.message(), type="UPDATE_MAZE_CONFIG", command="UPDATE_MAZE_CONFIG")
+    button = dict(model.button.message(), type="UPDATE_BUTTON_CONFIG", command="UPDATE_BUTTON_CONFIG")
+    return [
+        ("rpi/to/esp3", json.dumps(maze)),
+        ("rpi/to/esp4", json.dumps(button)),
+        ("config/response", json.dumps(config)),
+        ("rpi/to/esp", json.dumps({"type": "RESET_GAME", "command": "RESET_GAME"})),
+        ("rpi/to/esp3", json.dumps(maze)),
+        ("rpi/to/esp4", json.dumps(button)),
+    ]
+
+
+def run(label, lanes):
+    broker = LoopbackBroker()
+    listener = LoopbackTransport(broker)
+    listener.connect()
+    listener.drain()
+    listener.subscribe("rpi/to/esp2")
+    sent_at = {}
+    latencies = []
+
+    def on_message(client, userdata, msg):
+        data = json.loads(msg.payload)
+        if data.get("type") == "GAME_OVER":
+            latencies.append(time.perf_counter() - sent_at[data["probe"]])
+
+    listener.on_message = on_message
+    listener.loop_start()
+
+    capacity = {"configuration": QUEUE_BOUND, "diagnostics": QUEUE_BOUND}
+    kwargs = {} if lanes else {"classify": lambda topic, payload: (DIAGNOSTICS, None)}
+    scheduler = OutboundScheduler(LoopbackTransport(broker), rate=RATE, capacity=capacity, **kwargs)
+    scheduler.connect(None)
+
+    stop = threading.Event()
+    bulk = bulk_messages()
+
+    def produce():
+        # Paced so the offered load is OVERLOAD times the link rate
+        budget = time.perf_counter()
+        index = 0
+        while not stop.is_set():
+            topic, payload = bulk[index % len(bulk)]
+            index += 1
+            scheduler.publish(topic, payload)
+            budget += (len(topic) + len(payload)) / (RATE * OVERLOAD)
+            delay = budget - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    # Let the queues fill up before probing
+    time.sleep(1.0)
+    probe = 0
+    deadline = time.perf_counter() + DURATION
+    while time.perf_counter() < deadline:
+        probe += 1
+        sent_at[probe] = time.perf_counter()
+        scheduler.publish("rpi/to/esp2", json.dumps({"type": "GAME_OVER", "command": "GAME_OVER", "probe": probe}))
+        time.sleep(PROBE_INTERVAL)
+    stop.set()
+    producer.join()
+    # Wait for the probes still queued, then stop
+    scheduler.flush(timeout=QUEUE_BOUND * 2 * 5000 / RATE)
+    scheduler.stop()
+    listener.loop_stop()
+
+    latencies.sort()
+    sent = sum(scheduler.stats["sent"])
+    dropped = sum(scheduler.stats["dropped"])
+    print(f"{label}: GAME_OVER latency over {len(latencies)} of {probe} probes "
+          f"({sent} messages sent, {dropped} dropped at the queue bound)")
+    if latencies:
+        print(f"  mean: {statistics.mean(latencies) * 1e3:8.1f} ms")
+        print(f"  p50:  {latencies[len(latencies) // 2] * 1e3:8.1f} ms")
+        print(f"  p99:  {latencies[int(len(latencies) * 0.99)] * 1e3:8.1f} ms")
+        print(f"  max:  {latencies[-1] * 1e3:8.1f} ms")
+    return latencies, probe
+
+
+def run_benchmark():
+    print(f"Link {RATE} B/s, bulk offered at {OVERLOAD}x, queue bound {QUEUE_BOUND}, {DURATION}s per run")
+    return {"fifo": run("single FIFO lane", lanes=False), "lanes": run("priority lanes", lanes=True)}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        DURATION = float(sys.argv[1])
+    run_benchmark()
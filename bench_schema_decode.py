@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark: compiled schema decoders vs the old ad-hoc parsing path in
+on_message (decode, json.loads, isinstance, data.get(...) defaults and a
+broad except that formats a traceback).
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import traceback
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from schemas import SchemaRegistry
+
+MESSAGES = 200000
+INVALID_RATIO = 0.1
+
+VALID = [
+    {"type": "HEARTBEAT", "device": "ESP32_Maze", "timestamp": 123456, "game_active": True,
+     "game_won": False, "game_paused": False, "maze_id": "maze_2", "config_received": True},
+    {"type": "HEARTBEAT", "device": "ESP32_Display", "timestamp": 123456, "active": True, "paused": False},
+    {"type": "WALL_HIT", "message": "Player hit wall and returned to start", "device": "ESP32_Maze",
+     "maze_id": "maze_2", "position_x": 3, "position_y": 1, "timestamp": 123456},
+    {"type": "BUTTON_GAME_LOST", "message": "Player lost the button timing game!", "button_id": "button_1",
+     "press_duration": 1500, "target_time": 2000, "buffer": 500, "difference": 500,
+     "timestamp": 123456, "device": "ESP32_Button"},
+    {"type": "WRONG_CUT_ALERT", "wrong_wire_cut": "BLUE", "expected_wire": "RED",
+     "current_step": 1, "total_steps": 4, "timestamp": 123456},
+    {"type": "X_ADDED", "message": "X mark added, total: 1/3", "timestamp": 123456,
+     "device": "ESP32_Display", "x_count": 1, "max_x_count": 3},
+]
+
+INVALID = [
+    b"garbage",
+    b"1",
+    b'{"type": "WALL_HIT", "position_x": "3"}',
+    b'{"type": "BUTTON_GAME_LOST", "difference": {"nested": true}}',
+]
+
+# Fields the old handlers read with .get() and formatted into messages
+LEGACY_FIELDS = {
+    "WALL_HIT": [],
+    "BUTTON_GAME_LOST": [("press_duration", 0), ("target_time", 0), ("difference", 0)],
+    "WRONG_CUT_ALERT": [("wrong_wire_cut", "Unknown"), ("expected_wire", "Unknown"),
+                        ("current_step", "?"), ("total_steps", "?")],
+    "X_ADDED": [("x_count", 0), ("max_x_count", 3)],
+}
+
+
+def legacy_decode(payload):
+    """The pre-registry parsing path from on_message"""
+    message_payload = payload.decode()
+    try:
+        data = json.loads(message_payload)
+        if not isinstance(data, dict):
+            return None
+        msg_type = data.get("type", "")
+        for name, default in LEGACY_FIELDS.get(msg_type, []):
+            # The old handlers formatted these into f-strings, which is where
+            # wrong types blew up (e.g. a dict difference in ms arithmetic)
+            value = data.get(name, default)
+            if isinstance(default, int):
+                value + 0
+        return data
+    except json.JSONDecodeError:
+        return None
+    except Exception:
+        traceback.format_exc()
+        return None
+
+
+def build_workload(count, seed=42):
+    rng = random.Random(seed)
+    valid = [json.dumps(message).encode() for message in VALID]
+    return [rng.choice(INVALID) if rng.random() < INVALID_RATIO else rng.choice(valid) for _ in range(count)]
+
+
+def time_path(name, decode, workload):
+    start = time.perf_counter()
+    for payload in workload:
+        decode(payload)
+    elapsed = time.perf_counter() - start
+    print(f"  {name:<10} {elapsed:6.3f}s  {len(workload) / elapsed:10.0f} msg/s  {elapsed / len(workload) * 1e6:6.2f} us/msg")
+    return elapsed
+
+
+def run_benchmark(count=MESSAGES):
+    rng = random.Random(7)
+    workloads = [
+        (f"mixed ({INVALID_RATIO:.0%} invalid)", build_workload(count)),
+        ("malformed only", [rng.choice(INVALID) for _ in range(count // 4)]),
+    ]
+    for title, workload in workloads:
+        registry = SchemaRegistry()
+        print(f"Decoding {len(workload)} messages, {title}")
+        legacy = time_path("legacy", legacy_decode, workload)
+        compiled = time_path("registry", registry.decode, workload)
+        print(f"  speedup: {legacy / compiled:.2f}x, dropped: {registry.dropped}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else MESSAGES)
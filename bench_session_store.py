@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark: session store write throughput and leaderboard query latency
+after hundreds of thousands of recorded sessions.
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from session_store import SessionStore
+
+SESSIONS = 300000
+EVENTS_PER_SESSION = 3
+QUERIES = 200
+DAY = 86400
+
+MAZES = ["maze_1", "maze_2", "maze_3"]
+BUTTONS = ["button_1", "button_2", "button_3"]
+EVENT_TYPES = ["WALL_HIT", "X_ADDED", "WRONG_CUT_ALERT", "PUZZLE_COMPLETED", "MAZE_COMPLETED"]
+
+
+def populate(store, count, seed=42):
+    """Record `count` sessions spread over a year, return seconds on the caller thread"""
+    rng = random.Random(seed)
+    year_start = time.time() - 365 * DAY
+    caller = 0.0
+    for _ in range(count):
+        started_at = year_start + rng.random() * 365 * DAY
+        elapsed = rng.uniform(60, 360)
+        start = time.perf_counter()
+        session = store.begin_session(started_at, maze_id=rng.choice(MAZES),
+                                      button_id=rng.choice(BUTTONS), duration=360)
+        for _ in range(EVENTS_PER_SESSION):
+            store.record_event(session, rng.choice(EVENT_TYPES), started_at + rng.random() * elapsed,
+                               module="maze", x_count=rng.randint(0, 2))
+        store.end_session(session, "VICTORY" if rng.random() < 0.6 else "GAME_OVER",
+                          started_at + elapsed, time_remaining=int(360 - elapsed), x_count=rng.randint(0, 2))
+        caller += time.perf_counter() - start
+    return caller
+
+
+def time_query(name, query):
+    samples = []
+    for _ in range(QUERIES):
+        start = time.perf_counter()
+        query()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    p50 = samples[len(samples) // 2] * 1000
+    p99 = samples[int(len(samples) * 0.99)] * 1000
+    print(f"  {name:<28} p50 {p50:7.3f} ms  p99 {p99:7.3f} ms")
+
+
+def run_benchmark(count=SESSIONS):
+    path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    store = SessionStore(path)
+    print(f"Recording {count} sessions with {EVENTS_PER_SESSION} events each")
+    start = time.perf_counter()
+    caller = populate(store, count)
+    store.flush()
+    elapsed = time.perf_counter() - start
+    rows = count * (EVENTS_PER_SESSION + 2)
+    print(f"  caller thread {caller / rows * 1e6:6.2f} us/row, "
+          f"writer {rows / elapsed:10.0f} rows/s in {store.batches} batches")
+
+    now = time.time()
+    print(f"Leaderboard queries over {store.session_count()} sessions")
+    time_query("top 10 overall", lambda: store.leaderboard())
+    time_query("top 10 per combination", lambda: store.leaderboard(maze_id="maze_2", button_id="button_1"))
+    time_query("top 10 last 30 days", lambda: store.leaderboard(since=now - 30 * DAY))
+    time_query("top 10 combination, 1 day", lambda: store.leaderboard(
+        maze_id="maze_2", button_id="button_1", since=now - 2 * DAY, until=now - DAY))
+    time_query("events of one session", lambda: store.session_events(count // 2))
+    store.close()
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else SESSIONS)
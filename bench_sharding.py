@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sharded orchestrator throughput with 1..N worker processes under
+simulated module load from many rooms (heartbeats, status reports and
+penalty events, all with distinct firmware timestamps).
+"""
+
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from sharding import ShardedOrchestrator
+
+ROOMS = 32
+MESSAGES = 100000
+
+
+def build_workload(count, rooms, seed=42):
+    rng = random.Random(seed)
+    templates = [
+        ("esp3/to/rpi", {"type": "HEARTBEAT", "device": "ESP32_Maze", "game_active": True,
+                         "game_won": False, "game_paused": False, "maze_id": "maze_2"}),
+        ("esp2/to/rpi", {"type": "HEARTBEAT", "device": "ESP32_Display", "active": True, "paused": False}),
+        ("esp/to/rpi", {"type": "GAME_STATUS", "device": "ESP32_Wire", "game_active": True,
+                        "game_completed": False, "game_paused": False, "current_step": 1, "total_steps": 4}),
+        ("esp3/to/rpi", {"type": "WALL_HIT", "device": "ESP32_Maze", "maze_id": "maze_2",
+                         "position_x": 3, "position_y": 1}),
+        ("esp4/to/rpi", {"type": "BUTTON_GAME_LOST", "device": "ESP32_Button", "button_id": "button_1",
+                         "press_duration": 1500, "target_time": 2000, "buffer": 500, "difference": 500}),
+    ]
+    workload = []
+    for timestamp in range(count):
+        topic, message = rng.choice(templates)
+        payload = json.dumps(dict(message, timestamp=timestamp)).encode()
+        workload.append((f"rooms/room-{rng.randrange(rooms)}/{topic}", payload))
+    return workload
+
+
+def run_shards(workers, workload, rooms, config_file):
+    front = ShardedOrchestrator(workers=workers, config_file=config_file, transport_kind="loopback",
+                                log_file=os.devnull, heartbeats=False, batch_size=128).start()
+    try:
+        # Open every room first, so module loading isn't part of the timing
+        for room in range(rooms):
+            front.dispatch(f"rooms/room-{room}/esp2/to/rpi", b'{"type": "HEARTBEAT", "timestamp": 0}')
+        front.wait_idle()
+        done = front.counters.total("messages")
+
+        start = time.perf_counter()
+        for topic, payload in workload:
+            front.dispatch(topic, payload)
+        front.wait_idle(timeout=300)
+        elapsed = time.perf_counter() - start
+        totals = front.counters.totals()
+        assert totals["messages"] - done == len(workload)
+        return elapsed, totals
+    finally:
+        front.stop()
+
+
+def run_benchmark(count=MESSAGES, rooms=ROOMS):
+    config_file = os.path.join(tempfile.mkdtemp(), "config.json")
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi", "config.json"), config_file)
+    workload = build_workload(count, rooms)
+    cores = os.cpu_count() or 1
+    # Counts above the core count show the cost of oversubscription
+    counts = sorted({1, 2, 4, cores})
+
+    print(f"Sharded orchestrator, {count} messages from {rooms} rooms, {cores} cores")
+    baseline = None
+    for workers in counts:
+        elapsed, totals = run_shards(workers, workload, rooms, config_file)
+        rate = count / elapsed
+        baseline = baseline or rate
+        print(f"  {workers:>2} workers  {elapsed:6.2f}s  {rate:9.0f} msg/s  {rate / baseline:4.2f}x"
+              f"  (suppressed {totals['suppressed']})")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else MESSAGES)
@@ -0,0 +1,111 @@
+"""
+Inbound admission stage for penalty events.
+
+Every WALL_HIT, WRONG_CUT_ALERT and BUTTON_GAME_LOST costs the players an
+X mark, so a noisy joystick or a flapping wire contact could burn all of
+them in under a second. Before a penalty event reaches the game logic it
+has to pass two cheap checks:
+
+- a bounded dedup window keyed on (device, type, timestamp), which drops
+  duplicated MQTT deliveries of the same firmware event
+- optionally, a token bucket per module, which absorbs bursts
+
+Rate limiting is off unless a `rate` is configured: a player who really
+hits three walls in a second has earned three X marks, and a limit tight
+enough to stop a flapping contact also drops those. Both checks are O(1)
+per message. Suppressed events are counted, not logged one
+by one.
+"""
+
+import collections
+
+PENALTY_EVENTS = ("WALL_HIT", "WRONG_CUT_ALERT", "BUTTON_GAME_LOST")
+
+
+class TokenBucket:
+    """Allows `rate` events per second with bursts of up to `burst`"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = None
+
+    def allow(self, now):
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class Admission:
+    """Dedup window plus optional per-module token buckets for selected message types"""
+
+    def __init__(self, enabled=True, rate=None, burst=1, dedup_window=256, types=PENALTY_EVENTS, modules=None):
+        self.counters = {
+            "admitted": 0,
+            "duplicate": 0,
+            "rate_limited": 0,
+        }
+        self.buckets = {}
+        self._seen = set()
+        self._order = collections.deque()
+        self.configure(enabled, rate, burst, dedup_window, types, modules)
+
+    def configure(self, enabled=True, rate=None, burst=1, dedup_window=256, types=PENALTY_EVENTS, modules=None):
+        """Apply settings, e.g. from the "admission" config section"""
+        self.enabled = enabled
+        self.rate = float(rate) if rate is not None else None
+        self.burst = int(burst)
+        self.dedup_window = int(dedup_window)
+        self.types = frozenset(types)
+        self.modules = modules or {}
+        # Buckets are rebuilt lazily with the new limits
+        self.buckets = {}
+        while len(self._order) > self.dedup_window:
+            self._seen.discard(self._order.popleft())
+
+    def reset(self):
+        """Refill every bucket and forget seen events, e.g. for a new round"""
+        self.buckets = {}
+        self._seen.clear()
+        self._order.clear()
+
+    @property
+    def suppressed(self):
+        return self.counters["duplicate"] + self.counters["rate_limited"]
+
+    def _bucket(self, module):
+        limits = self.modules.get(module, {})
+        rate = limits.get("rate", self.rate)
+        bucket = None if rate is None else TokenBucket(float(rate), int(limits.get("burst", self.burst)))
+        self.buckets[module] = bucket
+        return bucket
+
+    def admit(self, module, record, now):
+        """True if the decoded record may reach the game logic"""
+        if not self.enabled or record.type not in self.types:
+            return True
+
+        # Events without a firmware timestamp cannot be told apart, skip dedup
+        if record.timestamp:
+            key = (record.device, record.type, record.timestamp)
+            if key in self._seen:
+                self.counters["duplicate"] += 1
+                return False
+            self._seen.add(key)
+            self._order.append(key)
+            if len(self._order) > self.dedup_window:
+                self._seen.discard(self._order.popleft())
+
+        bucket = self.buckets[module] if module in self.buckets else self._bucket(module)
+        if bucket is not None and not bucket.allow(now):
+            self.counters["rate_limited"] += 1
+            return False
+        self.counters["admitted"] += 1
+        return True
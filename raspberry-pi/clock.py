@@ -0,0 +1,144 @@
+"""
+Clocks for the orchestrator.
+
+Everything in mqtt.py that reads the time, sleeps or runs periodically goes
+through a clock object, so the same code runs on wall-clock time in
+production and on simulated time in tests:
+
+- SystemClock: time.time(), time.sleep() and a daemon thread per periodic
+  job, ended by cancelling the job. A callback that raises is logged and
+  the job keeps running
+- VirtualClock: time only moves when the test says so. sleep() advances it
+  instantly and scheduled callbacks run in time order on the calling
+  thread, so hours of game time take milliseconds and every run is the same.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from ringlog import RingLog
+
+
+class SystemClock:
+    """Wall-clock time"""
+
+    def __init__(self, log=None):
+        self.log = log or RingLog()
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def every(self, interval, callback, *args, name=None):
+        """Call callback(*args) every `interval` seconds on a daemon thread"""
+        return PeriodicThread(interval, callback, args, name, self.log).start()
+
+
+class PeriodicThread:
+    """A SystemClock periodic job, cancel() ends its thread"""
+
+    def __init__(self, interval, callback, args, name=None, log=None):
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.log = log or RingLog()
+        self._cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self._cancelled.wait(self.interval):
+            try:
+                self.callback(*self.args)
+            except Exception:
+                # One failed run must not end the job, the heartbeat check lives here
+                self.log.error("mqtt", "Periodic job %s failed", self.thread.name, exc_info=True)
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # Wait out a callback in progress, so a replacement job never
+        # overlaps the one it replaces
+        if self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(self.interval)
+
+
+class TimerHandle:
+    __slots__ = ("when", "callback", "args", "interval", "cancelled")
+
+    def __init__(self, when, callback, args, interval=None):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock:
+    """Simulated time with a scheduler, advanced explicitly"""
+
+    def __init__(self, start=1700000000.0):
+        self.now = start
+        self.callbacks_run = 0
+        self._queue = []
+        self._sequence = itertools.count()
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        # Sleeping lets everything that was due in the meantime happen
+        self.advance(seconds)
+
+    def call_at(self, when, callback, *args):
+        handle = TimerHandle(when, callback, args)
+        heapq.heappush(self._queue, (when, next(self._sequence), handle))
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        return self.call_at(self.now + delay, callback, *args)
+
+    def every(self, interval, callback, *args, name=None):
+        """Call callback(*args) every `interval` simulated seconds"""
+        handle = TimerHandle(self.now + interval, callback, args, interval)
+        heapq.heappush(self._queue, (handle.when, next(self._sequence), handle))
+        return handle
+
+    def advance(self, seconds):
+        """Move time forward, running every callback that falls due in order"""
+        self.run_until(self.now + seconds)
+
+    def run_until(self, deadline):
+        while self._queue and self._queue[0][0] <= deadline:
+            when, _, handle = heapq.heappop(self._queue)
+            if handle.cancelled:
+                continue
+            self.now = max(self.now, when)
+            if handle.interval is not None:
+                handle.when = when + handle.interval
+                heapq.heappush(self._queue, (handle.when, next(self._sequence), handle))
+            self.callbacks_run += 1
+            handle.callback(*handle.args)
+        self.now = max(self.now, deadline)
+
+    def pending(self):
+        return sum(1 for _, _, handle in self._queue if not handle.cancelled)
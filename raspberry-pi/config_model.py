@@ -0,0 +1,201 @@
+"""
+Compiled, typed view of config.json.
+
+config.json stays the file format and is still what `config/request` sends
+back, but the game code reads this model instead of walking nested dicts:
+
+- one slotted dataclass per section (timer, game) and per puzzle entry
+  (button, maze, wire), with the defaults defined once, here
+- maze layouts as a flat `bytes` grid, one byte per cell, instead of lists
+  of lists of ints
+- the enabled entry of each puzzle type resolved at compile time, so
+  finding it is an attribute read
+
+The model is compiled once per config version (mqtt.get_config() reloads
+on mtime change) and never mutated afterwards.
+"""
+
+import dataclasses
+from dataclasses import dataclass, field
+
+
+@dataclass(slots=True, frozen=True)
+class TimerSettings:
+    game_duration: int = 360
+    warning_time: int = 60
+    countdown_start: int = 10
+    auto_reset: bool = True
+    difficulty_level: str = "medium"
+
+
+@dataclass(slots=True, frozen=True)
+class GameSettings:
+    simultaneous_start: bool = True
+    require_all_connected: bool = True
+    emergency_stop_on_disconnect: bool = True
+
+
+@dataclass(slots=True, frozen=True)
+class ButtonConfig:
+    button_id: str = "button_1"
+    target_time: int = 2000
+    buffer: int = 500
+    enabled: bool = False
+
+    def message(self):
+        """Fields of the UPDATE_BUTTON_CONFIG command"""
+        return {"button_id": self.button_id, "target_time": self.target_time,
+                "buffer": self.buffer, "enabled": True}
+
+
+# Optional UPDATE_MAZE_CONFIG fields, only sent when the config sets them
+# so the maze firmware keeps its own defaults for the rest
+MAZE_MESSAGE_FIELDS = ("name", "start_x", "start_y", "end_x", "end_y",
+                       "checkpoint_1_x", "checkpoint_1_y", "checkpoint_2_x", "checkpoint_2_y")
+
+
+@dataclass(slots=True, frozen=True)
+class MazeConfig:
+    maze_id: str
+    name: str = None
+    enabled: bool = False
+    start_x: int = None
+    start_y: int = None
+    end_x: int = None
+    end_y: int = None
+    checkpoint_1_x: int = None
+    checkpoint_1_y: int = None
+    checkpoint_2_x: int = None
+    checkpoint_2_y: int = None
+    width: int = 0
+    height: int = 0
+    grid: bytes = b""
+
+    def cell(self, x, y):
+        return self.grid[y * self.width + x]
+
+    def layout(self):
+        """The grid as rows of ints, the shape the maze firmware expects"""
+        width = self.width
+        return [list(self.grid[row * width:(row + 1) * width]) for row in range(self.height)]
+
+    def message(self):
+        """Fields of the UPDATE_MAZE_CONFIG command, without the ones the config leaves out"""
+        message = {"enabled": True}
+        for name in MAZE_MESSAGE_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                message[name] = value
+        if self.grid:
+            message["maze_layout"] = self.layout()
+        message["maze_id"] = self.maze_id
+        return message
+
+
+@dataclass(slots=True, frozen=True)
+class WireStep:
+    instruction: str = ""
+    correct_wire: int = 0
+    success_message: str = "Correct!"
+
+
+@dataclass(slots=True, frozen=True)
+class WireConfig:
+    puzzle_id: str
+    enabled: bool = False
+    steps: tuple = ()
+
+    @property
+    def total_steps(self):
+        return len(self.steps)
+
+
+@dataclass(slots=True, frozen=True)
+class ConfigModel:
+    timer: TimerSettings = field(default_factory=TimerSettings)
+    game: GameSettings = field(default_factory=GameSettings)
+    buttons: dict = field(default_factory=dict)
+    mazes: dict = field(default_factory=dict)
+    wires: dict = field(default_factory=dict)
+    button: ButtonConfig = field(default_factory=lambda: ButtonConfig(enabled=True))
+    maze: MazeConfig = None
+    wire: WireConfig = None
+    warnings: tuple = ()
+
+
+def _settings(cls, section):
+    """Build a settings dataclass from a config section, ignoring unknown keys"""
+    names = {f.name for f in dataclasses.fields(cls)}
+    return cls(**{key: value for key, value in (section or {}).items() if key in names})
+
+
+def compile_grid(layout):
+    """Rows of cell values -> (width, height, bytes)"""
+    height = len(layout)
+    width = len(layout[0]) if height else 0
+    if any(len(row) != width for row in layout):
+        raise ValueError("maze_layout rows differ in length")
+    return width, height, bytes(cell for row in layout for cell in row)
+
+
+def compile_maze(maze_id, data):
+    width, height, grid = compile_grid(data.get("maze_layout", []))
+    fields = {key: value for key, value in data.items()
+              if key not in ("maze_layout", "width", "height", "grid")}
+    return _settings(MazeConfig, dict(fields, maze_id=maze_id, width=width, height=height, grid=grid))
+
+
+def compile_wire(puzzle_id, data):
+    steps = tuple(_settings(WireStep, step) for step in data.get("puzzle_sequence", []))
+    return WireConfig(puzzle_id, bool(data.get("enabled", False)), steps)
+
+
+def _entries(config, section, compile_entry, warnings):
+    entries = {}
+    for entry_id, data in (config.get(section) or {}).items():
+        try:
+            entries[entry_id] = compile_entry(entry_id, data)
+        except (AttributeError, TypeError, ValueError) as e:
+            warnings.append(f"Skipping invalid {section} entry {entry_id}: {e}")
+    return entries
+
+
+def _first_enabled(entries):
+    return next((entry for entry in entries.values() if entry.enabled), None)
+
+
+def compile_config(config):
+    """Compile a raw config dict into a ConfigModel"""
+    warnings = []
+    buttons = _entries(config, "button_ID", lambda button_id, data: _settings(
+        ButtonConfig, dict(data, button_id=button_id)), warnings)
+    mazes = _entries(config, "maze_ID", compile_maze, warnings)
+    wires = _entries(config, "wire_ID", compile_wire, warnings)
+
+    button = _first_enabled(buttons)
+    if button is None:
+        warnings.append("No enabled button found, using defaults")
+        button = ButtonConfig(enabled=True)
+
+    maze = _first_enabled(mazes)
+    if maze is None and mazes:
+        # Enable the first maze by default
+        maze = next(iter(mazes.values()))
+        warnings.append(f"No enabled maze found, using {maze.maze_id}")
+
+    try:
+        timer = _settings(TimerSettings, config.get("timer_settings"))
+        game = _settings(GameSettings, config.get("game_settings"))
+    except (AttributeError, TypeError) as e:
+        warnings.append(f"Invalid timer or game settings, using defaults: {e}")
+        timer, game = TimerSettings(), GameSettings()
+
+    return ConfigModel(timer, game, buttons, mazes, wires, button, maze, _first_enabled(wires), tuple(warnings))
+
+
+def default_config():
+    """The config.json written when none exists"""
+    return {
+        "timer_settings": dataclasses.asdict(TimerSettings()),
+        "game_settings": dataclasses.asdict(GameSettings()),
+    }
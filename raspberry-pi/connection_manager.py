@@ -0,0 +1,419 @@
+"""
+Broker failover and offline publish buffering for the orchestrator.
+
+ConnectionManager is a Transport that mqtt.py talks to like any other, but
+underneath it keeps one real connection to the first healthy broker of an
+ordered list:
+
+- every attempt uses a fresh transport from `factory` with a short connect
+  timeout, and the brokers are tried in order
+- while connected, a probe published to our own health topic (unique per
+  manager and never part of a shared subscription) has to come back
+  within `health_timeout`. A broker that stops answering gets dropped
+  quickly, long before the TCP keepalive would notice, and the next broker
+  is tried. Probe echoes are handled on the transport's network thread,
+  while every other message goes to on_message on a dispatch thread, so
+  a slow message handler can't make a healthy broker look dead
+- once every broker has failed, the next pass waits for a jittered
+  exponential backoff
+
+Publishes made while no broker is connected go to an OfflineBuffer instead
+of being lost. When it is full the lowest priority messages go first, and
+stale commands are collapsed as they arrive. Once a broker accepts the
+connection the buffer is drained most important first, before any new
+publish goes out. Messages for the same topic keep their order, so a
+START_GAME still follows the config push queued before it.
+"""
+
+import collections
+import itertools
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+
+from ringlog import RingLog
+from transport import MQTT_ERR_NO_CONN, MQTT_ERR_QUEUED, MQTT_ERR_SUCCESS, PublishResult, Transport
+
+# Commands kept longest when the buffer overflows, lower is more important
+COMMAND_PRIORITIES = {
+    "GAME_OVER": 0,
+    "VICTORY": 0,
+    "STOP_GAME": 0,
+    "ACTIVATE": 1,
+    "START_GAME": 1,
+    "SYNCHRONIZED_START": 1,
+    "START_TIMER": 1,
+    "RESET_GAME": 1,
+    "RESET_X": 1,
+    "PAUSE_TIMER": 1,
+    "RESUME_TIMER": 1,
+    "X": 1,
+    "UPDATE_BUTTON_CONFIG": 2,
+    "UPDATE_MAZE_CONFIG": 2,
+    "UPDATE_SETTINGS": 2,
+}
+DEFAULT_PRIORITY = 3
+
+# Commands that undo each other: a pending one is dropped together with a
+# later opposite one for the same topic, and a repeat replaces it
+TOGGLES = {
+    "PAUSE_TIMER": "RESUME_TIMER",
+    "RESUME_TIMER": "PAUSE_TIMER",
+}
+
+# Commands where only the latest one per topic matters
+LATEST_WINS = {"UPDATE_BUTTON_CONFIG", "UPDATE_MAZE_CONFIG", "UPDATE_SETTINGS"}
+
+BUFFER_SIZE = 256
+# A hung broker is replaced within HEALTH_TIMEOUT + HEALTH_INTERVAL +
+# CONNECT_TIMEOUT (1.4s), well inside the orchestrator's 2s heartbeat
+# interval. Echoes don't wait for the message handler, so the timeout only
+# has to cover the broker and the network.
+CONNECT_TIMEOUT = 0.4   # seconds to wait for CONNACK from one broker
+HEALTH_INTERVAL = 0.2   # seconds between health probes
+HEALTH_TIMEOUT = 0.8    # seconds without a probe echo before failing over
+BACKOFF_BASE = 0.1      # seconds before the second pass over the brokers
+BACKOFF_MAX = 5.0
+
+
+def command_type(payload):
+    """The "type" of a JSON command payload, or None"""
+    if isinstance(payload, str):
+        payload = payload.encode()
+    if not payload or payload[:1] != b"{":
+        return None
+    try:
+        return json.loads(payload).get("type")
+    except (ValueError, AttributeError):
+        return None
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, maximum=BACKOFF_MAX, rng=random):
+    """Exponential backoff with jitter: between half and all of base * 2**attempt"""
+    delay = min(maximum, base * 2 ** attempt)
+    return delay / 2 + rng.uniform(0, delay / 2)
+
+
+class BufferedPublish:
+    """One publish waiting for a broker"""
+
+    __slots__ = ("topic", "payload", "qos", "retain", "properties", "command", "priority")
+
+    def __init__(self, topic, payload, qos, retain, properties, command, priority):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.properties = properties
+        self.command = command
+        self.priority = priority
+
+
+class OfflineBuffer:
+    """Bounded, priority-aware buffer of publishes made while disconnected"""
+
+    def __init__(self, capacity=BUFFER_SIZE):
+        self.capacity = capacity
+        self._entries = collections.OrderedDict()
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.stats = {"buffered": 0, "collapsed": 0, "dropped": 0, "drained": 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, topic, payload=None, qos=0, retain=False, properties=None):
+        command = command_type(payload)
+        entry = BufferedPublish(topic, payload, qos, retain, properties, command,
+                                COMMAND_PRIORITIES.get(command, DEFAULT_PRIORITY))
+        with self._lock:
+            self.stats["buffered"] += 1
+            if self._collapse(entry):
+                return
+            self._entries[next(self._seq)] = entry
+            if len(self._entries) > self.capacity:
+                self._evict()
+
+    def _collapse(self, entry):
+        """Fold entry into what is pending, True if nothing needs to be added"""
+        if entry.command in TOGGLES:
+            related = (entry.command, TOGGLES[entry.command])
+        elif entry.command in LATEST_WINS:
+            related = (entry.command,)
+        else:
+            return False
+        for seq, pending in reversed(self._entries.items()):
+            if pending.topic == entry.topic and pending.command in related:
+                del self._entries[seq]
+                self.stats["collapsed"] += 1
+                if pending.command != entry.command:
+                    # PAUSE then RESUME (or the reverse) leaves things as they were
+                    self.stats["collapsed"] += 1
+                    return True
+                return False
+        return False
+
+    def _evict(self):
+        """Drop the oldest of the least important entries"""
+        victim = max(self._entries, key=lambda seq: (self._entries[seq].priority, -seq))
+        del self._entries[victim]
+        self.stats["dropped"] += 1
+
+    def _next_entry(self):
+        """(seq, entry) to send next: the most important one, or what is queued before it on its topic"""
+        entries = self._entries
+        best = min(entries, key=lambda seq: (entries[seq].priority, seq))
+        topic = entries[best].topic
+        return next((seq, entry) for seq, entry in entries.items() if entry.topic == topic)
+
+    def drain(self, publish):
+        """Hand entries to publish() most important first, stopping at the first failure"""
+        while True:
+            with self._lock:
+                if not self._entries:
+                    return
+                seq, entry = self._next_entry()
+            result = publish(entry.topic, entry.payload, entry.qos, entry.retain, entry.properties)
+            if getattr(result, "rc", MQTT_ERR_SUCCESS) != MQTT_ERR_SUCCESS:
+                return
+            with self._lock:
+                if self._entries.pop(seq, None) is not None:
+                    self.stats["drained"] += 1
+
+
+class ConnectionManager(Transport):
+    """Transport that fails over between brokers and buffers while offline"""
+
+    def __init__(self, factory, brokers, userdata=None, log=None, buffer_size=BUFFER_SIZE,
+                 connect_timeout=CONNECT_TIMEOUT, health_interval=HEALTH_INTERVAL,
+                 health_timeout=HEALTH_TIMEOUT, backoff_base=BACKOFF_BASE, backoff_max=BACKOFF_MAX,
+                 health_topic=None):
+        super().__init__(userdata)
+        self.factory = factory
+        self.brokers = list(brokers)
+        self.log = log or RingLog()
+        self.buffer = OfflineBuffer(buffer_size)
+        self.connect_timeout = connect_timeout
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.health_topic = health_topic or f"rpi/health/{uuid.uuid4().hex}"
+        self.keepalive = 60
+        self.broker = None  # (host, port) of the current connection
+        self.failovers = 0
+        self.last_failover = None  # seconds from losing a broker (or its last echo) to the next CONNACK
+        self._active = None
+        self._lock = threading.RLock()
+        self._lost = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._inbox = queue.SimpleQueue()
+        self._last_echo = 0.0
+        self._lost_at = None
+
+    # Transport interface
+    def connect(self, host=None, port=None, keepalive=60):
+        """Only records settings, the connection is made by the loop"""
+        self.keepalive = keepalive
+        if host is not None and not self.brokers:
+            self.brokers = [(host, port)]
+        self._stopping.clear()
+        return MQTT_ERR_SUCCESS
+
+    def disconnect(self):
+        self._stopping.set()
+        self._lost.set()
+        with self._lock:
+            transport, self._active = self._active, None
+        if transport is not None:
+            transport.disconnect()
+        return MQTT_ERR_SUCCESS
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        with self._lock:
+            if self._active is not None:
+                result = self._active.publish(topic, payload, qos, retain, properties)
+                if getattr(result, "rc", MQTT_ERR_SUCCESS) != MQTT_ERR_NO_CONN:
+                    return result
+            self.buffer.add(topic, payload, qos, retain, properties)
+        return PublishResult(MQTT_ERR_QUEUED)
+
+    def subscribe(self, topic, qos=0):
+        with self._lock:
+            if self._active is None:
+                return MQTT_ERR_NO_CONN, 0
+            return self._active.subscribe(topic, qos)
+
+    def is_connected(self):
+        with self._lock:
+            return self._active is not None
+
+    def loop_forever(self):
+        self._supervise()
+
+    def loop_start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._supervise, name="connection-manager", daemon=True)
+            self._thread.start()
+
+    def loop_stop(self):
+        self.disconnect()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return dict(self.buffer.stats, broker=self.broker, failovers=self.failovers,
+                    last_failover=self.last_failover, buffered_now=len(self.buffer))
+
+    # Supervision
+    def _supervise(self):
+        threading.Thread(target=self._dispatch_loop, name="mqtt-dispatch", daemon=True).start()
+        try:
+            self._reconnect_loop()
+        finally:
+            self._inbox.put(None)
+
+    def _reconnect_loop(self):
+        attempt = 0
+        while not self._stopping.is_set():
+            transport = self._connect_any()
+            if transport is None:
+                if self._stopping.is_set():
+                    break
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+                attempt += 1
+                self.log.warning("mqtt", "No broker reachable, retrying in %.2fs", delay)
+                self._stopping.wait(delay)
+                continue
+            attempt = 0
+            self._watch(transport)
+            self._drop(transport)
+
+    def _connect_any(self):
+        for host, port in self.brokers:
+            if self._stopping.is_set():
+                return None
+            transport = self._attempt(host, port)
+            if transport is not None:
+                return transport
+        return None
+
+    def _attempt(self, host, port):
+        """Connect to one broker, the live transport or None"""
+        transport = self.factory()
+        if hasattr(transport, "connect_timeout"):
+            transport.connect_timeout = self.connect_timeout
+        acked = threading.Event()
+        outcome = {}
+
+        def on_connect(client, userdata, flags, rc):
+            outcome["flags"], outcome["rc"] = flags, rc
+            acked.set()
+
+        transport.on_connect = on_connect
+        transport.on_message = self._on_transport_message
+        transport.on_disconnect = lambda client, userdata, rc: self._on_transport_disconnect(transport, rc)
+        self._lost.clear()
+        try:
+            transport.connect(host, port, self.keepalive)
+            transport.loop_start()
+        except (OSError, ValueError) as e:
+            self.log.warning("mqtt", "Broker %s:%s unreachable: %s", host, port, e)
+            self._close_later(transport)
+            return None
+        if not acked.wait(self.connect_timeout) or outcome["rc"] != 0:
+            self.log.warning("mqtt", "Broker %s:%s did not accept the connection (rc %s)",
+                             host, port, outcome.get("rc", "timeout"))
+            self._close_later(transport)
+            return None
+        self._connected(transport, (host, port), outcome["flags"], outcome["rc"])
+        return transport
+
+    def _connected(self, transport, broker, flags, rc):
+        # Every echo has to come back to us, never to another member of a share group
+        transport.subscribe_private(self.health_topic)
+        self._last_echo = time.monotonic()
+        with self._lock:
+            self._active = transport
+            self.broker = broker
+            if self._lost_at is not None:
+                self.failovers += 1
+                self.last_failover = time.monotonic() - self._lost_at
+                self._lost_at = None
+                self.log.info("mqtt", "Failed over to %s:%s in %.0f ms", *broker, self.last_failover * 1000)
+            else:
+                self.log.info("mqtt", "Connected to broker %s:%s", *broker)
+            # Anything published from here on queues behind the backlog
+            if len(self.buffer):
+                self.log.info("mqtt", "Sending %d buffered publishes", len(self.buffer))
+                self.buffer.drain(transport.publish)
+        if self.on_connect:
+            self.on_connect(self, self.userdata, flags, rc)
+
+    def _on_transport_message(self, client, userdata, msg):
+        if msg.topic == self.health_topic:
+            self._last_echo = time.monotonic()
+        else:
+            self._inbox.put(msg)
+
+    def _dispatch_loop(self):
+        """Hand messages to on_message, off the transport's network thread"""
+        while True:
+            msg = self._inbox.get()
+            if msg is None:
+                return
+            if self.on_message:
+                try:
+                    self.on_message(self, self.userdata, msg)
+                except Exception:
+                    self.log.error("mqtt", "Message handler failed for %s", msg.topic, exc_info=True)
+
+    def _on_transport_disconnect(self, transport, rc):
+        if transport is self._active:
+            self._lost.set()
+
+    def _watch(self, transport):
+        """Probe the broker until it stops answering or we are told to stop"""
+        probe = 0
+        while not self._stopping.is_set():
+            if self._lost.wait(self.health_interval):
+                reason = "connection lost"
+                lost_at = time.monotonic()
+                break
+            if time.monotonic() - self._last_echo > self.health_timeout:
+                reason = "health check timed out"
+                # A hung broker was lost when it stopped answering
+                lost_at = self._last_echo
+                break
+            probe += 1
+            transport.publish(self.health_topic, str(probe))
+        else:
+            return
+        self._lost_at = lost_at
+        self.log.warning("mqtt", "Broker %s:%s failed: %s", *self.broker, reason)
+
+    def _drop(self, transport):
+        with self._lock:
+            if self._active is transport:
+                self._active = None
+        self._close_later(transport)
+        if self.on_disconnect and not self._stopping.is_set():
+            self.on_disconnect(self, self.userdata, MQTT_ERR_NO_CONN)
+
+    def _close_later(self, transport):
+        """Shut a dead transport down without holding up the failover"""
+        transport.on_connect = transport.on_message = transport.on_disconnect = None
+
+        def close():
+            try:
+                transport.disconnect()
+                transport.loop_stop()
+            except Exception:
+                pass
+
+        threading.Thread(target=close, daemon=True).start()
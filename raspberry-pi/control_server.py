@@ -0,0 +1,249 @@
+"""
+Operator control API for the orchestrator.
+
+A small asyncio HTTP server running on its own worker thread, so it never
+blocks MQTT message handling:
+
+    GET  /state          current rig state as JSON
+    POST /start          start all games
+    POST /stop           stop all games
+    POST /reset          reset all games
+    POST /timer          start the display timer, body {"duration": 300}
+    POST /x              add an X mark, body {"reason": "MANUAL"}
+    GET  /ws             WebSocket that pushes the state on every change
+
+If the server has a token, every request has to carry it, either as
+`Authorization: Bearer <token>`, an `X-Control-Token` header or a
+`?token=` query parameter (browsers can't set headers on WebSockets).
+Without a token the API is only meant to listen on 127.0.0.1.
+
+State pushes are coalesced: any number of changes within `push_interval`
+result in one snapshot per connected WebSocket, and nothing is built at all
+while no dashboard is connected.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import struct
+import threading
+import urllib.parse
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+def websocket_frame(payload, opcode=0x1):
+    """Build an unmasked server-to-client WebSocket frame"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_websocket_frame(reader):
+    """Read one client frame, returns (opcode, payload)"""
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+
+class ControlServer:
+    """HTTP/WebSocket control API bound to a snapshot function and actions"""
+
+    def __init__(self, snapshot, actions, host="127.0.0.1", port=8080, push_interval=0.1, token=None):
+        self.snapshot = snapshot
+        self.actions = actions
+        self.token = token
+        self.host = host
+        self.port = port
+        self.push_interval = push_interval
+        self.loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._clients = set()
+        self._push_pending = False
+
+    def start(self):
+        """Run the server on a dedicated event loop thread"""
+        self._thread = threading.Thread(target=self._run, name="control-server", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self._server = self.loop.run_until_complete(
+            asyncio.start_server(self._handle_connection, self.host, self.port))
+        # Port 0 picks a free port, report the real one
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self._server.close()
+            self.loop.run_until_complete(self._server.wait_closed())
+            self.loop.close()
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(5)
+
+    def notify(self):
+        """Called from any thread when rig state changed"""
+        if self._clients and not self._push_pending and self.loop is not None:
+            self._push_pending = True
+            self.loop.call_soon_threadsafe(self._schedule_push)
+
+    def _schedule_push(self):
+        self.loop.call_later(self.push_interval, lambda: asyncio.ensure_future(self._push_state()))
+
+    async def _push_state(self):
+        self._push_pending = False
+        if not self._clients:
+            return
+        frame = websocket_frame(json.dumps(self.snapshot()).encode())
+        for writer in list(self._clients):
+            try:
+                writer.write(frame)
+                await writer.drain()
+            except (ConnectionError, RuntimeError):
+                self._clients.discard(writer)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            body = b""
+            if int(headers.get("content-length", 0) or 0):
+                body = await reader.readexactly(int(headers["content-length"]))
+
+            if path.split("?", 1)[0] == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                if not self._authorized(path, headers):
+                    await self._send_json(writer, 401, {"status": "error", "message": "Missing or wrong token"})
+                    return
+                await self._serve_websocket(reader, writer, headers)
+                return
+            status, response = await self._dispatch(method, path, body, headers)
+            await self._send_json(writer, status, response)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            await self._send_json(writer, 400, {"status": "error", "message": "Bad request"})
+        except ConnectionError:
+            pass
+        finally:
+            if writer not in self._clients:
+                writer.close()
+
+    def _authorized(self, path, headers):
+        """True if no token is set or the request carries the right one"""
+        if not self.token:
+            return True
+        supplied = headers.get("x-control-token", "")
+        authorization = headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            supplied = authorization[7:].strip()
+        if not supplied and "?" in path:
+            supplied = urllib.parse.parse_qs(path.split("?", 1)[1]).get("token", [""])[0]
+        return hmac.compare_digest(supplied.encode(), self.token.encode())
+
+    async def _dispatch(self, method, path, body, headers=None):
+        if not self._authorized(path, headers or {}):
+            return 401, {"status": "error", "message": "Missing or wrong token"}
+        path = path.split("?", 1)[0].rstrip("/") or "/"
+        if path == "/state":
+            if method != "GET":
+                return 405, {"status": "error", "message": "Use GET"}
+            return 200, self.snapshot()
+
+        action = self.actions.get(path.lstrip("/"))
+        if action is None:
+            return 404, {"status": "error", "message": f"Unknown endpoint {path}"}
+        if method != "POST":
+            return 405, {"status": "error", "message": "Use POST"}
+
+        params = json.loads(body) if body else {}
+        if not isinstance(params, dict):
+            return 400, {"status": "error", "message": "Body must be a JSON object"}
+        try:
+            # Actions publish and may sleep (countdowns), keep them off the loop
+            await self.loop.run_in_executor(None, lambda: action(**params))
+        except TypeError as e:
+            return 400, {"status": "error", "message": str(e)}
+        except Exception as e:
+            return 500, {"status": "error", "message": str(e)}
+        return 200, {"status": "success", "action": path.lstrip("/")}
+
+    async def _send_json(self, writer, status, payload):
+        body = json.dumps(payload).encode()
+        writer.write((
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode() + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _serve_websocket(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode())
+        # Register before the first snapshot so no change can slip in between,
+        # then send the current state straight away and only changes after
+        self._clients.add(writer)
+        writer.write(websocket_frame(json.dumps(self.snapshot()).encode()))
+        await writer.drain()
+        try:
+            while True:
+                opcode, payload = await read_websocket_frame(reader)
+                if opcode == 0x8:
+                    writer.write(websocket_frame(b"", opcode=0x8))
+                    await writer.drain()
+                    break
+                if opcode == 0x9:
+                    writer.write(websocket_frame(payload, opcode=0xA))
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            writer.close()
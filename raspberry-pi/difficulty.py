@@ -0,0 +1,289 @@
+"""
+Adaptive difficulty from streaming per-puzzle statistics.
+
+Everything is kept as O(1)-update running statistics, nothing looks back
+over past rounds:
+
+- button: EWMA of the win rate and P² streaming quantiles of the press
+  `difference` (|press - target| in ms) for each button_id. A press wins
+  when difference < buffer, so the buffer that gives a success rate r is
+  simply the r-quantile of the difference. P² never forgets a sample, so
+  the quantiles are windowed: estimates are restarted every half window
+  and the oldest running one is reported, which covers the last half to
+  full window of presses.
+- maze: EWMA of wall hits per round and of the completion rate for each
+  maze_id. Between rounds the maze whose completion rate is closest to the
+  target is chosen, unseen mazes count as being on target.
+- wire: EWMA of wrong cuts per round.
+- round: EWMA of the VICTORY rate, used to nudge game_duration.
+
+`timer_settings.difficulty_level` picks the target success rate.
+"""
+
+import dataclasses
+
+DIFFICULTY_TARGETS = {
+    "easy": 0.8,
+    "medium": 0.6,
+    "hard": 0.4,
+}
+DEFAULT_LEVEL = "medium"
+
+
+class Ewma:
+    """Exponentially weighted moving average"""
+
+    __slots__ = ("alpha", "value", "count")
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.value = None
+        self.count = 0
+
+    def update(self, x):
+        if self.count == 0:
+            self.value = float(x)
+        else:
+            self.value += self.alpha * (x - self.value)
+        self.count += 1
+
+
+class P2Quantile:
+    """Streaming quantile estimate with the P² algorithm (Jain & Chlamtac, 1985)"""
+
+    __slots__ = ("p", "count", "heights", "positions", "desired", "increments")
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def update(self, x):
+        self.count += 1
+        q = self.heights
+        if self.count <= 5:
+            q.append(x)
+            q.sort()
+            return
+
+        # Find the cell containing x, stretching the extremes if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        n = self.positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        d = self.desired
+        for i in range(5):
+            d[i] += self.increments[i]
+
+        # Move the middle markers towards their desired positions
+        for i in (1, 2, 3):
+            delta = d[i] - n[i]
+            if (delta >= 1 and n[i + 1] - n[i] > 1) or (delta <= -1 and n[i - 1] - n[i] < -1):
+                s = 1 if delta > 0 else -1
+                height = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < height < q[i + 1]:
+                    # Parabolic prediction out of order, fall back to linear
+                    height = q[i] + s * (q[i + s] - q[i]) / (n[i + s] - n[i])
+                q[i] = height
+                n[i] += s
+
+    @property
+    def value(self):
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            return self.heights[int(round(self.p * (self.count - 1)))]
+        return self.heights[2]
+
+
+class WindowedQuantile:
+    """P² quantile over roughly the last `window` samples"""
+
+    __slots__ = ("p", "window", "count", "estimates")
+
+    def __init__(self, p, window):
+        self.p = p
+        self.window = max(2, int(window))
+        self.count = 0
+        self.estimates = [P2Quantile(p)]
+
+    def update(self, x):
+        for estimate in self.estimates:
+            estimate.update(x)
+        self.count += 1
+        if self.count % (self.window // 2) == 0:
+            # Start a new estimate, retire the one that has seen a full window
+            self.estimates.append(P2Quantile(self.p))
+            if len(self.estimates) > 2:
+                self.estimates.pop(0)
+
+    @property
+    def value(self):
+        return self.estimates[0].value
+
+
+class ButtonStats:
+    __slots__ = ("win_rate", "difference", "quantiles")
+
+    def __init__(self, alpha, window):
+        self.win_rate = Ewma(alpha)
+        self.difference = Ewma(alpha)
+        self.quantiles = {level: WindowedQuantile(target, window)
+                          for level, target in DIFFICULTY_TARGETS.items()}
+
+
+class MazeStats:
+    __slots__ = ("completion_rate", "wall_hits")
+
+    def __init__(self, alpha):
+        self.completion_rate = Ewma(alpha)
+        self.wall_hits = Ewma(alpha)
+
+
+class DifficultyEngine:
+    """Running per-puzzle statistics and the config tuning derived from them"""
+
+    def __init__(self, level=DEFAULT_LEVEL, alpha=0.2, window=200, min_samples=10, min_rounds=3,
+                 min_buffer=150, max_buffer=1000, buffer_step=50,
+                 min_duration=180, max_duration=600, duration_step=30, tolerance=0.1):
+        self.alpha = alpha
+        self.window = window
+        self.min_samples = min_samples
+        self.min_rounds = min_rounds
+        self.min_buffer = min_buffer
+        self.max_buffer = max_buffer
+        self.buffer_step = buffer_step
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.duration_step = duration_step
+        self.tolerance = tolerance
+        self.set_level(level)
+        self.buttons = {}
+        self.mazes = {}
+        self.wrong_cuts = Ewma(alpha)
+        self.victory_rate = Ewma(alpha)
+        self.duration_offset = 0
+        self._round = None
+
+    def set_level(self, level):
+        """Switch the target success rate, unknown levels fall back to medium"""
+        self.level = level if level in DIFFICULTY_TARGETS else DEFAULT_LEVEL
+        self.target = DIFFICULTY_TARGETS[self.level]
+
+    def _button(self, button_id):
+        stats = self.buttons.get(button_id)
+        if stats is None:
+            stats = self.buttons[button_id] = ButtonStats(self.alpha, self.window)
+        return stats
+
+    def _maze(self, maze_id):
+        stats = self.mazes.get(maze_id)
+        if stats is None:
+            stats = self.mazes[maze_id] = MazeStats(self.alpha)
+        return stats
+
+    def begin_round(self, maze_id=None):
+        self._round = {"maze_id": maze_id, "wall_hits": 0, "maze_completed": False, "wrong_cuts": 0}
+
+    def observe(self, record):
+        """Fold one decoded message record into the statistics"""
+        msg_type = record.type
+        if msg_type == "BUTTON_GAME_WON" or msg_type == "BUTTON_GAME_LOST":
+            stats = self._button(record.button_id or "unknown")
+            stats.win_rate.update(1 if msg_type == "BUTTON_GAME_WON" else 0)
+            stats.difference.update(record.difference)
+            for quantile in stats.quantiles.values():
+                quantile.update(record.difference)
+        elif self._round is None:
+            return
+        elif msg_type == "WALL_HIT":
+            self._round["wall_hits"] += 1
+            self._round["maze_id"] = record.maze_id or self._round["maze_id"]
+        elif msg_type == "MAZE_COMPLETED":
+            self._round["maze_completed"] = True
+            self._round["maze_id"] = record.maze_id or self._round["maze_id"]
+        elif msg_type == "WRONG_CUT_ALERT":
+            self._round["wrong_cuts"] += 1
+
+    def end_round(self, outcome):
+        """Close the current round; ABORTED rounds are not counted"""
+        current, self._round = self._round, None
+        if current is None or outcome not in ("VICTORY", "GAME_OVER"):
+            return
+        if current["maze_id"]:
+            stats = self._maze(current["maze_id"])
+            stats.completion_rate.update(1 if current["maze_completed"] else 0)
+            stats.wall_hits.update(current["wall_hits"])
+        self.wrong_cuts.update(current["wrong_cuts"])
+
+        self.victory_rate.update(1 if outcome == "VICTORY" else 0)
+        if self.victory_rate.count >= self.min_rounds:
+            # Winning too often shortens the clock, losing too often lengthens it
+            if self.victory_rate.value > self.target + self.tolerance:
+                self.duration_offset -= self.duration_step
+            elif self.victory_rate.value < self.target - self.tolerance:
+                self.duration_offset += self.duration_step
+            span = self.max_duration - self.min_duration
+            self.duration_offset = min(span, max(-span, self.duration_offset))
+
+    def tune_button(self, button):
+        """Return the ButtonConfig with its buffer set for the target success rate"""
+        stats = self.buttons.get(button.button_id)
+        if stats is None or stats.win_rate.count < self.min_samples:
+            return button
+        buffer = stats.quantiles[self.level].value
+        buffer = int(round(buffer / self.buffer_step)) * self.buffer_step
+        return dataclasses.replace(button, buffer=min(self.max_buffer, max(self.min_buffer, buffer)))
+
+    def choose_maze(self, maze_ids, default):
+        """Pick the maze whose completion rate is closest to the target"""
+        def distance(maze_id):
+            stats = self.mazes.get(maze_id)
+            if stats is None or stats.completion_rate.count < self.min_rounds:
+                return 0.0
+            return abs(stats.completion_rate.value - self.target)
+
+        # min() keeps the first of equals, so the configured maze wins ties
+        candidates = [default] + [maze_id for maze_id in maze_ids if maze_id != default]
+        return min(candidates, key=distance)
+
+    def game_duration(self, duration):
+        """Configured game duration adjusted by the round success rate"""
+        if not self.duration_offset:
+            return duration
+        return min(self.max_duration, max(self.min_duration, duration + self.duration_offset))
+
+    def snapshot(self):
+        return {
+            "level": self.level,
+            "target": self.target,
+            "victory_rate": self.victory_rate.value,
+            "duration_offset": self.duration_offset,
+            "wrong_cuts_per_round": self.wrong_cuts.value,
+            "buttons": {
+                button_id: {"win_rate": stats.win_rate.value, "samples": stats.win_rate.count,
+                            "buffer_for_target": stats.quantiles[self.level].value}
+                for button_id, stats in self.buttons.items()
+            },
+            "mazes": {
+                maze_id: {"completion_rate": stats.completion_rate.value,
+                          "wall_hits": stats.wall_hits.value, "rounds": stats.completion_rate.count}
+                for maze_id, stats in self.mazes.items()
+            },
+        }
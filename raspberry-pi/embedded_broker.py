@@ -0,0 +1,503 @@
+"""
+Embedded MQTT 3.1.1 broker for running the rig without a separate daemon.
+
+With MQTT_TRANSPORT=embedded the orchestrator hosts the broker itself: the
+ESP32 modules connect to it over TCP as they would to Mosquitto, while the
+orchestrator's own transport is attached in-process. Module messages reach
+the game logic through a queue instead of a second TCP hop through the
+loopback interface, and commands go straight from publish() to the module
+sockets.
+
+Supported is what PubSubClient uses: CONNECT (3.1 and 3.1.1, clean
+sessions, last will), SUBSCRIBE/UNSUBSCRIBE with + and # wildcards,
+PUBLISH at QoS 0 and 1, retained messages, PINGREQ and DISCONNECT.
+QoS 2 and persistent sessions are not.
+
+    MQTT_TRANSPORT=embedded MQTT_PORT=1883 python mqtt.py
+"""
+
+import asyncio
+import os
+import socket
+import struct
+import threading
+
+from transport import (DEFAULT_PORT, MQTT_ERR_NO_CONN, MQTT_ERR_SUCCESS, LoopbackBroker,
+                       LoopbackTransport, Message, PublishResult, Transport, topic_matches)
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+PROTOCOLS = {(b"MQTT", 4), (b"MQIsdp", 3)}
+CONNACK_ACCEPTED = 0
+CONNACK_BAD_PROTOCOL = 1
+
+MAX_PACKET_SIZE = 256 * 1024
+MAX_WRITE_BUFFER = 1024 * 1024  # a client this far behind is dropped
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_length(length):
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value):
+    if isinstance(value, str):
+        value = value.encode()
+    return struct.pack("!H", len(value)) + value
+
+
+def packet(packet_type, body=b"", flags=0):
+    return bytes((packet_type << 4 | flags,)) + encode_length(len(body)) + body
+
+
+def publish_packet(topic, payload, qos=0, packet_id=0, retain=False):
+    body = encode_string(topic)
+    if qos:
+        body += struct.pack("!H", packet_id)
+    return packet(PUBLISH, body + payload, qos << 1 | int(retain))
+
+
+class Reader:
+    """Cursor over a packet body"""
+
+    __slots__ = ("data", "offset")
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def uint16(self):
+        if self.offset + 2 > len(self.data):
+            raise ProtocolError("Truncated packet")
+        value, = struct.unpack_from("!H", self.data, self.offset)
+        self.offset += 2
+        return value
+
+    def raw(self, size=None):
+        end = len(self.data) if size is None else self.offset + size
+        if end > len(self.data):
+            raise ProtocolError("Truncated packet")
+        value = self.data[self.offset:end]
+        self.offset = end
+        return value
+
+    def string(self):
+        return self.raw(self.uint16())
+
+    def remaining(self):
+        return len(self.data) - self.offset
+
+
+def parse_publish(flags, body):
+    """PUBLISH body -> (topic, payload, qos, packet_id, retain)"""
+    qos = (flags >> 1) & 3
+    if qos > 1:
+        raise ProtocolError("QoS 2 is not supported")
+    reader = Reader(body)
+    topic = reader.string().decode()
+    packet_id = reader.uint16() if qos else 0
+    return topic, reader.raw(), qos, packet_id, bool(flags & 1)
+
+
+async def read_packet(stream):
+    header = (await stream.readexactly(1))[0]
+    length = 0
+    for shift in range(0, 28, 7):
+        byte = (await stream.readexactly(1))[0]
+        length += (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+    else:
+        raise ProtocolError("Malformed remaining length")
+    if length > MAX_PACKET_SIZE:
+        raise ProtocolError(f"Packet of {length} bytes is too large")
+    body = await stream.readexactly(length) if length else b""
+    return header >> 4, header & 0x0F, body
+
+
+class Session:
+    """One connected network client"""
+
+    __slots__ = ("client_id", "writer", "subscriptions", "will", "keepalive", "last_seen", "next_id")
+
+    def __init__(self, client_id, writer, will=None, keepalive=0, now=0.0):
+        self.client_id = client_id
+        self.writer = writer
+        self.subscriptions = {}
+        self.will = will
+        self.keepalive = keepalive
+        self.last_seen = now
+        self.next_id = 0
+
+    def packet_id(self):
+        self.next_id = self.next_id % 0xFFFF + 1
+        return self.next_id
+
+    def granted_qos(self, topic):
+        """Highest QoS of the subscriptions matching topic, None if none match"""
+        granted = None
+        for pattern, qos in self.subscriptions.items():
+            if topic_matches(pattern, topic) and (granted is None or qos > granted):
+                granted = qos
+        return granted
+
+
+class EmbeddedBroker(LoopbackBroker):
+    """
+    MQTT broker on an asyncio loop thread. In-process transports attach to
+    it like to a LoopbackBroker; network clients are served over TCP.
+    """
+
+    def __init__(self, host=None, port=DEFAULT_PORT):
+        super().__init__()
+        self.host = host or os.environ.get("MQTT_BIND", "0.0.0.0")
+        self.port = port
+        self.sessions = {}
+        self.retained = {}
+        self.clients_connected = 0
+        self._loop = None
+        self._loop_thread = None
+        self._server = None
+        self._writers = set()
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    def start(self, host=None, port=None):
+        """Start listening, returns once the socket is bound"""
+        if self.running:
+            return self
+        self.host = host or self.host
+        self.port = self.port if port is None else port
+        ready = threading.Event()
+        failure = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._server = self._loop.run_until_complete(
+                    asyncio.start_server(self._serve, self.host, self.port))
+                self.port = self._server.sockets[0].getsockname()[1]
+                self._loop.call_later(1, self._expire_sessions)
+            except OSError as e:
+                failure.append(e)
+                ready.set()
+                return
+            ready.set()
+            self._loop.run_forever()
+            self._loop.close()
+
+        self._loop_thread = threading.Thread(target=run, name="embedded-broker", daemon=True)
+        self._loop_thread.start()
+        ready.wait()
+        if failure:
+            raise failure[0]
+        return self
+
+    def stop(self):
+        if not self.running:
+            return
+
+        async def shutdown():
+            self._server.close()
+            # Closing the sockets ends every connection handler
+            for writer in list(self._writers):
+                writer.close()
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            await asyncio.wait(tasks, timeout=1) if tasks else None
+            self._loop.stop()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop)
+        self._loop_thread.join(5)
+        self._server = None
+
+    # In-process side
+    def subscribe(self, transport, topic):
+        super().subscribe(transport, topic)
+        for retained_topic, (payload, qos) in list(self.retained.items()):
+            if topic_matches(topic, retained_topic):
+                transport._inbox.put(Message(retained_topic, payload, qos, True))
+
+    def route(self, topic, payload, qos=0, retain=False, properties=None):
+        """Deliver to in-process transports and to every subscribed network client"""
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+        # Network clients speak 3.1.1, v5 properties only reach in-process transports
+        delivered = super().route(topic, payload, qos, retain, properties)
+        if self.sessions:
+            if threading.current_thread() is self._loop_thread:
+                self._fan_out(topic, payload, qos)
+            else:
+                self._loop.call_soon_threadsafe(self._fan_out, topic, payload, qos)
+        return delivered
+
+    # Network side, everything below runs on the loop thread
+    def _expire_sessions(self):
+        """Drop clients silent for 1.5 keepalive periods, checked once a second"""
+        now = self._loop.time()
+        for session in list(self.sessions.values()):
+            if session.keepalive and now - session.last_seen > session.keepalive * 1.5:
+                session.writer.close()
+        self._loop.call_later(1, self._expire_sessions)
+
+    def _fan_out(self, topic, payload, qos):
+        shared = None
+        for session in list(self.sessions.values()):
+            granted = session.granted_qos(topic)
+            if granted is None:
+                continue
+            if min(qos, granted):
+                self._write(session, publish_packet(topic, payload, 1, session.packet_id()))
+            else:
+                # The QoS 0 packet is identical for every receiver, build it once
+                shared = shared or publish_packet(topic, payload)
+                self._write(session, shared)
+
+    def _write(self, session, data):
+        writer = session.writer
+        if writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            writer.close()
+            return
+        writer.write(data)
+
+    async def _serve(self, stream, writer):
+        session = None
+        graceful = False
+        self._writers.add(writer)
+        try:
+            session = await self._handshake(stream, writer)
+            if session is None:
+                return
+            loop = self._loop
+            while True:
+                packet_type, flags, body = await read_packet(stream)
+                session.last_seen = loop.time()
+                if packet_type == PUBLISH:
+                    topic, payload, qos, packet_id, retain = parse_publish(flags, body)
+                    if qos:
+                        self._write(session, packet(PUBACK, struct.pack("!H", packet_id)))
+                    self.route(topic, payload, qos, retain)
+                elif packet_type == SUBSCRIBE:
+                    self._subscribe(session, body)
+                elif packet_type == UNSUBSCRIBE:
+                    reader = Reader(body)
+                    packet_id = reader.uint16()
+                    while reader.remaining():
+                        session.subscriptions.pop(reader.string().decode(), None)
+                    self._write(session, packet(UNSUBACK, struct.pack("!H", packet_id)))
+                elif packet_type == PINGREQ:
+                    self._write(session, packet(PINGRESP))
+                elif packet_type == DISCONNECT:
+                    graceful = True
+                    return
+                elif packet_type != PUBACK:
+                    raise ProtocolError(f"Unexpected packet type {packet_type}")
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, ProtocolError,
+                UnicodeDecodeError):
+            pass
+        finally:
+            if session is not None and self.sessions.get(session.client_id) is session:
+                del self.sessions[session.client_id]
+                if session.will and not graceful:
+                    self.route(*session.will)
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _handshake(self, stream, writer):
+        packet_type, _, body = await asyncio.wait_for(read_packet(stream), 10)
+        if packet_type != CONNECT:
+            raise ProtocolError("Expected CONNECT")
+        reader = Reader(body)
+        protocol = reader.string()
+        level = reader.raw(1)[0]
+        if (protocol, level) not in PROTOCOLS:
+            writer.write(packet(CONNACK, bytes((0, CONNACK_BAD_PROTOCOL))))
+            return None
+        connect_flags = reader.raw(1)[0]
+        keepalive = reader.uint16()
+        client_id = reader.string().decode() or f"auto-{id(writer):x}"
+        will = None
+        if connect_flags & 0x04:
+            will_topic = reader.string().decode()
+            will = (will_topic, reader.string(), (connect_flags >> 3) & 3, bool(connect_flags & 0x20))
+        # Username and password are accepted but not checked
+
+        # A client reconnecting with the same ID takes over the old session
+        previous = self.sessions.get(client_id)
+        if previous is not None:
+            previous.writer.close()
+        session = self.sessions[client_id] = Session(client_id, writer, will, keepalive, self._loop.time())
+        self.clients_connected += 1
+        writer.write(packet(CONNACK, bytes((0, CONNACK_ACCEPTED))))
+        return session
+
+    def _subscribe(self, session, body):
+        reader = Reader(body)
+        packet_id = reader.uint16()
+        granted = bytearray()
+        topics = []
+        while reader.remaining():
+            topic = reader.string().decode()
+            qos = min(reader.raw(1)[0] & 3, 1)
+            session.subscriptions[topic] = qos
+            granted.append(qos)
+            topics.append(topic)
+        self._write(session, packet(SUBACK, struct.pack("!H", packet_id) + bytes(granted)))
+        for topic in topics:
+            for retained_topic, (payload, qos) in list(self.retained.items()):
+                if topic_matches(topic, retained_topic):
+                    self._write(session, publish_packet(retained_topic, payload, retain=True))
+
+
+class EmbeddedTransport(LoopbackTransport):
+    """The orchestrator's in-process transport; connect() starts the broker"""
+
+    def __init__(self, broker=None, userdata=None):
+        super().__init__(broker or EmbeddedBroker(), userdata)
+
+    def connect(self, host=None, port=DEFAULT_PORT, keepalive=60):
+        # `host` is where the modules look for the broker, we listen on MQTT_BIND
+        self.broker.start(port=port)
+        return super().connect()
+
+
+class SocketClient(Transport):
+    """
+    Minimal blocking MQTT 3.1.1 client speaking the same subset as
+    PubSubClient, so tests and benchmarks can stand in for the ESP32
+    modules without paho.
+    """
+
+    def __init__(self, userdata=None, client_id=""):
+        super().__init__(userdata)
+        self.client_id = client_id or f"socket-{id(self):x}"
+        self._socket = None
+        self._buffer = bytearray()
+        self._send_lock = threading.Lock()
+        self._thread = None
+        self._connected = False
+        self._mid = 0
+
+    def connect(self, host, port=DEFAULT_PORT, keepalive=60):
+        self._socket = socket.create_connection((host or "127.0.0.1", port))
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Reads time out at half the keepalive, which is when we ping
+        self._socket.settimeout(keepalive / 2 if keepalive else None)
+        self._buffer = bytearray()
+        body = encode_string("MQTT") + bytes((4, 0x02)) + struct.pack("!H", keepalive)
+        self._send(packet(CONNECT, body + encode_string(self.client_id)))
+        return MQTT_ERR_SUCCESS
+
+    def disconnect(self):
+        if self._socket is None:
+            return MQTT_ERR_NO_CONN
+        try:
+            self._send(packet(DISCONNECT))
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._connected = False
+        return MQTT_ERR_SUCCESS
+
+    def _send(self, data):
+        with self._send_lock:
+            self._socket.sendall(data)
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self._mid = self._mid % 0xFFFF + 1
+        if self._socket is None:
+            return PublishResult(MQTT_ERR_NO_CONN, self._mid)
+        if isinstance(payload, str):
+            payload = payload.encode()
+        try:
+            self._send(publish_packet(topic, payload or b"", min(qos, 1), self._mid, retain))
+        except OSError:
+            return PublishResult(MQTT_ERR_NO_CONN, self._mid)
+        return PublishResult(MQTT_ERR_SUCCESS, self._mid)
+
+    def subscribe(self, topic, qos=0):
+        self._mid = self._mid % 0xFFFF + 1
+        self._send(packet(SUBSCRIBE, struct.pack("!H", self._mid) + encode_string(topic) + bytes((qos,)), 0x02))
+        return MQTT_ERR_SUCCESS, self._mid
+
+    def is_connected(self):
+        return self._connected
+
+    def _read(self, size):
+        while len(self._buffer) < size:
+            try:
+                chunk = self._socket.recv(65536)
+            except socket.timeout:
+                self._send(packet(PINGREQ))
+                continue
+            if not chunk:
+                raise ConnectionError("Connection closed by broker")
+            self._buffer += chunk
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def loop_forever(self):
+        try:
+            while True:
+                header = self._read(1)[0]
+                length = 0
+                for shift in range(0, 28, 7):
+                    byte = self._read(1)[0]
+                    length += (byte & 0x7F) << shift
+                    if byte < 0x80:
+                        break
+                self._dispatch(header >> 4, header & 0x0F, self._read(length) if length else b"")
+        except OSError:
+            pass
+        was_connected, self._connected = self._connected, False
+        if was_connected and self.on_disconnect:
+            self.on_disconnect(self, self.userdata, 0)
+
+    def _dispatch(self, packet_type, flags, body):
+        if packet_type == CONNACK:
+            self._connected = body[1] == CONNACK_ACCEPTED
+            if self.on_connect:
+                self.on_connect(self, self.userdata, {}, body[1])
+        elif packet_type == PUBLISH:
+            topic, payload, qos, packet_id, retain = parse_publish(flags, body)
+            if qos:
+                self._send(packet(PUBACK, struct.pack("!H", packet_id)))
+            if self.on_message:
+                self.on_message(self, self.userdata, Message(topic, payload, qos, retain))
+
+    def loop_start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.loop_forever, daemon=True)
+            self._thread.start()
+
+    def loop_stop(self):
+        if self._thread is not None:
+            self.disconnect()
+            self._thread.join(5)
+            self._thread = None
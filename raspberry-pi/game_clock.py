@@ -0,0 +1,120 @@
+"""
+Authoritative game clock mirroring the countdown on the OLED display.
+
+The display firmware decrements its countdown once per tick, and
+updateTimerSpeed() shortens the tick as X marks are added:
+
+    0 X  -> 1000 ms per game second
+    1 X  ->  750 ms per game second
+    2+ X ->  500 ms per game second
+
+The clock is stored as a single piecewise-linear segment: the remaining
+game time at the start of the segment, when it started and the tick length
+in force. Every start/pause/resume/X change closes the current segment and
+opens a new one, so remaining() is O(1) and nothing ever ticks.
+"""
+
+import math
+
+TICK_INTERVALS = {
+    0: 1.0,
+    1: 0.75,
+}
+FASTEST_TICK_INTERVAL = 0.5
+
+
+def tick_interval(x_count):
+    """Real seconds per game second for a given X count, as on the display"""
+    return TICK_INTERVALS.get(x_count, FASTEST_TICK_INTERVAL)
+
+
+class GameClock:
+    """Countdown model: running, paused or stopped, with X-based speed-up"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.duration = None
+        self.x_count = 0
+        self.running = False
+        self.paused = False
+        self.segments = 0
+        self._segment_remaining = 0.0
+        self._segment_start = 0.0
+        self._interval = tick_interval(0)
+
+    @property
+    def started(self):
+        return self.duration is not None
+
+    def _close_segment(self, now):
+        self._segment_remaining = self.remaining(now)
+        self._segment_start = now
+        self.segments += 1
+
+    def start(self, duration, now):
+        """Start (or restart) the countdown, keeping the current X count"""
+        self.duration = duration
+        self.running = True
+        self.paused = False
+        self._segment_remaining = float(duration)
+        self._segment_start = now
+        self._interval = tick_interval(self.x_count)
+        self.segments = 1
+
+    def pause(self, now):
+        if self.running and not self.paused:
+            self._close_segment(now)
+            self.paused = True
+
+    def resume(self, now):
+        if self.running and self.paused:
+            self._segment_start = now
+            self.paused = False
+            self.segments += 1
+
+    def stop(self, now):
+        """Freeze the clock for good, e.g. on VICTORY or GAME_OVER"""
+        if self.running:
+            self._close_segment(now)
+            self.running = False
+            self.paused = False
+
+    def set_x_count(self, x_count, now):
+        """Apply the display's X count, speeding up the countdown from now on"""
+        if x_count == self.x_count:
+            return
+        if self.running and not self.paused:
+            self._close_segment(now)
+        self.x_count = x_count
+        self._interval = tick_interval(x_count)
+
+    def remaining(self, now):
+        """Remaining game seconds (can go negative once time is up)"""
+        if not self.running or self.paused:
+            return self._segment_remaining
+        return self._segment_remaining - (now - self._segment_start) / self._interval
+
+    def remaining_seconds(self, now):
+        """Whole seconds as shown on the display"""
+        return max(0, math.ceil(self.remaining(now)))
+
+    def expired(self, now, grace=0.0):
+        """True once the countdown has run out for more than `grace` game seconds"""
+        return self.running and not self.paused and self.remaining(now) <= -grace
+
+    def expires_at(self, now):
+        """Real time at which the countdown reaches zero at the current speed"""
+        if not self.running or self.paused:
+            return None
+        return now + max(0.0, self.remaining(now)) * self._interval
+
+    def snapshot(self, now):
+        return {
+            "duration": self.duration,
+            "remaining": self.remaining_seconds(now) if self.started else None,
+            "running": self.running,
+            "paused": self.paused,
+            "x_count": self.x_count,
+        }
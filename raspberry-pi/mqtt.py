@@ -1,7 +1,24 @@
-import paho.mqtt.client as mqtt
+import time
+
+# Startup timing breakdown, seconds since this module started importing
+_startup_t0 = time.perf_counter()
+STARTUP_TIMINGS = {}
+
+import importlib
 import json
 import os
-import time
+import threading
+
+from admission import Admission
+from clock import SystemClock
+from config_model import ButtonConfig, compile_config, default_config
+from game_clock import GameClock
+from reconcile import Reconciler
+from ringlog import RingLog
+from schemas import SchemaRegistry
+from transport import MQTT_ERR_QUEUED, MQTT_ERR_SUCCESS, create_transport, get_broker_list
+
+STARTUP_TIMINGS["imports"] = time.perf_counter() - _startup_t0
 
 # Track completion status of all games
 wire_game_completed = False
@@ -28,84 +45,415 @@ module_last_seen = {
 activation_sent = False
 games_paused = False  # Track if games are paused due to disconnect
 
-BROKER = "192.168.1.201"
+# Structured logging - records go to a ring buffer and are written by a
+# background thread. Categories: raw, heartbeat, game, config, mqtt
+log = RingLog()
+GAME_OVER_LOG_DUMP = 200  # records dumped when a game ends in GAME_OVER
+
+# All time reads, sleeps and periodic jobs go through this clock so tests
+# can swap in a VirtualClock
+clock = SystemClock(log)
+
+HEARTBEAT_INTERVAL = 2   # seconds between heartbeat checks
+HEARTBEAT_TIMEOUT = 10   # seconds - consider disconnected if no message for 10s
+heartbeat_job = None     # the running periodic heartbeat check
+
+# Display state as last reported, for the control API
+x_count = 0
+
+# Our own model of the display countdown, including pauses and X speed-up
+game_clock = GameClock()
+CLOCK_GRACE = 2  # game seconds to wait for the display's TIMER_FINISHED
+
+# Callbacks run whenever rig state changes (control server pushes)
+state_listeners = []
+
+# Map module names to their inbound and outbound topics
+MODULE_TOPICS = {
+    "esp/to/rpi": "wire",
+    "esp2/to/rpi": "display",
+    "esp3/to/rpi": "maze",
+    "esp4/to/rpi": "button"
+}
+
+MODULE_COMMAND_TOPICS = {
+    "wire": "rpi/to/esp",
+    "display": "rpi/to/esp2",
+    "maze": "rpi/to/esp3",
+    "button": "rpi/to/esp4"
+}
+
+# Compiled decoders for every message type the firmwares send
+schema_registry = SchemaRegistry()
+
+# Rate limits and dedups penalty events before they reach the game logic,
+# configured from the "admission" config section
+admission = Admission()
+
+# Priority lanes for everything we publish, configured from the "outbound"
+# config section. Only main() wraps the client in one.
+outbound = None
+
+# Compare reported module state with what we expect on every heartbeat
+reconciler = Reconciler(modules_connected.keys())
+
+# Game history, opened from the "session_store" config section
+session_store = None
+current_session = None
+active_maze_id = None
+active_button_id = None
+
+# Tunes button/maze configs and game duration between rounds, opened from
+# the "difficulty" config section
+difficulty = None
+
+# Message types stored as session events
+SESSION_EVENTS = {
+    "X_ADDED", "MAX_X_REACHED", "TIMER_FINISHED", "WRONG_CUT_ALERT", "WALL_HIT",
+    "BUTTON_GAME_LOST", "PUZZLE_COMPLETED", "MAZE_COMPLETED", "BUTTON_GAME_WON"
+}
+
+# Shared secret for the control API, required unless it only listens locally
+CONTROL_TOKEN_ENV = "CONTROL_API_TOKEN"
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+# Admin topic that starts an on-demand profiling session
+PROFILE_TOPIC = "rpi/admin/profile"
+
+# Everything the orchestrator subscribes to
+INBOUND_TOPICS = (
+    "esp/to/rpi",       # Wire module
+    "esp2/to/rpi",      # Display module
+    "esp3/to/rpi",      # Maze module
+    "esp4/to/rpi",      # Button module
+    "config/request",   # Config requests
+    "config/update",    # Config updates
+    PROFILE_TOPIC,      # Profiling requests
+)
+
+# Brokers in failover order, the first one is the usual one
+BROKERS = get_broker_list()
+BROKER, BROKER_PORT = BROKERS[0]
 CONFIG_FILE = "config.json"
 
 def create_default_config():
     """Create a default config file if it doesn't exist"""
-    default_config = {
-        "timer_settings": {
-            "game_duration": 360,
-            "warning_time": 60,
-            "countdown_start": 10,
-            "auto_reset": True,
-            "difficulty_level": "medium"
-        },
-        "game_settings": {
-            "simultaneous_start": True,
-            "require_all_connected": True,
-            "emergency_stop_on_disconnect": True
-        }
-    }
+    config = default_config()
    
     with open(CONFIG_FILE, "w") as f:
-        json.dump(default_config, f, indent=4)
-    print(f"Created default config file: {CONFIG_FILE}")
-    return default_config
+        json.dump(config, f, indent=4)
+    log.info("config", "Created default config file: %s", CONFIG_FILE)
+    return config
 
 def load_config():
     """Load configuration from file, create default if doesn't exist"""
     try:
         if not os.path.exists(CONFIG_FILE):
-            print(f"Config file {CONFIG_FILE} not found. Creating default...")
+            log.warning("config", "Config file %s not found. Creating default...", CONFIG_FILE)
             return create_default_config()
            
         with open(CONFIG_FILE, "r") as f:
             config = json.load(f)
-            print(f"Loaded config from {CONFIG_FILE}")
+            log.info("config", "Loaded config from %s", CONFIG_FILE)
             return config
     except json.JSONDecodeError as e:
-        print(f"Error parsing JSON in {CONFIG_FILE}: {e}")
-        print("Creating backup and using default config...")
+        log.error("config", "Error parsing JSON in %s: %s - creating backup and using default config", CONFIG_FILE, e)
         with open(f"{CONFIG_FILE}.backup", "w") as backup:
             with open(CONFIG_FILE, "r") as original:
                 backup.write(original.read())
         return create_default_config()
     except Exception as e:
-        print(f"Error loading config: {e}")
+        log.error("config", "Error loading config: %s", e)
         return create_default_config()
 
+# Cached config, reloaded only when config.json changes on disk, and the
+# typed model compiled from it (see config_model.py)
+_config_cache = None
+_config_model = None
+_config_key = None
+_config_lock = threading.Lock()
+
+def _config_file_key():
+    try:
+        return (CONFIG_FILE, os.stat(CONFIG_FILE).st_mtime_ns)
+    except OSError:
+        return (CONFIG_FILE, None)
+
+def get_config():
+    """Return the cached config, reloading it if config.json has changed"""
+    global _config_cache, _config_model, _config_key
+    key = _config_file_key()
+    if _config_cache is not None and key == _config_key:
+        return _config_cache
+    
+    # Callers arriving while the background loader runs wait for its result
+    with _config_lock:
+        key = _config_file_key()
+        if _config_cache is None or key != _config_key:
+            _config_cache = load_config()
+            _config_model = compile_config(_config_cache)
+            _config_key = _config_file_key()
+            for warning in _config_model.warnings:
+                log.warning("config", warning)
+            apply_logging_config(_config_cache)
+            apply_admission_config(_config_cache)
+            apply_outbound_config(_config_cache)
+        return _config_cache
+
+def get_config_model():
+    """Return the compiled model of the cached config"""
+    get_config()
+    return _config_model
+
+def apply_logging_config(config):
+    """Apply the optional "logging" section of the config"""
+    global GAME_OVER_LOG_DUMP
+    settings = config.get("logging", {})
+    try:
+        log.set_levels(settings.get("levels", {}))
+        if "buffer_size" in settings:
+            log.resize(int(settings["buffer_size"]))
+        GAME_OVER_LOG_DUMP = int(settings.get("dump_on_game_over", GAME_OVER_LOG_DUMP))
+    except (KeyError, TypeError, ValueError) as e:
+        log.error("config", "Invalid logging settings: %s", e)
+
+def apply_admission_config(config):
+    """Apply the optional "admission" section of the config"""
+    settings = config.get("admission", {})
+    try:
+        admission.configure(**settings)
+    except (TypeError, ValueError) as e:
+        log.error("config", "Invalid admission settings: %s", e)
+
+def apply_outbound_config(config):
+    """Apply the optional "outbound" section of the config"""
+    if outbound is None:
+        return
+    settings = config.get("outbound", {})
+    try:
+        outbound.configure(**settings)
+    except (TypeError, ValueError) as e:
+        log.error("config", "Invalid outbound settings: %s", e)
+
+def preload_config_async(on_loaded=None):
+    """Load the config on a background thread so startup isn't blocked on it"""
+    def preload():
+        config = get_config()
+        record_startup("config_loaded")
+        if on_loaded:
+            on_loaded(config)
+    
+    thread = threading.Thread(target=preload, daemon=True)
+    thread.start()
+    return thread
+
 def save_config(config):
     """Save configuration to file"""
     try:
         with open(CONFIG_FILE, "w") as f:
             json.dump(config, f, indent=4)
-        print(f"Config saved to {CONFIG_FILE}")
+        log.info("config", "Config saved to %s", CONFIG_FILE)
         return True
     except Exception as e:
-        print(f"Error saving config: {e}")
+        log.error("config", "Error saving config: %s", e)
         return False
 
+def record_startup(phase):
+    """Record when a startup phase completed, relative to module import"""
+    if phase not in STARTUP_TIMINGS:
+        STARTUP_TIMINGS[phase] = time.perf_counter() - _startup_t0
+
+def print_startup_timings():
+    """Log the startup timing breakdown"""
+    timings = {phase: f"{elapsed * 1000:.1f}ms" for phase, elapsed in sorted(STARTUP_TIMINGS.items(), key=lambda item: item[1])}
+    for name, elapsed in subsystem_import_times.items():
+        timings[f"import_{name}"] = f"{elapsed * 1000:.1f}ms"
+    log.info("mqtt", "Startup timings", **timings)
+
+# Optional subsystems are imported the first time they are used
+_subsystems = {}
+subsystem_import_times = {}
+
+def subsystem(name):
+    """Import an optional subsystem module on first use"""
+    module = _subsystems.get(name)
+    if module is None:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        subsystem_import_times[name] = time.perf_counter() - start
+        _subsystems[name] = module
+    return module
+
+def get_state_snapshot():
+    """Current rig state for the control API"""
+    now = clock.time()
+    return {
+        "rig": get_config().get("control_server", {}).get("rig_name", "bomb_defusal"),
+        "modules": {
+            module: {
+                "connected": connected,
+                "last_seen": round(now - module_last_seen[module], 1) if module_last_seen[module] else None
+            }
+            for module, connected in modules_connected.items()
+        },
+        "activated": activation_sent,
+        "paused": games_paused,
+        "timer": game_clock.snapshot(now),
+        "x_count": x_count,
+        "completed": {
+            "wire": wire_game_completed,
+            "maze": maze_game_completed,
+            "button": button_game_completed
+        },
+        "outcome": reconciler.outcome,
+        "session": current_session,
+        "difficulty": difficulty.snapshot() if difficulty is not None else None,
+        "reconcile_corrections": reconciler.corrections,
+        "suppressed_events": admission.suppressed,
+        "session_rows_dropped": session_store.rows_dropped if session_store is not None else 0,
+        "timestamp": int(now * 1000)
+    }
+
+def notify_state_changed():
+    """Tell state listeners (e.g. the control server) that something changed"""
+    for listener in state_listeners:
+        listener()
+
+def open_session_store(config):
+    """Open the session database if enabled in config"""
+    global session_store
+    settings = config.get("session_store", {})
+    if session_store is not None or not settings.get("enabled", False):
+        return session_store
+    try:
+        session_store = subsystem("session_store").SessionStore(
+            settings.get("path", "sessions.db"),
+            batch_size=settings.get("batch_size", 256),
+            log=log
+        )
+        log.info("game", "Recording sessions to %s", session_store.path)
+    except Exception as e:
+        log.error("game", "Could not open session store: %s", e)
+    return session_store
+
+def begin_session(now, duration):
+    """Start recording a new round, closing any round still open"""
+    global current_session
+    if session_store is None:
+        return
+    if current_session is not None:
+        end_session("ABORTED", now)
+    current_session = session_store.begin_session(
+        now, maze_id=active_maze_id, button_id=active_button_id, duration=duration,
+        rig=get_config().get("control_server", {}).get("rig_name", "bomb_defusal")
+    )
+
+def record_session_event(msg_type, module, now, x=None):
+    """Store one game event for the current round"""
+    if session_store is not None and current_session is not None:
+        session_store.record_event(current_session, msg_type, now, module=module,
+                                   x_count=x_count if x is None else x)
+
+def end_session(outcome, now):
+    """Store the outcome of the current round"""
+    global current_session
+    if session_store is not None and current_session is not None:
+        session_store.end_session(current_session, outcome, now,
+                                  time_remaining=game_clock.remaining_seconds(now), x_count=x_count)
+        log.info("game", "Session %s recorded", current_session, outcome=outcome)
+    current_session = None
+
+def open_difficulty_engine(config):
+    """Create the adaptive difficulty engine if enabled in config"""
+    global difficulty
+    settings = config.get("difficulty", {})
+    if difficulty is not None or not settings.get("adaptive", False):
+        return difficulty
+    options = {key: value for key, value in settings.items() if key != "adaptive"}
+    try:
+        difficulty = subsystem("difficulty").DifficultyEngine(
+            compile_config(config).timer.difficulty_level, **options)
+        log.info("game", "Adaptive difficulty enabled", level=difficulty.level, target=difficulty.target)
+    except TypeError as e:
+        log.error("config", "Invalid difficulty settings: %s", e)
+    return difficulty
+
+def begin_round(now, duration):
+    """A round started: open its session and reset per-round statistics"""
+    begin_session(now, duration)
+    if difficulty is not None:
+        difficulty.set_level(get_config_model().timer.difficulty_level)
+        difficulty.begin_round(active_maze_id)
+
+def end_round(outcome, now):
+    """A round ended with VICTORY, GAME_OVER or ABORTED"""
+    end_session(outcome, now)
+    if difficulty is not None:
+        difficulty.end_round(outcome)
+
+def send_tuned_configs(client):
+    """Push the configs chosen by the difficulty engine before the next round"""
+    if difficulty is not None:
+        model = get_config_model()
+        send_button_config(client, model)
+        send_maze_config(client, model)
+
+def start_services(client, config):
+    """Start the optional subsystems once the config is loaded"""
+    open_session_store(config)
+    open_difficulty_engine(config)
+    start_control_server(client, config)
+
+def start_control_server(client, config):
+    """Start the HTTP/WebSocket control API if enabled in config"""
+    settings = config.get("control_server", {})
+    if not settings.get("enabled", False):
+        return None
+    
+    actions = {
+        "start": lambda: start_all_games(client),
+        "stop": lambda: stop_all_games(client),
+        "reset": lambda: reset_all_games(client),
+        "timer": lambda duration=300: start_game_timer(client, duration),
+        "x": lambda reason="MANUAL": send_x_to_display(client, reason)
+    }
+    # The token comes from the environment, config.json is sent to anyone
+    # asking on config/request
+    host = settings.get("host", "127.0.0.1")
+    token = os.environ.get(CONTROL_TOKEN_ENV) or None
+    if token is None and host not in LOOPBACK_HOSTS:
+        log.error("mqtt", "Control API not started: listening on %s needs a token in %s", host, CONTROL_TOKEN_ENV)
+        return None
+    control_server = subsystem("control_server")
+    try:
+        server = control_server.ControlServer(
+            get_state_snapshot, actions,
+            host=host,
+            port=settings.get("port", 8080),
+            token=token
+        ).start()
+    except OSError as e:
+        log.error("mqtt", "Could not start control server: %s", e)
+        return None
+    state_listeners.append(server.notify)
+    log.info("mqtt", "Control API listening on http://%s:%s (WebSocket at /ws)", server.host, server.port)
+    return server
+
 def check_all_modules_connected(client):
     """Check if all modules are connected and send activation signal if so"""
     global modules_connected, activation_sent
     
-    # Print current status for debugging
-    print("\n=== MODULE CONNECTION STATUS ===")
-    for module, status in modules_connected.items():
-        print(f"  {module.upper()}: {'CONNECTED' if status else 'WAITING...'}")
-    print("================================\n")
+    # Record current status for debugging
+    log.debug("game", "Module connection status", **modules_connected)
     
     all_connected = all(modules_connected.values())
     
     if all_connected and not activation_sent:
-        print("\n" + "="*50)
-        print("ALL MODULES CONNECTED! SENDING ACTIVATION SIGNAL...")
-        print("="*50 + "\n")
+        log.info("game", "ALL MODULES CONNECTED! SENDING ACTIVATION SIGNAL...")
         
-        # Load config to get timer duration
-        config = load_config()
-        game_duration = config.get("timer_settings", {}).get("game_duration", 360)
+        game_duration = get_config_model().timer.game_duration
+        if difficulty is not None:
+            game_duration = difficulty.game_duration(game_duration)
         
         # Send activation signal to all modules
         activation_command = {
@@ -113,7 +461,7 @@ def check_all_modules_connected(client):
             "command": "ACTIVATE",
             "message": "All modules connected - system activated!",
             "duration": game_duration,  # Include timer duration in activation
-            "timestamp": int(time.time() * 1000)
+            "timestamp": int(clock.time() * 1000)
         }
         
         # Send to all modules with their specific topics
@@ -126,19 +474,22 @@ def check_all_modules_connected(client):
         
         for topic, module_name in topics.items():
             result = client.publish(topic, json.dumps(activation_command))
-            print(f"  SENT ACTIVATION to {module_name} ({topic})")
-            print(f"    Result: {'SUCCESS' if result.rc == mqtt.MQTT_ERR_SUCCESS else 'FAILED'}")
-            time.sleep(0.1)  # Small delay between messages
+            log.info("mqtt", "SENT ACTIVATION to %s (%s)", module_name, topic,
+                     result="SUCCESS" if result.rc in (MQTT_ERR_SUCCESS, MQTT_ERR_QUEUED) else "FAILED")
+            clock.sleep(0.1)  # Small delay between messages
         
         activation_sent = True
-        print(f"\nALL ACTIVATION SIGNALS SENT WITH {game_duration}s TIMER!\n")
+        # The display starts its countdown on ACTIVATE
+        game_clock.start(game_duration, clock.time())
+        begin_round(clock.time(), game_duration)
+        log.info("game", "ALL ACTIVATION SIGNALS SENT WITH %ss TIMER!", game_duration)
         return True
     elif all_connected and activation_sent:
-        print("All modules connected and already activated")
+        log.info("game", "All modules connected and already activated")
         return True
     else:
         missing_modules = [module for module, connected in modules_connected.items() if not connected]
-        print(f"WAITING FOR: {', '.join([m.upper() for m in missing_modules])}")
+        log.info("game", "WAITING FOR: %s", ", ".join([m.upper() for m in missing_modules]))
         return False
 
 def start_game_timer(client, duration=300):
@@ -151,7 +502,10 @@ def start_game_timer(client, duration=300):
     }
     
     client.publish("rpi/to/esp2", json.dumps(timer_command))
-    print(f"Game timer started: {duration} seconds")
+    game_clock.start(duration, clock.time())
+    begin_round(clock.time(), duration)
+    log.info("game", "Game timer started: %s seconds", duration)
+    notify_state_changed()
 
 def send_x_to_display(client, reason="GAME_FAILURE"):
     """Send X mark to display"""
@@ -162,81 +516,113 @@ def send_x_to_display(client, reason="GAME_FAILURE"):
     }
     
     client.publish("rpi/to/esp2", json.dumps(x_command))
-    print(f"X mark sent to display: {reason}")
+    log.info("game", "X mark sent to display: %s", reason)
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
-        print(f"\nSUCCESSFULLY CONNECTED TO MQTT BROKER")
-        print(f"Connection result code: {rc}")
+        log.info("mqtt", "SUCCESSFULLY CONNECTED TO MQTT BROKER", rc=rc)
     else:
-        print(f"\nFAILED TO CONNECT TO MQTT BROKER")
-        print(f"Connection result code: {rc}")
+        log.error("mqtt", "FAILED TO CONNECT TO MQTT BROKER", rc=rc)
         return
     
     # Subscribe to all topics
-    topics = [
-        ("esp/to/rpi", 0),      # Wire module
-        ("esp2/to/rpi", 0),     # Display module
-        ("esp3/to/rpi", 0),     # Maze module
-        ("esp4/to/rpi", 0),     # Button module
-        ("config/request", 0),  # Config requests
-        ("config/update", 0)    # Config updates
-    ]
-    
-    for topic, qos in topics:
-        result, mid = client.subscribe(topic, qos)
-        if result == mqtt.MQTT_ERR_SUCCESS:
-            print(f"  SUBSCRIBED to {topic}")
+    for topic in INBOUND_TOPICS:
+        result, mid = client.subscribe(topic, 0)
+        if result == MQTT_ERR_SUCCESS:
+            log.info("mqtt", "SUBSCRIBED to %s", topic)
         else:
-            print(f"  FAILED to subscribe to {topic}")
+            log.error("mqtt", "FAILED to subscribe to %s", topic)
     
-    print("\nWaiting for ESP32 modules to connect...")
-    print("-" * 50)
+    first_connect = "subscribed" not in STARTUP_TIMINGS
+    record_startup("subscribed")
+    if first_connect:
+        print_startup_timings()
     
-    # Start heartbeat checker thread
-    import threading
-    heartbeat_thread = threading.Thread(target=check_heartbeats, args=(client,), daemon=True)
-    heartbeat_thread.start()
+    log.info("game", "Waiting for ESP32 modules to connect...")
+    
+    # Start the periodic heartbeat check, replacing the one from the last connect
+    start_heartbeat_job(client)
+
+def start_heartbeat_job(client):
+    """Run check_heartbeats_once every HEARTBEAT_INTERVAL, one job at a time"""
+    global heartbeat_job
+    if heartbeat_job is not None:
+        heartbeat_job.cancel()
+    heartbeat_job = clock.every(HEARTBEAT_INTERVAL, check_heartbeats_once, client, name="heartbeat-checker")
+    return heartbeat_job
+
+def handle_profile_request(client, payload):
+    """Start or stop a bounded profiling session from an admin request"""
+    settings = get_config().get("profiling", {})
+    if not settings.get("enabled", False):
+        log.warning("mqtt", "Profiling request ignored, profiling is disabled in config")
+        return
+    try:
+        request = json.loads(payload) if payload else {}
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        profiling = subsystem("profiling")
+        if request.get("action") == "stop":
+            profiling.stop_session()
+            return
+        session = profiling.start_session(
+            client,
+            duration=request.get("duration", 10),
+            max_duration=settings.get("max_duration", 60),
+            mode=request.get("mode", "both"),
+            top=int(request.get("top", 15)),
+            output_dir=settings.get("output_dir", "profiles"),
+            sample_interval=settings.get("sample_interval", 0.005)
+        )
+    except (ValueError, TypeError) as e:
+        log.error("mqtt", "Invalid profiling request: %s", e)
+        client.publish(PROFILE_TOPIC + "/result", json.dumps({"type": "PROFILE_ERROR", "message": str(e)}))
+        return
+    if session is None:
+        log.warning("mqtt", "Profiling session already running")
+        client.publish(PROFILE_TOPIC + "/result", json.dumps({"type": "PROFILE_BUSY"}))
+    else:
+        log.info("mqtt", "Profiling for %ss", session.duration, mode=session.mode)
 
 def on_message(client, userdata, msg):
+    try:
+        handle_message(client, msg)
+    finally:
+        notify_state_changed()
+
+def handle_message(client, msg):
+    """Route one inbound MQTT message to the game logic"""
     global button_game_completed, wire_game_completed, maze_game_completed
-    global modules_connected, module_last_seen
+    global modules_connected, module_last_seen, x_count
    
     topic = msg.topic
-    message_payload = msg.payload.decode()
     
     # Update last seen timestamp for the module
-    current_time = time.time()
-    if topic == "esp/to/rpi":
-        module_last_seen["wire"] = current_time
-    elif topic == "esp2/to/rpi":
-        module_last_seen["display"] = current_time
-    elif topic == "esp3/to/rpi":
-        module_last_seen["maze"] = current_time
-    elif topic == "esp4/to/rpi":
-        module_last_seen["button"] = current_time
-    
-    # Debug: Print all received messages
-    print(f"\n[RAW] Topic: {topic}")
-    print(f"[RAW] Payload: {message_payload}")
+    current_time = clock.time()
+    module = MODULE_TOPICS.get(topic)
+    if module:
+        module_last_seen[module] = current_time
+    
+    # Debug: Keep all received messages, printed only if "raw" is at debug
+    log.debug("raw", "Topic: %s Payload: %r", topic, msg.payload)
    
     # Handle configuration requests
     if topic == "config/request":
         try:
-            config = load_config()
-            client.publish("config/response", json.dumps(config))
-            print("Sent config response")
+            config = get_config()
+            client.respond(msg, "config/response", json.dumps(config))
+            log.info("config", "Sent config response")
         except Exception as e:
-            print(f"Error handling config request: {e}")
+            log.error("config", "Error handling config request: %s", e)
         return
        
     # Handle configuration updates
     elif topic == "config/update":
         try:
-            new_config = json.loads(message_payload)
+            new_config = json.loads(msg.payload)
             if save_config(new_config):
                 client.publish("config/ack", json.dumps({"status": "success", "message": "Config updated"}))
-                print("Config updated successfully")
+                log.info("config", "Config updated successfully")
                
                 if "timer_settings" in new_config:
                     timer_update = {
@@ -245,226 +631,257 @@ def on_message(client, userdata, msg):
                         "settings": new_config["timer_settings"]
                     }
                     client.publish("rpi/to/esp2", json.dumps(timer_update))
-                    print("Sent updated timer settings to ESP2")
+                    log.info("config", "Sent updated timer settings to ESP2")
             else:
                 client.publish("config/ack", json.dumps({"status": "error", "message": "Failed to save config"}))
         except json.JSONDecodeError as e:
-            print(f"Error parsing config update: {e}")
+            log.error("config", "Error parsing config update: %s", e)
             client.publish("config/ack", json.dumps({"status": "error", "message": "Invalid JSON"}))
         except Exception as e:
-            print(f"Error handling config update: {e}")
+            log.error("config", "Error handling config update: %s", e)
             client.publish("config/ack", json.dumps({"status": "error", "message": str(e)}))
         return
    
+    elif topic == PROFILE_TOPIC:
+        handle_profile_request(client, msg.payload)
+        return
+   
+    # Decode and validate against the schema registry, invalid messages are
+    # counted and dropped here without reaching the game logic
+    data = schema_registry.decode(msg.payload)
+    if data is None:
+        log.debug("raw", "Dropped invalid message on %s (%s dropped so far)", topic, schema_registry.dropped)
+        return
+    
+    # Bursts and duplicate deliveries of penalty events stop here
+    if not admission.admit(module or topic, data, current_time):
+        log.debug("game", "Suppressed %s from %s", data.type, module or topic,
+                  suppressed=admission.suppressed)
+        return
+    
+    msg_type = data.type
+    if msg_type in SESSION_EVENTS:
+        record_session_event(msg_type, module, current_time, getattr(data, "x_count", None))
+        if difficulty is not None:
+            difficulty.observe(data)
+    
     try:
-        # Try parsing as JSON
-        data = json.loads(message_payload)
-        
-        # Check if data is a dictionary (not int, string, etc.)
-        if not isinstance(data, dict):
-            print(f"[PARSED] Non-dict JSON: {data} (type: {type(data).__name__})")
-            return
-        
-        msg_type = data.get("type", "")
-        
-        print(f"[PARSED] Type: {msg_type}")
         
         # === CONNECTION STATUS HANDLING ===
         # This is the KEY FIX - handle connection messages regardless of topic
         
         if msg_type == "HEARTBEAT":
-            # Silently handle heartbeat - already updated module_last_seen above
-            # Don't print anything to avoid spam
-            pass
+            # Already updated module_last_seen above, only reconcile state
+            log.debug("heartbeat", "Heartbeat from %s", module or topic)
+            if module:
+                reconcile_module_state(client, module, data)
+        
+        elif msg_type == "GAME_STATUS":
+            if module:
+                reconcile_module_state(client, module, data)
         
         elif msg_type == "DISPLAY_CONNECTED":
-            print("\nDISPLAY MODULE CONNECTED!")
-            print(f"  Device: {data.get('device', 'Unknown')}")
+            log.info("game", "DISPLAY MODULE CONNECTED!", device=data.device)
             modules_connected["display"] = True
             check_all_modules_connected(client)
             
         elif msg_type == "WIRE_MODULE_CONNECTED":
-            print("\nWIRE MODULE CONNECTED!")
-            print(f"  Device: {data.get('device', 'Unknown')}")
+            log.info("game", "WIRE MODULE CONNECTED!", device=data.device)
             modules_connected["wire"] = True
             check_all_modules_connected(client)
             
         elif msg_type == "MAZE_MODULE_CONNECTED":
-            print("\nMAZE MODULE CONNECTED!")
-            print(f"  Device: {data.get('device', 'Unknown')}")
+            log.info("game", "MAZE MODULE CONNECTED!", device=data.device)
             modules_connected["maze"] = True
             
             # Send maze configuration from config file
-            config = load_config()
-            send_maze_config(client, config)
+            send_maze_config(client, get_config_model())
             
             check_all_modules_connected(client)
         
         elif msg_type == "REQUEST_MAZE_CONFIG":
-            print("Maze module requesting configuration...")
-            config = load_config()
-            send_maze_config(client, config)
+            log.info("config", "Maze module requesting configuration...")
+            send_maze_config(client, get_config_model())
             
         elif msg_type == "BUTTON_MODULE_CONNECTED":
-            print("\nBUTTON MODULE CONNECTED!")
-            print(f"  Device: {data.get('device', 'Unknown')}")
-            print(f"  Target time: {data.get('target_time', 2000)}ms")
+            log.info("game", "BUTTON MODULE CONNECTED!", device=data.device,
+                     target_time=data.target_time)
             modules_connected["button"] = True
             
             # Send button configuration from config file
-            config = load_config()
-            send_button_config(client, config)
+            send_button_config(client, get_config_model())
             
             check_all_modules_connected(client)
         
         elif msg_type == "REQUEST_BUTTON_CONFIG":
-            print("Button module requesting configuration...")
-            config = load_config()
-            send_button_config(client, config)
+            log.info("config", "Button module requesting configuration...")
+            send_button_config(client, get_config_model())
         
         # === ACTIVATION ACKNOWLEDGMENT ===
         elif msg_type == "DISPLAY_ACTIVATED":
-            print("Display module activated and ready")
+            log.info("game", "Display module activated and ready")
             
         elif msg_type == "MODULE_ACTIVATED":
-            module_name = data.get('device', 'Unknown')
-            print(f"{module_name} activated and ready")
+            module_name = data.device
+            log.info("game", "%s activated and ready", module_name)
         
         # === GAME EVENT HANDLING ===
         elif msg_type == "TIMER_FINISHED":
-            print("\nTIMER FINISHED - GAME OVER!")
-            handle_timer_finished(client)
+            log.info("game", "TIMER FINISHED - GAME OVER!",
+                     clock_remaining=round(game_clock.remaining(clock.time()), 1))
+            if reconciler.outcome != "GAME_OVER":
+                handle_timer_finished(client)
             
         elif msg_type == "X_ADDED":
-            print(f"X mark added to display! Total: {data.get('x_count', 0)}/{data.get('max_x_count', 3)}")
+            x_count = data.x_count
+            game_clock.set_x_count(x_count, clock.time())
+            log.info("game", "X mark added to display! Total: %s/%s", data.x_count, data.max_x_count)
            
+        elif msg_type == "X_RESET":
+            x_count = 0
+            game_clock.set_x_count(0, clock.time())
+            log.info("game", "Display X counter reset")
+            
         elif msg_type == "MAX_X_REACHED":
-            print("MAXIMUM X COUNT REACHED - GAME OVER!")
-            print(f"X Count: {data.get('x_count', 0)}/{data.get('max_x_count', 3)}")
+            x_count = data.x_count
+            game_clock.set_x_count(x_count, clock.time())
+            log.info("game", "MAXIMUM X COUNT REACHED - GAME OVER! X Count: %s/%s", data.x_count, data.max_x_count)
             # Trigger game over when max X is reached
             handle_timer_finished(client)
            
         elif msg_type == "TIMER_STARTED":
-            print(f"Display timer started: {data.get('message', 'Unknown duration')}")
+            log.info("game", "Display timer started: %s", data.message or 'Unknown duration')
            
         elif msg_type == "TIMER_STOPPED":
-            print(f"Display timer stopped: {data.get('message', 'Unknown reason')}")
+            log.info("game", "Display timer stopped: %s", data.message or 'Unknown reason')
             
         elif msg_type == "WRONG_CUT_ALERT":
-            print(f"\nWRONG WIRE CUT!")
-            print(f"  Player cut: {data.get('wrong_wire_cut', 'Unknown')} wire")
-            print(f"  Expected: {data.get('expected_wire', 'Unknown')} wire")
-            print(f"  Step: {data.get('current_step', '?')}/{data.get('total_steps', '?')}")
+            log.info("game", "WRONG WIRE CUT!", cut=data.wrong_wire_cut, expected=data.expected_wire,
+                     step=f"{data.current_step or '?'}/{data.total_steps or '?'}")
             send_x_to_display(client, "WRONG_WIRE_CUT")
            
         elif msg_type == "PUZZLE_COMPLETED":
-            print("\nWIRE GAME COMPLETED!")
+            log.info("game", "WIRE GAME COMPLETED!")
             wire_game_completed = True
+            reconciler.mark_completed("wire")
             check_all_games_completed(client)
             
         elif msg_type == "MAZE_COMPLETED":
-            print("\nMAZE COMPLETED!")
+            log.info("game", "MAZE COMPLETED!")
             maze_game_completed = True
+            reconciler.mark_completed("maze")
             check_all_games_completed(client)
            
         elif msg_type == "WALL_HIT":
-            print("\nWALL HIT IN MAZE!")
-            print("Player returned to start")
+            log.info("game", "WALL HIT IN MAZE! Player returned to start")
             send_x_to_display(client, "MAZE_WALL_HIT")
            
         elif msg_type == "GAME_RESTART":
-            print("Maze game restarted by player")
+            log.info("game", "Maze game restarted by player")
             
         elif msg_type == "BUTTON_GAME_WON":
-            print("\nBUTTON GAME WON!")
-            print(f"  Press duration: {data.get('press_duration', 0)}ms")
-            print(f"  Target time: {data.get('target_time', 0)}ms")
-            print(f"  Difference: {data.get('difference', 0)}ms")
+            log.info("game", "BUTTON GAME WON!", press_duration=data.press_duration,
+                     target_time=data.target_time, difference=data.difference)
             button_game_completed = True
+            reconciler.mark_completed("button")
             check_all_games_completed(client)
            
         elif msg_type == "BUTTON_GAME_LOST":
-            print("\nBUTTON GAME LOST!")
-            print(f"  Press duration: {data.get('press_duration', 0)}ms")
-            print(f"  Target time: {data.get('target_time', 0)}ms")
-            print(f"  Difference: {data.get('difference', 0)}ms")
+            log.info("game", "BUTTON GAME LOST!", press_duration=data.press_duration,
+                     target_time=data.target_time, difference=data.difference)
             send_x_to_display(client, "BUTTON_GAME_LOST")
         
         else:
-            print(f"Unknown message type: {msg_type}")
+            log.debug("game", "Unhandled message type: %s", msg_type)
            
-    except json.JSONDecodeError as e:
-        print(f"JSON decode error: {e}")
-        print(f"Raw message: '{message_payload}'")
-        
-        # Handle non-JSON messages
-        message = message_payload.strip()
-        if message == "1":
-            print("Received '1' signal from ESP32")
-            if topic == "esp2/to/rpi":
-                print("  Signal from display module")
-        else:
-            print(f"Unknown non-JSON message: {message}")
     except Exception as e:
-        print(f"Error processing message: {e}")
-        import traceback
-        traceback.print_exc()
+        log.error("game", "Error processing message: %s", e, exc_info=True)
+
+def reconcile_module_state(client, module, data):
+    """Correct drift between expected and reported module state"""
+    global wire_game_completed, maze_game_completed, button_game_completed
+    
+    for action, module_name, command in reconciler.observe(module, data):
+        if action == "accept_completion":
+            record_session_event("COMPLETION_RECONCILED", module_name, clock.time())
+            log.warning("game", "RECONCILE: %s reports completion we missed - accepting", module_name.upper())
+            if module_name == "wire":
+                wire_game_completed = True
+            elif module_name == "maze":
+                maze_game_completed = True
+            elif module_name == "button":
+                button_game_completed = True
+            check_all_games_completed(client)
+        elif action == "resend":
+            log.warning("game", "RECONCILE: %s out of sync - resending %s", module_name.upper(), command)
+            resend_command = {
+                "type": command,
+                "command": command,
+                "reason": "reconcile"
+            }
+            client.publish(MODULE_COMMAND_TOPICS[module_name], json.dumps(resend_command))
+        log.info("game", "Total reconcile corrections: %s", reconciler.corrections)
 
-def handle_timer_finished(client):
+def handle_timer_finished(client, reason="timer_finished"):
     """Handle when the display timer finishes - trigger game over"""
-    print("\nGAME OVER - TIME'S UP!")
+    log.info("game", "GAME OVER - TIME'S UP!", reason=reason)
+    reconciler.expect_outcome("GAME_OVER")
+    game_clock.stop(clock.time())
+    end_round("GAME_OVER", clock.time())
     
     game_over_message = {
         "type": "GAME_OVER",
         "command": "GAME_OVER",
         "message": "Time's up! Game over!",
-        "reason": "timer_finished"
+        "reason": reason
     }
     
     topics = ["rpi/to/esp", "rpi/to/esp2", "rpi/to/esp3", "rpi/to/esp4"]
     for topic in topics:
         client.publish(topic, json.dumps(game_over_message))
     
-    print("Game over signals sent to all modules!")
+    log.info("game", "Game over signals sent to all modules!")
+    
+    # Dump recent detail (raw payloads, heartbeats) that was captured but not printed
+    if GAME_OVER_LOG_DUMP:
+        log.dump(GAME_OVER_LOG_DUMP, title="GAME OVER")
 
 def check_all_games_completed(client):
     """Check if all games are completed and send victory signal"""
     global wire_game_completed, maze_game_completed, button_game_completed
    
     if wire_game_completed and maze_game_completed and button_game_completed:
-        print("\n" + "="*50)
-        print("ALL GAMES COMPLETED! VICTORY!")
-        print("="*50 + "\n")
+        log.info("game", "ALL GAMES COMPLETED! VICTORY!")
+        reconciler.expect_outcome("VICTORY")
+        game_clock.stop(clock.time())
+        log.info("game", "Time remaining: %ss", game_clock.remaining_seconds(clock.time()))
+        end_round("VICTORY", clock.time())
        
         victory_message = {
             "type": "VICTORY",
             "command": "VICTORY",
             "message": "All puzzles completed!",
-            "timestamp": int(time.time() * 1000)
+            "timestamp": int(clock.time() * 1000)
         }
        
         topics = ["rpi/to/esp", "rpi/to/esp2", "rpi/to/esp3", "rpi/to/esp4"]
         for topic in topics:
             client.publish(topic, json.dumps(victory_message))
            
-        print("Victory signals sent to all ESP32s!")
+        log.info("game", "Victory signals sent to all ESP32s!")
 
 def start_all_games(client):
     """Start all games simultaneously"""
     global wire_game_completed, maze_game_completed, button_game_completed
    
-    print("\nStarting all games simultaneously...")
+    log.info("game", "Starting all games simultaneously...")
    
     wire_game_completed = False
     maze_game_completed = False
     button_game_completed = False
+    reconciler.reset()
    
-    config = load_config()
-    timer_settings = config.get("timer_settings", {
-        "game_duration": 300,
-        "warning_time": 60,
-        "countdown_start": 10
-    })
+    timer_settings = get_config_model().timer
    
     start_commands = {
         "rpi/to/esp": {"type": "START_GAME", "command": "START_GAME", "reset": True},
@@ -478,24 +895,29 @@ def start_all_games(client):
         "countdown": 3
     }
    
+    send_tuned_configs(client)
     for topic in start_commands.keys():
         client.publish(topic, json.dumps(sync_start))
     client.publish("rpi/to/esp2", json.dumps(sync_start))
    
-    print("Countdown started...")
-    time.sleep(3)
+    log.info("game", "Countdown started...")
+    clock.sleep(3)
    
     for topic, command in start_commands.items():
         client.publish(topic, json.dumps(command))
-        time.sleep(0.1)
+        clock.sleep(0.1)
     
-    start_game_timer(client, timer_settings.get("game_duration", 300))
+    game_duration = timer_settings.game_duration
+    if difficulty is not None:
+        game_duration = difficulty.game_duration(game_duration)
+    start_game_timer(client, game_duration)
        
-    print("All games started!")
+    log.info("game", "All games started!")
+    notify_state_changed()
 
 def stop_all_games(client):
     """Stop all games"""
-    print("\nStopping all games...")
+    log.info("game", "Stopping all games...")
    
     stop_command = {
         "type": "STOP_GAME",
@@ -507,20 +929,26 @@ def stop_all_games(client):
     for topic in topics:
         client.publish(topic, json.dumps(stop_command))
        
-    print("All games stopped!")
+    log.info("game", "All games stopped!")
+    notify_state_changed()
 
 def reset_all_games(client):
     """Reset all games to initial state"""
     global wire_game_completed, maze_game_completed, button_game_completed
-    global activation_sent, games_paused
+    global activation_sent, games_paused, x_count
    
-    print("\nResetting all games...")
+    log.info("game", "Resetting all games...")
    
     wire_game_completed = False
     maze_game_completed = False
     button_game_completed = False
     activation_sent = False  # Allow reactivation
     games_paused = False  # Reset pause state
+    end_round("ABORTED", clock.time())
+    x_count = 0
+    game_clock.reset()
+    reconciler.reset()
+    admission.reset()
    
     reset_commands = {
         "rpi/to/esp": {"type": "RESET_GAME", "command": "RESET_GAME"},
@@ -532,52 +960,58 @@ def reset_all_games(client):
     for topic, command in reset_commands.items():
         client.publish(topic, json.dumps(command))
        
-    print("All games reset!")
+    send_tuned_configs(client)
+    log.info("game", "All games reset!")
+    notify_state_changed()
 
-def check_heartbeats(client):
-    """Check if modules are still connected via heartbeat timeout"""
+def check_heartbeats_once(client):
+    """One heartbeat check: game clock expiry, module timeouts, pause/resume"""
     global modules_connected, module_last_seen, activation_sent, games_paused
     
-    HEARTBEAT_TIMEOUT = 10  # seconds - consider disconnected if no message for 10s
+    current_time = clock.time()
     
-    while True:
-        time.sleep(2)  # Check every 2 seconds
-        
-        if not activation_sent:
-            continue  # Don't check until system is activated
-        
-        current_time = time.time()
-        any_disconnected = False
-        disconnected_modules = []
-        
-        for module, last_seen in module_last_seen.items():
-            if last_seen == 0:
-                continue  # Module never connected
-            
-            time_since_last_seen = current_time - last_seen
-            
-            if time_since_last_seen > HEARTBEAT_TIMEOUT:
-                if modules_connected[module]:
-                    print(f"\n WARNING: {module.upper()} MODULE DISCONNECTED!")
-                    print(f"  Last seen: {time_since_last_seen:.1f} seconds ago")
-                    modules_connected[module] = False
-                    any_disconnected = True
-                    disconnected_modules.append(module)
+    # Enforce game over from our own clock, even if the display is offline
+    # or its TIMER_FINISHED got lost
+    if reconciler.outcome is None and game_clock.expired(current_time, CLOCK_GRACE):
+        log.warning("game", "Game clock expired without TIMER_FINISHED from display")
+        handle_timer_finished(client, reason="orchestrator_clock")
+        notify_state_changed()
+    
+    if not activation_sent:
+        return  # Don't check until system is activated
+    
+    any_disconnected = False
+    disconnected_modules = []
+    
+    for module, last_seen in module_last_seen.items():
+        if last_seen == 0:
+            continue  # Module never connected
         
-        # If any module disconnected, pause the games
-        if any_disconnected and not games_paused:
-            print(f"\n PAUSING GAMES - Disconnected modules: {', '.join([m.upper() for m in disconnected_modules])}")
-            pause_all_games(client)
-            games_paused = True
+        time_since_last_seen = current_time - last_seen
         
-        # If all reconnected, resume the games
-        elif not any_disconnected and games_paused:
-            # Check if all modules that were initially connected are back
-            all_reconnected = all(modules_connected.values())
-            if all_reconnected:
-                print(f"\n ALL MODULES RECONNECTED - RESUMING GAMES")
-                resume_all_games(client)
-                games_paused = False
+        if time_since_last_seen > HEARTBEAT_TIMEOUT:
+            if modules_connected[module]:
+                log.warning("heartbeat", "%s MODULE DISCONNECTED! Last seen: %.1f seconds ago", module.upper(), time_since_last_seen)
+                modules_connected[module] = False
+                any_disconnected = True
+                disconnected_modules.append(module)
+    
+    # If any module disconnected, pause the games
+    if any_disconnected and not games_paused:
+        log.warning("game", "PAUSING GAMES - Disconnected modules: %s", ", ".join([m.upper() for m in disconnected_modules]))
+        pause_all_games(client)
+        games_paused = True
+        notify_state_changed()
+    
+    # If all reconnected, resume the games
+    elif not any_disconnected and games_paused:
+        # Check if all modules that were initially connected are back
+        all_reconnected = all(modules_connected.values())
+        if all_reconnected:
+            log.info("game", "ALL MODULES RECONNECTED - RESUMING GAMES")
+            resume_all_games(client)
+            games_paused = False
+            notify_state_changed()
 
 def pause_all_games(client):
     """Pause all games due to disconnection"""
@@ -588,7 +1022,9 @@ def pause_all_games(client):
     }
     
     client.publish("rpi/to/esp2", json.dumps(pause_command))
-    print("Timer paused due to disconnection")
+    reconciler.expect_paused("display", True)
+    game_clock.pause(clock.time())
+    log.info("game", "Timer paused due to disconnection")
 
 def resume_all_games(client):
     """Resume all games after reconnection"""
@@ -599,156 +1035,116 @@ def resume_all_games(client):
     }
     
     client.publish("rpi/to/esp2", json.dumps(resume_command))
-    print("Timer resumed after reconnection")
+    reconciler.expect_paused("display", False)
+    game_clock.resume(clock.time())
+    log.info("game", "Timer resumed after reconnection")
 
-def send_button_config(client, config):
+def send_button_config(client, model):
     """Send button configuration to button module"""
+    global active_button_id
     try:
-        button_configs = config.get("button_ID", {})
-        
-        if not button_configs:
-            print("⚠️ Warning: No button_ID section in config, using defaults")
-            # Use default configuration
-            enabled_button = {
-                "button_id": "button_1",
-                "target_time": 2000,
-                "buffer": 500,
-                "enabled": True
-            }
-        else:
-            # Find the enabled button
-            enabled_button = None
-            for button_id, button_data in button_configs.items():
-                if button_data.get("enabled", False):
-                    enabled_button = {
-                        "button_id": button_id,
-                        "target_time": button_data.get("target_time", 2000),
-                        "buffer": button_data.get("buffer", 500),
-                        "enabled": True
-                    }
-                    break
-            
-            if not enabled_button:
-                print("⚠️ Warning: No enabled button found, using defaults")
-                enabled_button = {
-                    "button_id": "button_1",
-                    "target_time": 2000,
-                    "buffer": 500,
-                    "enabled": True
-                }
+        button = model.button
+        if difficulty is not None:
+            tuned = difficulty.tune_button(button)
+            if tuned.buffer != button.buffer:
+                log.info("game", "Difficulty: button %s buffer %sms -> %sms", tuned.button_id,
+                         button.buffer, tuned.buffer)
+            button = tuned
         
         config_command = {
             "type": "UPDATE_BUTTON_CONFIG",
             "command": "UPDATE_BUTTON_CONFIG",
-            **enabled_button
+            **button.message()
         }
         client.publish("rpi/to/esp4", json.dumps(config_command))
-        print(f"✅ Sent button config: {enabled_button['button_id']} - {enabled_button['target_time']}ms ±{enabled_button['buffer']}ms")
+        active_button_id = button.button_id
+        log.info("config", "Sent button config: %s - %sms ±%sms", button.button_id, button.target_time, button.buffer)
     
     except Exception as e:
-        print(f"❌ Error sending button config: {e}")
-        print("   Using default button configuration")
+        log.error("config", "Error sending button config: %s - using default button configuration", e)
         # Send minimal default config
-        default_config = {
+        default_command = {
             "type": "UPDATE_BUTTON_CONFIG",
             "command": "UPDATE_BUTTON_CONFIG",
-            "button_id": "button_1",
-            "target_time": 2000,
-            "buffer": 500,
-            "enabled": True
+            **ButtonConfig().message()
         }
-        client.publish("rpi/to/esp4", json.dumps(default_config))
+        client.publish("rpi/to/esp4", json.dumps(default_command))
 
-def send_maze_config(client, config):
+def send_maze_config(client, model):
     """Send maze configuration to maze module"""
+    global active_maze_id
     try:
-        maze_configs = config.get("maze_ID", {})
-        
-        if not maze_configs:
-            print("⚠️ Warning: No maze_ID section in config")
+        maze = model.maze
+        if maze is None:
+            log.warning("config", "No maze_ID section in config")
             return
         
-        # Find the enabled maze
-        enabled_maze = None
-        for maze_id, maze_data in maze_configs.items():
-            if maze_data.get("enabled", False):
-                enabled_maze = maze_data.copy()
-                enabled_maze["maze_id"] = maze_id
-                break
-        
-        if not enabled_maze:
-            print("⚠️ Warning: No enabled maze found in config")
-            # Enable the first maze by default
-            first_maze_id = list(maze_configs.keys())[0]
-            enabled_maze = maze_configs[first_maze_id].copy()
-            enabled_maze["maze_id"] = first_maze_id
+        if difficulty is not None:
+            chosen = difficulty.choose_maze(list(model.mazes), maze.maze_id)
+            if chosen != maze.maze_id:
+                log.info("game", "Difficulty: switching maze %s -> %s", maze.maze_id, chosen)
+                maze = model.mazes[chosen]
         
         # Prepare the configuration command
         config_command = {
             "type": "UPDATE_MAZE_CONFIG",
             "command": "UPDATE_MAZE_CONFIG",
-            **enabled_maze
+            **maze.message()
         }
         
         # Convert to JSON string
         json_str = json.dumps(config_command)
         
-        print(f"\n📤 Sending maze configuration:")
-        print(f"   Maze ID: {enabled_maze['maze_id']}")
-        print(f"   Name: {enabled_maze.get('name', 'Unknown')}")
-        print(f"   Start: ({enabled_maze.get('start_x')}, {enabled_maze.get('start_y')})")
-        print(f"   End: ({enabled_maze.get('end_x')}, {enabled_maze.get('end_y')})")
-        print(f"   JSON size: {len(json_str)} bytes")
+        log.info("config", "Sending maze configuration", maze_id=maze.maze_id, name=maze.name,
+                 start=(maze.start_x, maze.start_y), end=(maze.end_x, maze.end_y), size=len(json_str))
         
         # Publish to MQTT
         result = client.publish("rpi/to/esp3", json_str)
         
-        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-            print(f"✅ Maze config sent successfully")
+        active_maze_id = maze.maze_id
+        if result.rc in (MQTT_ERR_SUCCESS, MQTT_ERR_QUEUED):
+            log.info("config", "Maze config sent successfully")
         else:
-            print(f"❌ Failed to send maze config (error code: {result.rc})")
+            log.error("config", "Failed to send maze config (error code: %s)", result.rc)
     
     except Exception as e:
-        print(f"❌ Error sending maze config: {e}")
-        import traceback
-        traceback.print_exc()
+        log.error("config", "Error sending maze config: %s", e, exc_info=True)
+
+def create_client():
+    """The orchestrator connection: paho behind a ConnectionManager, other transports as they are"""
+    kind = os.environ.get("MQTT_TRANSPORT", "paho")
+    if kind != "paho":
+        return create_transport(kind)
+    return subsystem("connection_manager").ConnectionManager(lambda: create_transport(kind), BROKERS, log=log)
 
 def main():
-    client = mqtt.Client()
+    global outbound
+    client = outbound = subsystem("outbound").OutboundScheduler(create_client(), log=log)
     client.on_connect = on_connect
     client.on_message = on_message
-   
-    config = load_config()
-    print("Initial config loaded:", json.dumps(config, indent=2))
-   
-    print("\nAvailable commands:")
-    print("- start_all_games()")
-    print("- stop_all_games()")
-    print("- reset_all_games()")
-    print("- start_timer(duration=300)")
-    print("- add_x(reason='TEST')")
+    record_startup("transport_created")
    
     try:
-        client.connect(BROKER, 1883, 60)
-        print(f"\nConnecting to MQTT broker at {BROKER}:1883")
-       
-        import builtins
-        builtins.start_all_games = lambda: start_all_games(client)
-        builtins.stop_all_games = lambda: stop_all_games(client)
-        builtins.reset_all_games = lambda: reset_all_games(client)
-        builtins.start_timer = lambda duration=300: start_game_timer(client, duration)
-        builtins.add_x = lambda reason="MANUAL": send_x_to_display(client, reason)
+        # Connect and subscribe before anything else so booting modules
+        # get their handshakes answered straight away
+        client.connect(BROKER, BROKER_PORT, 60)
+        record_startup("connect_sent")
+        log.info("mqtt", "Connecting to MQTT broker at %s", ", ".join(f"{host}:{port}" for host, port in BROKERS))
+        # The control API is optional, start it once the config is known
+        preload_config_async(lambda config: start_services(client, config))
        
         client.loop_forever()
        
     except KeyboardInterrupt:
-        print("\nShutting down...")
+        log.info("mqtt", "Shutting down...")
         stop_all_games(client)
         client.disconnect()
     except Exception as e:
-        print(f"Connection error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.error("mqtt", "Connection error: %s", e, exc_info=True)
+    finally:
+        if session_store is not None:
+            session_store.close()
+        log.flush()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
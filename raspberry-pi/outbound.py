@@ -0,0 +1,305 @@
+"""
+Priority lanes for outbound commands.
+
+Everything the orchestrator publishes goes through an OutboundScheduler,
+which sorts it into one of four lanes:
+
+- critical: game control (GAME_OVER, VICTORY, STOP_GAME, PAUSE/RESUME,
+  activation, starts and resets)
+- feedback: gameplay feedback such as X, and anything else sent to a module
+- configuration: UPDATE_*_CONFIG pushes, config responses and acks
+- diagnostics: everything else
+
+A sender thread always takes from the highest non-empty lane, and inside
+a lane it takes from each module (command topic) in turn, so one module
+getting a burst of config pushes doesn't starve the others. Every lane is
+bounded. When a lane is full, the module with the most messages queued in
+it loses its oldest one.
+
+Some commands depend on what was sent before them: a round must not start
+before its tuned configs arrive, and a RESET_X must not be overtaken by an
+X sent before it. Those commands are fences. Anything still queued for the
+same module in a lower lane is moved into the fence's lane, ahead of it,
+so per-module order is kept where it matters.
+
+Lanes only help if messages wait in them rather than in the transport. The
+scheduler therefore hands messages over at most at `rate` bytes per second
+(roughly what the Wi-Fi link to the boards sustains). It does not buffer
+for a lost connection: while disconnected it passes messages straight on,
+and the ConnectionManager underneath keeps them in its OfflineBuffer,
+which collapses stale commands and sends the critical ones first after a
+reconnect.
+"""
+
+import collections
+import threading
+import time
+
+from connection_manager import command_type
+from transport import MQTT_ERR_NO_CONN, MQTT_ERR_QUEUED, MQTT_ERR_SUCCESS, PublishResult, Transport
+
+CRITICAL, FEEDBACK, CONFIGURATION, DIAGNOSTICS = range(4)
+LANE_NAMES = ("critical", "feedback", "configuration", "diagnostics")
+
+COMMAND_LANES = {
+    "GAME_OVER": CRITICAL,
+    "VICTORY": CRITICAL,
+    "STOP_GAME": CRITICAL,
+    "PAUSE_TIMER": CRITICAL,
+    "RESUME_TIMER": CRITICAL,
+    "ACTIVATE": CRITICAL,
+    "SYNCHRONIZED_START": CRITICAL,
+    "START_GAME": CRITICAL,
+    "START_TIMER": CRITICAL,
+    "RESET_GAME": CRITICAL,
+    "RESET_X": CRITICAL,
+    "X": FEEDBACK,
+    "UPDATE_BUTTON_CONFIG": CONFIGURATION,
+    "UPDATE_MAZE_CONFIG": CONFIGURATION,
+    "UPDATE_SETTINGS": CONFIGURATION,
+}
+
+TOPIC_LANES = {
+    "config/response": CONFIGURATION,
+    "config/ack": CONFIGURATION,
+}
+
+MODULE_TOPIC_PREFIX = "rpi/to/esp"
+
+# Commands that must not overtake anything queued before them for the same module
+FENCES = {"ACTIVATE", "SYNCHRONIZED_START", "START_GAME", "START_TIMER", "RESET_GAME", "RESET_X"}
+
+LANE_CAPACITY = {"critical": 256, "feedback": 256, "configuration": 64, "diagnostics": 64}
+
+
+def classify(topic, payload):
+    """(lane, command type) of an outbound message"""
+    command = command_type(payload)
+    if command in COMMAND_LANES:
+        return COMMAND_LANES[command], command
+    if topic in TOPIC_LANES:
+        return TOPIC_LANES[topic], command
+    if MODULE_TOPIC_PREFIX in topic:
+        return FEEDBACK, command
+    return DIAGNOSTICS, command
+
+
+class Lane:
+    """Bounded queue of one priority class, round-robin between modules"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.queues = collections.OrderedDict()  # module -> deque, in turn order
+        self.size = 0
+
+    def push(self, module, entry):
+        """Queue entry, returns the entry dropped to make room or None"""
+        queue = self.queues.get(module)
+        if queue is None:
+            queue = self.queues[module] = collections.deque()
+        queue.append(entry)
+        self.size += 1
+        if self.size <= self.capacity:
+            return None
+        # Full: the busiest module makes room, the one pushing wins ties
+        victim_module = max(self.queues, key=lambda other: (len(self.queues[other]), other == module))
+        victim_queue = self.queues[victim_module]
+        entry = victim_queue.popleft()
+        self.size -= 1
+        if not victim_queue:
+            del self.queues[victim_module]
+        # Losing a message doesn't cost the module its turn
+        return entry
+
+    def pop(self):
+        module = next(iter(self.queues))
+        return self._popleft(module)
+
+    def _popleft(self, module):
+        queue = self.queues.pop(module)
+        entry = queue.popleft()
+        self.size -= 1
+        if queue:
+            # Back of the line for this module
+            self.queues[module] = queue
+        return entry
+
+    def take(self, module):
+        """Remove and return everything queued for module"""
+        queue = self.queues.pop(module, None)
+        if not queue:
+            return []
+        self.size -= len(queue)
+        return list(queue)
+
+    def extend(self, module, entries):
+        """Queue entries moved in from another lane, ignoring the bound"""
+        if entries:
+            self.queues.setdefault(module, collections.deque()).extend(entries)
+            self.size += len(entries)
+
+
+class OutboundScheduler(Transport):
+    """Transport that sends publishes through priority lanes"""
+
+    def __init__(self, transport, rate=None, capacity=None, log=None, enabled=True, classify=classify):
+        super().__init__(transport.userdata)
+        self.transport = transport
+        self.classify = classify
+        transport.on_connect = self._handle_connect
+        transport.on_message = self._handle_message
+        transport.on_disconnect = self._handle_disconnect
+        self.log = log
+        self.lanes = []
+        self.stats = {"sent": [0] * len(LANE_NAMES), "dropped": [0] * len(LANE_NAMES), "promoted": 0}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._next_send = 0.0
+        self._in_flight = False
+        self.configure(enabled, rate, capacity)
+
+    def configure(self, enabled=True, rate=None, capacity=None):
+        """Apply settings, e.g. from the "outbound" config section"""
+        capacity = dict(LANE_CAPACITY, **(capacity or {}))
+        unknown = set(capacity) - set(LANE_NAMES)
+        if unknown:
+            raise ValueError(f"Unknown outbound lanes: {', '.join(sorted(unknown))}")
+        with self._cond:
+            self.enabled = bool(enabled)
+            self.rate = float(rate) if rate else None
+            if not self.lanes:
+                self.lanes = [Lane(int(capacity[name])) for name in LANE_NAMES]
+            for lane, name in zip(self.lanes, LANE_NAMES):
+                lane.capacity = int(capacity[name])
+            self._cond.notify_all()
+
+    # Callbacks from the wrapped transport
+    def _handle_connect(self, client, userdata, flags, rc):
+        if self.on_connect:
+            self.on_connect(self, self.userdata, flags, rc)
+        with self._cond:
+            self._cond.notify_all()
+
+    def _handle_message(self, client, userdata, msg):
+        if self.on_message:
+            self.on_message(self, self.userdata, msg)
+
+    def _handle_disconnect(self, client, userdata, rc):
+        if self.on_disconnect:
+            self.on_disconnect(self, self.userdata, rc)
+
+    # Transport interface
+    def connect(self, host, port=1883, keepalive=60):
+        self.start()
+        return self.transport.connect(host, port, keepalive)
+
+    def disconnect(self):
+        self.flush()
+        self.stop()
+        return self.transport.disconnect()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        if not self.enabled or not self._running:
+            return self.transport.publish(topic, payload, qos, retain, properties)
+        lane, command = self.classify(topic, payload)
+        entry = (topic, payload, qos, retain, properties)
+        with self._cond:
+            if command in FENCES:
+                for lower in range(lane + 1, len(self.lanes)):
+                    moved = self.lanes[lower].take(topic)
+                    self.lanes[lane].extend(topic, moved)
+                    self.stats["promoted"] += len(moved)
+            if self.lanes[lane].push(topic, entry) is not None:
+                self.stats["dropped"][lane] += 1
+                if self.log:
+                    self.log.warning("mqtt", "Outbound %s lane full, dropped a message for %s",
+                                     LANE_NAMES[lane], topic)
+            self._cond.notify()
+        return PublishResult(MQTT_ERR_QUEUED)
+
+    def subscribe(self, topic, qos=0):
+        return self.transport.subscribe(topic, qos)
+
+    def is_connected(self):
+        return self.transport.is_connected()
+
+    def loop_forever(self):
+        return self.transport.loop_forever()
+
+    def loop_start(self):
+        self.start()
+        return self.transport.loop_start()
+
+    def loop_stop(self):
+        self.stop()
+        return self.transport.loop_stop()
+
+    # Sending
+    def pending(self):
+        with self._cond:
+            return sum(lane.size for lane in self.lanes)
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._send_loop, name="outbound", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._running = False
+            self._cond.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def flush(self, timeout=1.0):
+        """Wait until every queued message has been handed over, True if it was"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._running and (self._in_flight or any(lane.size for lane in self.lanes)):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _next(self):
+        """Wait for a message that may go out now, None once stopped"""
+        with self._cond:
+            while self._running:
+                wait = None
+                # Offline, messages go to the transport's buffer without pacing
+                if self.rate and time.monotonic() < self._next_send and self.transport.is_connected():
+                    wait = self._next_send - time.monotonic()
+                else:
+                    for index, lane in enumerate(self.lanes):
+                        if lane.size:
+                            self._in_flight = True
+                            return index, lane.pop()
+                self._cond.wait(wait)
+            return None
+
+    def _send_loop(self):
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            lane, (topic, payload, qos, retain, properties) = item
+            try:
+                result = self.transport.publish(topic, payload, qos, retain, properties)
+                if getattr(result, "rc", MQTT_ERR_SUCCESS) == MQTT_ERR_NO_CONN and self.log:
+                    self.log.warning("mqtt", "Outbound publish to %s lost, not connected", topic)
+            except Exception as e:
+                if self.log:
+                    self.log.error("mqtt", "Outbound publish to %s failed: %s", topic, e)
+            with self._cond:
+                self.stats["sent"][lane] += 1
+                self._in_flight = False
+                if self.rate:
+                    size = len(topic) + len(payload or b"")
+                    self._next_send = max(self._next_send, time.monotonic()) + size / self.rate
+                self._cond.notify_all()
@@ -0,0 +1,213 @@
+"""
+On-demand profiling of a running orchestrator, triggered over MQTT.
+
+A request on `rpi/admin/profile` starts one bounded profiling session:
+
+- cProfile around every on_message call: the transport's on_message
+  callback is swapped for a profiling wrapper for the duration of the
+  session and swapped back afterwards, so there is no overhead at all
+  while no session is running
+- a sampling profiler that records the stacks of every thread (heartbeat
+  checks, log writer, control server, ...) every few milliseconds
+
+When the session ends it writes `<name>.pstats` and `<name>.collapsed`
+(one `thread;frame;frame count` line per stack, for flame graphs) and
+publishes a summary of the top functions by cumulative time and the time
+spent per topic on `rpi/admin/profile/result`. If the files can't be
+written the summary is published as a PROFILE_ERROR with the reason.
+
+Guards: only one session at a time, the duration is capped by
+`max_duration`, and a timer always ends the session.
+
+    {"duration": 10, "mode": "both", "top": 15}    start a session
+    {"action": "stop"}                              end it early
+"""
+
+import cProfile
+import collections
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+
+RESULT_TOPIC = "rpi/admin/profile/result"
+MODES = ("both", "cprofile", "sample")
+
+_active = None
+_active_lock = threading.Lock()
+
+
+def active_session():
+    return _active
+
+
+class ProfileSession:
+    """One bounded profiling session attached to a transport"""
+
+    def __init__(self, client, duration=10, mode="both", top=15, output_dir="profiles",
+                 sample_interval=0.005):
+        self.client = client
+        self.duration = duration
+        self.mode = mode
+        self.top = top
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.name = time.strftime("profile-%Y%m%d-%H%M%S")
+        self.profile = cProfile.Profile() if mode in ("both", "cprofile") else None
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.messages = 0
+        self.topics = {}
+        self.started = None
+        self.elapsed = None
+        self._original = None
+        # Reentrant: a stop request arrives through the profiled handler itself
+        self._handler_lock = threading.RLock()
+        self._done = threading.Event()
+        self._sampler = None
+        self._timer = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.profile is not None:
+            self._original = self.client.on_message
+            self.client.on_message = self._profiled_on_message
+        if self.mode in ("both", "sample"):
+            self._sampler = threading.Thread(target=self._sample_loop, name="profile-sampler", daemon=True)
+            self._sampler.start()
+        # The guard: whatever happens, the session ends
+        self._timer = threading.Timer(self.duration, self.stop)
+        self._timer.daemon = True
+        self._timer.start()
+        return self
+
+    def _profiled_on_message(self, client, userdata, msg):
+        with self._handler_lock:
+            if self._done.is_set():
+                return self._original(client, userdata, msg)
+            start = time.perf_counter()
+            try:
+                return self.profile.runcall(self._original, client, userdata, msg)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.messages += 1
+                count, total = self.topics.get(msg.topic, (0, 0.0))
+                self.topics[msg.topic] = (count + 1, total + elapsed)
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._done.wait(self.sample_interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        """End the session, write the output files and publish the summary"""
+        global _active
+        with self._handler_lock:
+            if self._done.is_set():
+                return None
+            self._done.set()
+            if self._original is not None:
+                self.client.on_message = self._original
+        self._timer.cancel()
+        if self._sampler is not None:
+            self._sampler.join(1)
+        self.elapsed = time.perf_counter() - self.started
+        with _active_lock:
+            if _active is self:
+                _active = None
+
+        # Runs on the timer thread, so a full or read-only disk must not end it silently
+        try:
+            summary = self.summary(self.write_files())
+        except OSError as e:
+            summary = self.summary({})
+            summary.update(type="PROFILE_ERROR", message=f"Could not write profile files: {e}")
+        self.client.publish(RESULT_TOPIC, json.dumps(summary))
+        return summary
+
+    def write_files(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        files = {}
+        if self.profile is not None:
+            files["pstats"] = os.path.join(self.output_dir, self.name + ".pstats")
+            self.profile.dump_stats(files["pstats"])
+        if self.stacks:
+            files["collapsed"] = os.path.join(self.output_dir, self.name + ".collapsed")
+            with open(files["collapsed"], "w") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        return files
+
+    def top_functions(self):
+        """Top functions by cumulative time inside on_message"""
+        if self.profile is None or not self.messages:
+            return []
+        stats = pstats.Stats(self.profile).stats
+        ranked = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+        top = []
+        for (filename, line, function), (_, calls, total, cumulative, _) in ranked[:self.top]:
+            top.append({
+                "function": f"{os.path.basename(filename)}:{line}({function})",
+                "calls": calls,
+                "cumulative_ms": round(cumulative * 1000, 3),
+                "own_ms": round(total * 1000, 3),
+            })
+        return top
+
+    def top_stacks(self):
+        """Most frequently sampled leaf frames per thread"""
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            leaves[f"{frames[0]};{frames[-1]}"] += count
+        return [{"frame": frame, "samples": count} for frame, count in leaves.most_common(self.top)]
+
+    def summary(self, files):
+        return {
+            "type": "PROFILE_RESULT",
+            "name": self.name,
+            "mode": self.mode,
+            "duration": round(self.elapsed, 3),
+            "messages": self.messages,
+            "topics": {
+                topic: {"messages": count, "total_ms": round(total * 1000, 3),
+                        "mean_us": round(total / count * 1e6, 1)}
+                for topic, (count, total) in sorted(self.topics.items(), key=lambda item: -item[1][1])
+            },
+            "top_functions": self.top_functions(),
+            "samples": self.samples,
+            "top_stacks": self.top_stacks(),
+            "files": files,
+        }
+
+
+def start_session(client, duration=10, max_duration=60, mode="both", **options):
+    """Start a session unless one is already running, returns it or None"""
+    global _active
+    if mode not in MODES:
+        raise ValueError(f"Unknown profiling mode: {mode}")
+    with _active_lock:
+        if _active is not None:
+            return None
+        _active = ProfileSession(client, max(0.0, min(float(duration), max_duration)), mode, **options)
+        session = _active
+    return session.start()
+
+
+def stop_session():
+    """End the running session early, returns its summary or None"""
+    session = _active
+    return session.stop() if session is not None else None
@@ -0,0 +1,143 @@
+"""
+Reconciles the orchestrator's view of each module against the state the
+module reports in its HEARTBEAT / GAME_STATUS messages.
+
+The orchestrator only learns about completions from single events
+(PUZZLE_COMPLETED, MAZE_COMPLETED, BUTTON_GAME_WON). If one of those is lost
+the game can never reach VICTORY. Every heartbeat already carries the
+module's flags, so each one is compared against what we expect for that
+module alone and any drift is turned into a correction action.
+
+After a reset a module can still report the previous round's completion
+flag until it has processed RESET. So a module that was completed is
+expected to acknowledge the reset first, with a report that shows it not
+completed, and until then its completion flag is ignored.
+"""
+
+# Field names differ per firmware, so map them once here
+COMPLETED_FIELDS = {
+    "wire": "game_completed",
+    "maze": "game_won",
+    "button": "game_won",
+}
+
+PAUSED_FIELDS = {
+    "wire": "game_paused",
+    "maze": "game_paused",
+    "button": "game_paused",
+    "display": "paused",
+}
+
+# Command we resend when a module disagrees with the expected pause state
+PAUSE_COMMANDS = {
+    True: "PAUSE_TIMER",
+    False: "RESUME_TIMER",
+}
+
+
+class ModuleExpectation:
+    """Expected state of a single module as driven by the orchestrator"""
+
+    __slots__ = ("completed", "paused", "track_pause", "mismatch_streak", "reported_completed", "reset_pending")
+
+    def __init__(self):
+        self.completed = False
+        self.paused = False
+        self.track_pause = False
+        self.mismatch_streak = 0
+        self.reported_completed = False
+        self.reset_pending = False
+
+
+class Reconciler:
+    """Per-module expected state machine compared against reported state"""
+
+    def __init__(self, modules, mismatch_threshold=2):
+        self.mismatch_threshold = mismatch_threshold
+        self.expected = {module: ModuleExpectation() for module in modules}
+        self.outcome = None
+        self.corrections = 0
+        self.corrections_by_kind = {}
+
+    def reset(self):
+        """Forget all expectations - called when a new round starts"""
+        for state in self.expected.values():
+            # Only a module that was completed can report a stale completion
+            state.reset_pending = state.completed or state.reported_completed
+            state.completed = False
+            state.paused = False
+            state.track_pause = False
+            state.mismatch_streak = 0
+        self.outcome = None
+
+    def mark_completed(self, module):
+        """Record a completion the orchestrator learned about from an event"""
+        state = self.expected.get(module)
+        if state is not None:
+            state.completed = True
+            state.reset_pending = False
+
+    def expect_paused(self, module, paused):
+        """Record that a pause/resume command was sent to this module"""
+        state = self.expected.get(module)
+        if state is not None:
+            state.paused = paused
+            state.track_pause = True
+            state.mismatch_streak = 0
+
+    def expect_outcome(self, outcome):
+        """Record the final VICTORY / GAME_OVER command sent to all modules"""
+        self.outcome = outcome
+
+    def observe(self, module, report):
+        """
+        Compare one status report (a decoded HEARTBEAT or GAME_STATUS record)
+        with the expected state for that module. Fields the firmware did not
+        send are None.
+
+        Returns a list of (action, module, argument) tuples. Actions are
+        "accept_completion" (the module finished but we missed the event)
+        and "resend" (argument is the command type to send again).
+        """
+        state = self.expected.get(module)
+        if state is None:
+            return []
+
+        actions = []
+
+        completed_field = COMPLETED_FIELDS.get(module)
+        reported_completed = getattr(report, completed_field, None) if completed_field else None
+        if reported_completed is not None:
+            state.reported_completed = bool(reported_completed)
+            if state.reset_pending:
+                # Still the previous round's flag until the module shows it was reset
+                state.reset_pending = bool(reported_completed)
+            elif reported_completed and not state.completed:
+                # The module is authoritative about its own puzzle
+                state.completed = True
+                actions.append(("accept_completion", module, None))
+
+        mismatch = None
+        paused_field = PAUSED_FIELDS.get(module)
+        reported_paused = getattr(report, paused_field, None)
+        if module == "display" and self.outcome is not None and getattr(report, "active", None):
+            # Display is still counting down after the game ended
+            mismatch = self.outcome
+        elif state.track_pause and reported_paused is not None:
+            if reported_paused != state.paused:
+                mismatch = PAUSE_COMMANDS[state.paused]
+
+        if mismatch is None:
+            state.mismatch_streak = 0
+        else:
+            # Require the drift to persist so an in-flight command can land first
+            state.mismatch_streak += 1
+            if state.mismatch_streak >= self.mismatch_threshold:
+                state.mismatch_streak = 0
+                actions.append(("resend", module, mismatch))
+
+        for action, _, _ in actions:
+            self.corrections += 1
+            self.corrections_by_kind[action] = self.corrections_by_kind.get(action, 0) + 1
+
+        return actions
@@ -0,0 +1,215 @@
+"""
+Ring-buffered structured logging for the orchestrator.
+
+Records are appended to an in-memory ring buffer and written out by a
+background thread, so the MQTT callback thread never blocks on stdout, the
+systemd journal or a slow serial console. Every category has two levels:
+
+- the capture level decides what is kept in the ring buffer at all
+- the output level decides what the background writer prints
+
+Records between the two are kept but never printed unless dump() is called,
+for example when a game ends in GAME_OVER. Messages are formatted lazily, so
+a captured-but-not-printed record costs little more than a tuple append.
+"""
+
+import collections
+import sys
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+
+LEVELS = {
+    "debug": DEBUG,
+    "info": INFO,
+    "warning": WARNING,
+    "error": ERROR,
+}
+
+LEVEL_NAMES = {value: name.upper() for name, value in LEVELS.items()}
+
+# Output levels per category, anything below is only kept for dumps
+DEFAULT_LEVELS = {
+    "raw": WARNING,
+    "heartbeat": WARNING,
+    "game": INFO,
+    "config": INFO,
+    "mqtt": INFO,
+}
+
+
+def parse_level(level):
+    """Accept either a level name or a numeric level"""
+    if isinstance(level, str):
+        return LEVELS[level.lower()]
+    return int(level)
+
+
+class LogRecord:
+    """A single structured log record, formatted only when written"""
+
+    __slots__ = ("timestamp", "category", "level", "message", "args", "fields", "exc_info")
+
+    def __init__(self, timestamp, category, level, message, args, fields, exc_info):
+        self.timestamp = timestamp
+        self.category = category
+        self.level = level
+        self.message = message
+        self.args = args
+        self.fields = fields
+        self.exc_info = exc_info
+
+    def format(self):
+        message = self.message % self.args if self.args else self.message
+        clock = time.strftime("%H:%M:%S", time.localtime(self.timestamp))
+        line = f"{clock}.{int(self.timestamp * 1000) % 1000:03d} [{self.category}] {LEVEL_NAMES.get(self.level, self.level)} {message}"
+        if self.fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in self.fields.items())
+        if self.exc_info:
+            import traceback
+            line += "\n" + "".join(traceback.format_exception(*self.exc_info)).rstrip()
+        return line
+
+
+class LogDump:
+    """A block of records queued by dump(), written by the writer thread"""
+
+    __slots__ = ("title", "records")
+
+    def __init__(self, title, records):
+        self.title = title
+        self.records = records
+
+    def format(self):
+        header = f"=== {self.title}: last {len(self.records)} records ==="
+        lines = [header]
+        lines.extend(record.format() for record in self.records)
+        lines.append("=" * len(header))
+        return "\n".join(lines)
+
+
+class RingLog:
+    """Ring buffer of log records drained by a background writer thread"""
+
+    def __init__(self, capacity=2048, levels=None, capture_level=DEBUG, stream=None, flush_interval=0.05):
+        self.capture_level = capture_level
+        self.flush_interval = flush_interval
+        self.levels = dict(DEFAULT_LEVELS)
+        if levels:
+            self.set_levels(levels)
+        self.default_level = INFO
+        self.stream = stream
+        self._history = collections.deque(maxlen=capacity)
+        self._pending = collections.deque(maxlen=capacity)
+        self._wakeup = threading.Event()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        # Guards swapping the deques in resize() against appends and snapshots
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def set_levels(self, levels):
+        """Update output levels from a {category: level} mapping"""
+        for category, level in levels.items():
+            self.levels[category] = parse_level(level)
+
+    def resize(self, capacity):
+        """Change the ring buffer size, keeping the most recent records"""
+        with self._lock:
+            self._history = collections.deque(self._history, maxlen=capacity)
+            self._pending = collections.deque(self._pending, maxlen=capacity)
+
+    def is_enabled_for(self, category, level):
+        """True if a record at this level would be printed"""
+        return level >= self.levels.get(category, self.default_level)
+
+    def log(self, category, level, message, *args, exc_info=None, **fields):
+        if level < self.capture_level:
+            return
+        if exc_info is True:
+            exc_info = sys.exc_info()
+        record = LogRecord(time.time(), category, level, message, args, fields, exc_info)
+        if level >= self.levels.get(category, self.default_level):
+            with self._lock:
+                self._history.append(record)
+                self._queue(record)
+            self._wake_writer()
+        else:
+            with self._lock:
+                self._history.append(record)
+
+    def _queue(self, item):
+        """Append to the pending queue, the caller holds _lock"""
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1
+        self._pending.append(item)
+
+    def _wake_writer(self):
+        if self._writer is None:
+            self._start_writer()
+        if not self._wakeup.is_set():
+            self._wakeup.set()
+
+    def debug(self, category, message, *args, **fields):
+        self.log(category, DEBUG, message, *args, **fields)
+
+    def info(self, category, message, *args, **fields):
+        self.log(category, INFO, message, *args, **fields)
+
+    def warning(self, category, message, *args, **fields):
+        self.log(category, WARNING, message, *args, **fields)
+
+    def error(self, category, message, *args, **fields):
+        self.log(category, ERROR, message, *args, **fields)
+
+    def _start_writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="ringlog-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        while True:
+            self._wakeup.wait()
+            # Let a burst accumulate so it is written with a single call
+            time.sleep(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """Write out every pending record on the calling thread"""
+        stream = self.stream or sys.stdout
+        lines = []
+        while True:
+            try:
+                record = self._pending.popleft()
+            except IndexError:
+                break
+            lines.append(record.format())
+        if lines:
+            try:
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            except (OSError, ValueError):
+                pass
+
+    def recent(self, count=100):
+        """Return the last `count` captured records, oldest first"""
+        with self._lock:
+            history = list(self._history)
+        return history[-count:] if count else history
+
+    def dump(self, count=100, title="LOG DUMP"):
+        """
+        Queue the last `count` captured records for writing regardless of
+        output level. The caller only takes a snapshot, formatting and
+        writing happen on the writer thread.
+        """
+        with self._lock:
+            history = list(self._history)
+            self._queue(LogDump(title, history[-count:] if count else history))
+        self._wake_writer()
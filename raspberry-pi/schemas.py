@@ -0,0 +1,226 @@
+"""
+Message schema registry for everything the ESP32 firmwares send.
+
+Each message type declares its fields once, with a kind and a default. At
+import time every schema is compiled into a straight-line decoder function
+that checks and converts each field and returns a typed record (a
+namedtuple with `type` as its first field). No per-message loops over the
+schema, no isinstance() chains and no exceptions on the hot path.
+
+Payloads that are not JSON, not a JSON object, of an unknown type or with a
+field of the wrong kind are counted and dropped.
+"""
+
+import collections
+import json
+
+# Field kinds. "int" accepts JSON integers (and floats, truncated),
+# "number" any JSON number, "bool" only true/false, "str" only strings.
+INT = "int"
+NUMBER = "number"
+BOOL = "bool"
+STR = "str"
+
+# Fields shared by most firmware messages
+_COMMON = {
+    "device": (STR, "Unknown"),
+    "message": (STR, ""),
+    "timestamp": (INT, 0),
+}
+
+_DISPLAY_STATUS = dict(_COMMON, x_count=(INT, 0), max_x_count=(INT, 3))
+
+_WIRE_STATUS = dict(
+    _COMMON,
+    game_active=(BOOL, None),
+    game_completed=(BOOL, None),
+    game_paused=(BOOL, None),
+    current_step=(INT, None),
+    total_steps=(INT, None),
+    wrong_cuts=(INT, None),
+)
+
+_MAZE_EVENT = dict(_COMMON, maze_id=(STR, None))
+
+_BUTTON_RESULT = dict(
+    _COMMON,
+    button_id=(STR, None),
+    press_duration=(INT, 0),
+    target_time=(INT, 0),
+    buffer=(INT, None),
+    difference=(INT, 0),
+)
+
+SCHEMAS = {
+    # Sent by every module every few seconds once activated
+    "HEARTBEAT": dict(
+        _COMMON,
+        game_active=(BOOL, None),
+        game_completed=(BOOL, None),
+        game_won=(BOOL, None),
+        game_paused=(BOOL, None),
+        active=(BOOL, None),
+        paused=(BOOL, None),
+        maze_id=(STR, None),
+        button_id=(STR, None),
+        target_time=(INT, None),
+        config_received=(BOOL, None),
+    ),
+    "GAME_STATUS": dict(
+        _WIRE_STATUS,
+        games_completed=(INT, None),
+        current_instruction=(STR, None),
+        required_wire_color=(STR, None),
+    ),
+
+    # Connection handshakes and config requests
+    "DISPLAY_CONNECTED": _DISPLAY_STATUS,
+    "WIRE_MODULE_CONNECTED": _WIRE_STATUS,
+    "MAZE_MODULE_CONNECTED": dict(_MAZE_EVENT, config_received=(BOOL, None)),
+    "BUTTON_MODULE_CONNECTED": dict(
+        _COMMON,
+        button_id=(STR, None),
+        target_time=(INT, 2000),
+        buffer=(INT, 500),
+        enabled=(BOOL, None),
+    ),
+    "REQUEST_MAZE_CONFIG": _COMMON,
+    "REQUEST_BUTTON_CONFIG": _COMMON,
+    "MAZE_CONFIG_UPDATED": dict(_MAZE_EVENT, maze_name=(STR, None), config_received=(BOOL, None)),
+    "BUTTON_CONFIG_UPDATED": dict(
+        _COMMON,
+        button_id=(STR, None),
+        target_time=(INT, None),
+        buffer=(INT, None),
+        enabled=(BOOL, None),
+    ),
+    "DISPLAY_ACTIVATED": _DISPLAY_STATUS,
+    "MODULE_ACTIVATED": _COMMON,
+
+    # Display
+    "TIMER_STARTED": _DISPLAY_STATUS,
+    "TIMER_STOPPED": _DISPLAY_STATUS,
+    "TIMER_PAUSED": _DISPLAY_STATUS,
+    "TIMER_RESUMED": _DISPLAY_STATUS,
+    "TIMER_FINISHED": _DISPLAY_STATUS,
+    "X_ADDED": _DISPLAY_STATUS,
+    "X_RESET": _DISPLAY_STATUS,
+    "X_LIMIT_REACHED": _DISPLAY_STATUS,
+    "MAX_X_REACHED": _DISPLAY_STATUS,
+
+    # Wire
+    "WRONG_CUT_ALERT": dict(
+        _COMMON,
+        wrong_wire_cut=(STR, "Unknown"),
+        expected_wire=(STR, "Unknown"),
+        current_step=(INT, None),
+        total_steps=(INT, None),
+    ),
+    "PUZZLE_COMPLETED": _WIRE_STATUS,
+    "GAME_STARTED": _WIRE_STATUS,
+    "GAME_STOPPED": _WIRE_STATUS,
+    "GAME_RESET": _WIRE_STATUS,
+    "WIRE_GAME_PAUSED": _WIRE_STATUS,
+    "WIRE_GAME_RESUMED": _WIRE_STATUS,
+
+    # Maze
+    "WALL_HIT": dict(_MAZE_EVENT, position_x=(INT, None), position_y=(INT, None)),
+    "MAZE_COMPLETED": dict(_MAZE_EVENT, maze_name=(STR, None), time=(INT, None)),
+    "GAME_RESTART": _MAZE_EVENT,
+    "MAZE_PAUSED": _MAZE_EVENT,
+    "MAZE_RESUMED": _MAZE_EVENT,
+
+    # Button
+    "BUTTON_GAME_WON": _BUTTON_RESULT,
+    "BUTTON_GAME_LOST": _BUTTON_RESULT,
+    "BUTTON_GAME_PAUSED": _COMMON,
+    "BUTTON_GAME_RESUMED": _COMMON,
+}
+
+# Source snippets that check and convert a value `v` into `f_<name>`
+_CHECKS = {
+    INT: (
+        "    elif v.__class__ is int: f_{name} = v\n"
+        # Comparisons are False for NaN, so NaN and +-Infinity are rejected
+        "    elif v.__class__ is float and -9.2e18 < v < 9.2e18: f_{name} = int(v)\n"
+    ),
+    NUMBER: (
+        "    elif v.__class__ is int or v.__class__ is float: f_{name} = v\n"
+    ),
+    BOOL: (
+        "    elif v.__class__ is bool: f_{name} = v\n"
+    ),
+    STR: (
+        "    elif v.__class__ is str: f_{name} = v\n"
+    ),
+}
+
+
+def record_name(msg_type):
+    """CamelCase record class name for a message type"""
+    return "".join(part.capitalize() for part in msg_type.split("_")) + "Record"
+
+
+def compile_decoder(msg_type, fields):
+    """Compile a schema into (record class, decoder function)"""
+    names = list(fields)
+    record = collections.namedtuple(record_name(msg_type), ["type"] + names)
+    lines = [f"def decode_{msg_type}(data):\n", "    get = data.get\n"]
+    # tuple.__new__ skips the Python-level namedtuple constructor
+    namespace = {"_Record": record, "_new": tuple.__new__}
+    for index, name in enumerate(names):
+        kind, default = fields[name]
+        namespace[f"_default_{index}"] = default
+        lines.append(f"    v = get({name!r})\n")
+        lines.append(f"    if v is None: f_{name} = _default_{index}\n")
+        lines.append(_CHECKS[kind].format(name=name))
+        lines.append("    else: return None\n")
+    args = ", ".join([repr(msg_type)] + [f"f_{name}" for name in names])
+    lines.append(f"    return _new(_Record, ({args},))\n")
+    exec("".join(lines), namespace)
+    return record, namespace[f"decode_{msg_type}"]
+
+
+class SchemaRegistry:
+    """Compiled decoders for every known message type, with drop counters"""
+
+    def __init__(self, schemas=None):
+        self.schemas = schemas if schemas is not None else SCHEMAS
+        self.records = {}
+        self.decoders = {}
+        for msg_type, fields in self.schemas.items():
+            self.records[msg_type], self.decoders[msg_type] = compile_decoder(msg_type, fields)
+        self.counters = {
+            "decoded": 0,
+            "invalid_json": 0,
+            "not_object": 0,
+            "unknown_type": 0,
+            "invalid_fields": 0,
+        }
+
+    @property
+    def dropped(self):
+        return sum(count for name, count in self.counters.items() if name != "decoded")
+
+    def decode(self, payload):
+        """Decode a raw payload (bytes or str) into a typed record, or None"""
+        try:
+            data = json.loads(payload)
+        except (ValueError, TypeError):
+            # JSONDecodeError and UnicodeDecodeError are both ValueErrors
+            self.counters["invalid_json"] += 1
+            return None
+        if data.__class__ is not dict:
+            self.counters["not_object"] += 1
+            return None
+        msg_type = data.get("type")
+        decoder = self.decoders.get(msg_type) if msg_type.__class__ is str else None
+        if decoder is None:
+            self.counters["unknown_type"] += 1
+            return None
+        record = decoder(data)
+        if record is None:
+            self.counters["invalid_fields"] += 1
+            return None
+        self.counters["decoded"] += 1
+        return record
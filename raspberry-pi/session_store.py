@@ -0,0 +1,211 @@
+"""
+Persistent session store and leaderboard on SQLite.
+
+One row per game in `sessions` and one row per notable event (X marks,
+wrong cuts, wall hits, completions) in `events`. The database runs in WAL
+mode so leaderboard reads never wait for the writer, and all writes go
+through a queue drained by a single background thread that commits in
+batches - the MQTT callback thread only ever appends to that queue.
+
+Leaderboard queries walk an index ordered by solve time (with ended_at in
+the index for date filters), so a top-N query reads N index entries and N
+rows, plus whatever the date range skips, no matter how many sessions are
+stored.
+"""
+
+import queue
+import sqlite3
+import threading
+
+from ringlog import RingLog
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    rig TEXT,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    outcome TEXT,
+    maze_id TEXT,
+    button_id TEXT,
+    duration INTEGER,
+    elapsed REAL,
+    time_remaining INTEGER,
+    x_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    elapsed REAL,
+    type TEXT NOT NULL,
+    module TEXT,
+    x_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS sessions_leaderboard_combo
+    ON sessions (outcome, maze_id, button_id, elapsed, ended_at);
+CREATE INDEX IF NOT EXISTS sessions_leaderboard_all
+    ON sessions (outcome, elapsed, ended_at);
+CREATE INDEX IF NOT EXISTS events_session
+    ON events (session_id, elapsed);
+"""
+
+INSERT_SESSION = (
+    "INSERT INTO sessions (id, rig, started_at, maze_id, button_id, duration) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+END_SESSION = (
+    "UPDATE sessions SET ended_at = ?, outcome = ?, elapsed = ?, time_remaining = ?, x_count = ? "
+    "WHERE id = ?"
+)
+INSERT_EVENT = (
+    "INSERT INTO events (session_id, timestamp, elapsed, type, module, x_count) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+LEADERBOARD_COLUMNS = ("session_id", "rig", "maze_id", "button_id", "elapsed",
+                       "time_remaining", "x_count", "ended_at")
+
+
+def connect(path):
+    """Open a connection with the pragmas every connection needs"""
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # WAL with synchronous=NORMAL only risks the last batch on power loss
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+class SessionStore:
+    """SQLite session/event store written from a batching background thread"""
+
+    def __init__(self, path="sessions.db", batch_size=256, log=None):
+        self.path = path
+        self.batch_size = batch_size
+        self.log = log or RingLog()
+        self.batches = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self._queue = queue.Queue()
+        self._id_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._reader = connect(path)
+        self._reader.executescript(SCHEMA)
+        self._sessions = {}
+        # Session ids are handed out here so events can be queued before
+        # the session row itself has been written
+        self._next_id = (self._reader.execute("SELECT MAX(id) FROM sessions").fetchone()[0] or 0) + 1
+        self._writer = threading.Thread(target=self._write_loop, name="session-writer", daemon=True)
+        self._writer.start()
+
+    def begin_session(self, started_at, maze_id=None, button_id=None, duration=None, rig=None):
+        """Queue a new session row and return its id"""
+        with self._id_lock:
+            session_id = self._next_id
+            self._next_id += 1
+        self._sessions[session_id] = started_at
+        self._queue.put((INSERT_SESSION, (session_id, rig, started_at, maze_id, button_id, duration)))
+        return session_id
+
+    def record_event(self, session_id, msg_type, timestamp, module=None, x_count=None):
+        """Queue one event for a session"""
+        started_at = self._sessions.get(session_id)
+        elapsed = timestamp - started_at if started_at is not None else None
+        self._queue.put((INSERT_EVENT, (session_id, timestamp, elapsed, msg_type, module, x_count)))
+
+    def end_session(self, session_id, outcome, ended_at, time_remaining=None, x_count=None):
+        """Queue the final outcome of a session"""
+        started_at = self._sessions.pop(session_id, None)
+        elapsed = ended_at - started_at if started_at is not None else None
+        self._queue.put((END_SESSION, (ended_at, outcome, elapsed, time_remaining, x_count, session_id)))
+
+    def _write_loop(self):
+        connection = connect(self.path)
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(connection, batch)
+            for _ in batch:
+                self._queue.task_done()
+            if batch[-1] is None:
+                connection.close()
+                return
+
+    def _write_batch(self, connection, batch):
+        # Group consecutive rows of the same statement into one executemany
+        groups = []
+        for item in batch:
+            if item is None:
+                continue
+            sql, row = item
+            if groups and groups[-1][0] == sql:
+                groups[-1][1].append(row)
+            else:
+                groups.append((sql, [row]))
+        if not groups:
+            return
+        try:
+            with connection:
+                for sql, rows in groups:
+                    connection.executemany(sql, rows)
+        except sqlite3.Error as e:
+            # Losing one batch of history must never take the game down
+            dropped = sum(len(rows) for _, rows in groups)
+            self.rows_dropped += dropped
+            self.log.error("game", "Session store dropped a batch of %d rows: %s", dropped, e,
+                           rows_dropped=self.rows_dropped)
+            return
+        self.batches += 1
+        self.rows_written += sum(len(rows) for _, rows in groups)
+
+    def flush(self):
+        """Block until everything queued so far has been committed"""
+        self._queue.join()
+
+    def close(self):
+        """Write out pending rows and stop the writer thread"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(5)
+        self._reader.close()
+
+    def leaderboard(self, limit=10, maze_id=None, button_id=None, since=None, until=None):
+        """Fastest VICTORY sessions, optionally for one puzzle combination and date range"""
+        conditions = ["outcome = 'VICTORY'"]
+        params = []
+        if maze_id is not None:
+            conditions.append("maze_id = ?")
+            params.append(maze_id)
+        if button_id is not None:
+            conditions.append("button_id = ?")
+            params.append(button_id)
+        if since is not None:
+            conditions.append("ended_at >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("ended_at < ?")
+            params.append(until)
+        sql = (
+            "SELECT id, rig, maze_id, button_id, elapsed, time_remaining, x_count, ended_at "
+            "FROM sessions WHERE " + " AND ".join(conditions) + " ORDER BY elapsed LIMIT ?"
+        )
+        params.append(limit)
+        with self._read_lock:
+            rows = self._reader.execute(sql, params).fetchall()
+        return [dict(zip(LEADERBOARD_COLUMNS, row)) for row in rows]
+
+    def session_events(self, session_id):
+        """All events of one session in game order"""
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT type, module, elapsed, x_count FROM events WHERE session_id = ? ORDER BY elapsed",
+                (session_id,)).fetchall()
+        return [{"type": t, "module": m, "elapsed": e, "x_count": x} for t, m, e, x in rows]
+
+    def session_count(self):
+        with self._read_lock:
+            return self._reader.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
@@ -0,0 +1,442 @@
+"""
+Sharded deployment: one front process routes each rig's topics to one of N
+worker processes, so message parsing, game logic and logging for different
+rooms run on different cores instead of sharing one GIL.
+
+Every rig publishes under its own prefix, `rooms/<room_id>/esp3/to/rpi`
+and so on, and receives its commands on `rooms/<room_id>/rpi/to/esp3`. The
+front subscribes to the inbound room topics, picks the worker for a room by
+consistent hashing of the room ID and forwards messages in small batches.
+
+The firmware only knows the bare topics (`esp3/to/rpi`, `rpi/to/esp3`), so
+each rig keeps its own broker and a bridge maps its topics onto the room
+prefix on the central broker. That is either a mosquitto bridge on the
+rig's Pi, with the section written by mosquitto_bridge_config(), or a
+RoomBridge between the two brokers:
+
+    connection room-escape-1
+    address central.local:1883
+    topic esp3/to/rpi out 0 "" rooms/escape-1/
+    topic rpi/to/# in 0 "" rooms/escape-1/
+    ...
+
+A room is pinned to its worker for as long as the worker set is unchanged.
+Inside the worker each room gets its own instance of the orchestrator
+module: mqtt is imported once per room as `mqtt@<room_id>` and registered
+in sys.modules like any other module, so the game state that lives in
+module globals stays isolated per room without any changes to mqtt.py.
+Closing a room stops its jobs and unregisters the instance.
+
+Global metrics live in shared memory: one row of counters per worker, only
+written by that worker, summed by whoever reads them.
+
+    python sharding.py [workers]
+"""
+
+import bisect
+import hashlib
+import importlib.util
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from ringlog import RingLog
+from transport import Message, create_transport, get_broker_address
+
+ROOM_PREFIX = "rooms/"
+
+# Topics the orchestrator subscribes to, relative to the room prefix
+# (mqtt.INBOUND_TOPICS, not imported here to keep the front process light)
+INBOUND_TOPICS = (
+    "esp/to/rpi",
+    "esp2/to/rpi",
+    "esp3/to/rpi",
+    "esp4/to/rpi",
+    "config/request",
+    "config/update",
+    "rpi/admin/profile",
+)
+
+# Topics the orchestrator publishes, relative to the room prefix
+OUTBOUND_TOPICS = (
+    "rpi/to/#",
+    "config/response",
+    "config/ack",
+    "rpi/admin/profile/result",
+)
+
+ORCHESTRATOR_MODULE = "mqtt"
+
+COUNTER_NAMES = ("messages", "batches", "rooms", "suppressed")
+
+
+def stable_hash(key):
+    """64-bit hash that is the same in every process (unlike hash())"""
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes, replicas=100):
+        self.replicas = replicas
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for replica in range(self.replicas):
+            point = stable_hash(f"{node}#{replica}")
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove(self, node):
+        keep = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in keep]
+        self._owners = [owner for _, owner in keep]
+
+    def node_for(self, key):
+        index = bisect.bisect(self._points, stable_hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+class SharedCounters:
+    """Per-worker counters in shared memory, written without locks"""
+
+    def __init__(self, workers, names=COUNTER_NAMES):
+        self.workers = workers
+        self.names = names
+        self._offsets = {name: index for index, name in enumerate(names)}
+        self.values = multiprocessing.RawArray("q", workers * len(names))
+
+    def add(self, worker, name, amount=1):
+        # Only worker `worker` ever writes its own row
+        self.values[worker * len(self.names) + self._offsets[name]] += amount
+
+    def set(self, worker, name, value):
+        self.values[worker * len(self.names) + self._offsets[name]] = value
+
+    def get(self, worker, name):
+        return self.values[worker * len(self.names) + self._offsets[name]]
+
+    def total(self, name):
+        return sum(self.get(worker, name) for worker in range(self.workers))
+
+    def totals(self):
+        return {name: self.total(name) for name in self.names}
+
+
+def split_room_topic(topic):
+    """Split `rooms/<room_id>/<topic>` into (room_id, topic), or (None, None)"""
+    if not topic.startswith(ROOM_PREFIX):
+        return None, None
+    room_id, _, inner = topic[len(ROOM_PREFIX):].partition("/")
+    if not room_id or inner not in INBOUND_TOPICS:
+        return None, None
+    return room_id, inner
+
+
+def orchestrator_name(room_id):
+    return f"{ORCHESTRATOR_MODULE}@{room_id}"
+
+
+def load_orchestrator(room_id):
+    """Import a fresh instance of the orchestrator module for one room"""
+    name = orchestrator_name(room_id)
+    origin = importlib.util.find_spec(ORCHESTRATOR_MODULE).origin
+    spec = importlib.util.spec_from_file_location(name, origin)
+    module = importlib.util.module_from_spec(spec)
+    # Registered before it runs, as the import system does
+    sys.modules[name] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules[name]
+        raise
+    return module
+
+
+def unload_orchestrator(room_id):
+    sys.modules.pop(orchestrator_name(room_id), None)
+
+
+def mosquitto_bridge_config(room_id, address, port=1883):
+    """mosquitto.conf section bridging a rig's bare topics to its room prefix"""
+    prefix = f"{ROOM_PREFIX}{room_id}/"
+    lines = [f"connection room-{room_id}", f"address {address}:{port}"]
+    lines += [f'topic {topic} out 0 "" {prefix}' for topic in INBOUND_TOPICS]
+    lines += [f'topic {topic} in 0 "" {prefix}' for topic in OUTBOUND_TOPICS]
+    return "\n".join(lines) + "\n"
+
+
+class RoomBridge:
+    """Relays one rig's bare topics to and from its room prefix
+
+    `local` is connected to the rig's own broker, `central` to the broker
+    the sharded orchestrator listens on.
+    """
+
+    def __init__(self, room_id, local, central):
+        self.prefix = f"{ROOM_PREFIX}{room_id}/"
+        self.local = local
+        self.central = central
+        self.relayed = 0
+        local.on_connect = self._local_connected
+        local.on_message = self._from_local
+        central.on_connect = self._central_connected
+        central.on_message = self._from_central
+
+    def _local_connected(self, client, userdata, flags, rc):
+        if rc == 0:
+            for topic in INBOUND_TOPICS:
+                client.subscribe(topic, 0)
+
+    def _central_connected(self, client, userdata, flags, rc):
+        if rc == 0:
+            for topic in OUTBOUND_TOPICS:
+                client.subscribe(self.prefix + topic, 0)
+
+    def _from_local(self, client, userdata, msg):
+        self.central.publish(self.prefix + msg.topic, msg.payload, msg.qos)
+        self.relayed += 1
+
+    def _from_central(self, client, userdata, msg):
+        self.local.publish(msg.topic[len(self.prefix):], msg.payload, msg.qos)
+        self.relayed += 1
+
+
+class RoomClient:
+    """Transport facade for one room that prefixes every published topic"""
+
+    def __init__(self, transport, room_id):
+        self.transport = transport
+        self.prefix = f"{ROOM_PREFIX}{room_id}/"
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        return self.transport.publish(self.prefix + topic, payload, qos, retain, properties)
+
+    def respond(self, request, topic, payload, qos=0):
+        # Batches carry no v5 properties, replies go to the room's fixed topic
+        return self.publish(topic, payload, qos)
+
+    def subscribe(self, topic, qos=0):
+        # The front process owns all subscriptions
+        return 0, 0
+
+    def is_connected(self):
+        return self.transport.is_connected()
+
+
+class Room:
+    __slots__ = ("room_id", "orchestrator", "client", "heartbeat_job")
+
+    def __init__(self, room_id, orchestrator, client):
+        self.room_id = room_id
+        self.orchestrator = orchestrator
+        self.client = client
+        self.heartbeat_job = None
+
+
+class WorkerShard:
+    """The rooms pinned to one worker process"""
+
+    def __init__(self, index, transport, counters, config_file="config.json", log=None, heartbeats=True):
+        self.index = index
+        self.transport = transport
+        self.counters = counters
+        self.config_file = config_file
+        self.log = log or RingLog()
+        self.heartbeats = heartbeats
+        self.rooms = {}
+
+    def open_room(self, room_id):
+        orchestrator = load_orchestrator(room_id)
+        orchestrator.CONFIG_FILE = self.config_file
+        # One writer thread per worker instead of one per room
+        orchestrator.log = orchestrator.clock.log = self.log
+        room = Room(room_id, orchestrator, RoomClient(self.transport, room_id))
+        if self.heartbeats:
+            room.heartbeat_job = orchestrator.clock.every(
+                orchestrator.HEARTBEAT_INTERVAL, orchestrator.check_heartbeats_once, room.client,
+                name=f"heartbeat-{room_id}")
+        self.rooms[room_id] = room
+        self.counters.add(self.index, "rooms")
+        self.log.info("mqtt", "Room %s pinned to worker %s", room_id, self.index)
+        return room
+
+    def close_room(self, room_id):
+        """Stop a room's jobs and drop its orchestrator instance"""
+        room = self.rooms.pop(room_id, None)
+        if room is None:
+            return
+        if room.heartbeat_job is not None:
+            room.heartbeat_job.cancel()
+        if room.orchestrator.session_store is not None:
+            room.orchestrator.session_store.close()
+        unload_orchestrator(room_id)
+        self.counters.add(self.index, "rooms", -1)
+
+    def close(self):
+        for room_id in list(self.rooms):
+            self.close_room(room_id)
+
+    def handle_batch(self, batch):
+        rooms = self.rooms
+        for room_id, topic, payload in batch:
+            room = rooms.get(room_id) or self.open_room(room_id)
+            room.orchestrator.on_message(room.client, None, Message(topic, payload))
+        self.counters.add(self.index, "messages", len(batch))
+        self.counters.add(self.index, "batches")
+        self.counters.set(self.index, "suppressed",
+                          sum(room.orchestrator.admission.suppressed for room in rooms.values()))
+
+
+def worker_main(index, inbox, counters, config_file, transport_kind=None, log_file=None, heartbeats=True):
+    """Entry point of a worker process"""
+    transport = create_transport(transport_kind)
+    if transport_kind == "loopback":
+        transport.connect()
+    else:
+        broker, port = get_broker_address()
+        transport.connect(broker, port, 60)
+        transport.loop_start()
+    stream = open(log_file, "a") if log_file else None
+    shard = WorkerShard(index, transport, counters, config_file, log=RingLog(stream=stream),
+                        heartbeats=heartbeats)
+    while True:
+        batch = inbox.get()
+        if batch is None:
+            break
+        shard.handle_batch(batch)
+    shard.close()
+    shard.log.flush()
+    transport.disconnect()
+
+
+class ShardedOrchestrator:
+    """Front router: room topic -> consistent hash -> worker process inbox"""
+
+    def __init__(self, workers=None, config_file="config.json", transport_kind=None,
+                 batch_size=64, flush_interval=0.005, log_file=None, heartbeats=True):
+        self.workers = workers or os.cpu_count() or 1
+        self.config_file = config_file
+        self.transport_kind = transport_kind
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.log_file = log_file
+        self.heartbeats = heartbeats
+        self.ring = HashRing(range(self.workers))
+        self.counters = SharedCounters(self.workers)
+        self.dispatched = 0
+        self._assignments = {}
+        self._batches = [[] for _ in range(self.workers)]
+        self._lock = threading.Lock()
+        self._inboxes = []
+        self._processes = []
+        self._running = False
+        self._flusher = None
+
+    def start(self):
+        context = multiprocessing.get_context()
+        for index in range(self.workers):
+            inbox = context.Queue()
+            process = context.Process(
+                target=worker_main, name=f"orchestrator-worker-{index}",
+                args=(index, inbox, self.counters, self.config_file, self.transport_kind,
+                      self.log_file, self.heartbeats),
+                daemon=True)
+            process.start()
+            self._inboxes.append(inbox)
+            self._processes.append(process)
+        # Started after the workers so no thread is running when they fork
+        self._running = True
+        self._flusher = threading.Thread(target=self._flush_loop, name="shard-flusher", daemon=True)
+        self._flusher.start()
+        return self
+
+    def worker_for(self, room_id):
+        worker = self._assignments.get(room_id)
+        if worker is None:
+            worker = self._assignments[room_id] = self.ring.node_for(room_id)
+        return worker
+
+    def dispatch(self, topic, payload):
+        """Queue one inbound message for its room's worker, False if not a room topic"""
+        room_id, inner = split_room_topic(topic)
+        if room_id is None:
+            return False
+        worker = self.worker_for(room_id)
+        with self._lock:
+            batch = self._batches[worker]
+            batch.append((room_id, inner, payload))
+            if len(batch) >= self.batch_size:
+                self._batches[worker] = []
+                self._inboxes[worker].put(batch)
+            self.dispatched += 1
+        return True
+
+    def flush(self):
+        """Send every partial batch now"""
+        with self._lock:
+            for worker, batch in enumerate(self._batches):
+                if batch:
+                    self._batches[worker] = []
+                    self._inboxes[worker].put(batch)
+
+    def _flush_loop(self):
+        while self._running:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def wait_idle(self, timeout=30):
+        """Wait until the workers have handled everything dispatched so far"""
+        self.flush()
+        deadline = time.monotonic() + timeout
+        while self.counters.total("messages") < self.dispatched:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def stop(self):
+        self._running = False
+        self.flush()
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join(5)
+
+    # Transport callbacks for the front process
+    def on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            return
+        for topic in INBOUND_TOPICS:
+            client.subscribe(f"{ROOM_PREFIX}+/{topic}", 0)
+
+    def on_message(self, client, userdata, msg):
+        self.dispatch(msg.topic, msg.payload)
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    front = ShardedOrchestrator(workers).start()
+    client = create_transport()
+    client.on_connect = front.on_connect
+    client.on_message = front.on_message
+    broker, port = get_broker_address()
+    try:
+        client.connect(broker, port, 60)
+        client.loop_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        front.stop()
+        print(f"Shard totals: {front.counters.totals()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Simulated ESP32 modules for running the orchestrator without hardware.
+
+Each SimulatedModule owns its own transport, just like a real board, and
+mimics the firmware closely enough for tests and benchmarks: it announces
+itself, answers commands, keeps the flags it reports in HEARTBEAT messages
+and records every command it receives.
+"""
+
+import json
+import time
+
+from transport import LoopbackBroker, LoopbackTransport
+
+# name: (publish topic, command topic, connect message type, device name)
+MODULES = {
+    "wire": ("esp/to/rpi", "rpi/to/esp", "WIRE_MODULE_CONNECTED", "ESP32_Wire"),
+    "display": ("esp2/to/rpi", "rpi/to/esp2", "DISPLAY_CONNECTED", "ESP32_Display"),
+    "maze": ("esp3/to/rpi", "rpi/to/esp3", "MAZE_MODULE_CONNECTED", "ESP32_Maze"),
+    "button": ("esp4/to/rpi", "rpi/to/esp4", "BUTTON_MODULE_CONNECTED", "ESP32_Button"),
+}
+
+MAX_X_COUNT = 3
+
+
+class SimulatedModule:
+    """One fake ESP32 module attached to a transport"""
+
+    def __init__(self, name, transport, clock=None):
+        self.name = name
+        self.clock = clock or time
+        self.publish_topic, self.command_topic, self.connect_type, self.device = MODULES[name]
+        self.transport = transport
+        self.transport.on_connect = self._on_connect
+        self.transport.on_message = self._on_message
+        self.received = []
+        self.activated = False
+        self.game_active = False
+        self.completed = False
+        self.paused = False
+        self.x_count = 0
+        self.on_command = None
+
+    def connect(self, host=None, port=1883):
+        self.transport.connect(host, port, 60)
+
+    def _on_connect(self, client, userdata, flags, rc):
+        client.subscribe(self.command_topic)
+
+    def _on_message(self, client, userdata, msg):
+        try:
+            data = json.loads(msg.payload)
+        except ValueError:
+            data = {"type": msg.payload.decode(errors="replace")}
+        command = data.get("type") or data.get("command")
+        self.received.append((time.perf_counter(), command, data))
+        self._apply(command, data)
+        if self.on_command:
+            self.on_command(self, command, data)
+
+    def _apply(self, command, data):
+        """Update the simulated firmware state the way the real board does"""
+        if command == "ACTIVATE":
+            self.activated = True
+            self.game_active = True
+        elif command in ("START_GAME", "RESET_GAME"):
+            self.game_active = True
+            self.completed = False
+            self.paused = False
+        elif command == "STOP_GAME":
+            self.game_active = False
+        elif command == "PAUSE_TIMER":
+            self.paused = True
+        elif command == "RESUME_TIMER":
+            self.paused = False
+        elif command in ("GAME_OVER", "VICTORY"):
+            self.game_active = False
+            self.paused = False
+        elif command == "START_TIMER" and self.name == "display":
+            self.game_active = True
+        elif command == "RESET_X" and self.name == "display":
+            self.x_count = 0
+        elif command == "X" and self.name == "display":
+            if self.x_count < MAX_X_COUNT:
+                self.x_count += 1
+                self.send("X_ADDED", x_count=self.x_count, max_x_count=MAX_X_COUNT)
+                if self.x_count >= MAX_X_COUNT:
+                    self.send("MAX_X_REACHED", x_count=self.x_count, max_x_count=MAX_X_COUNT)
+
+    def send(self, msg_type, **fields):
+        """Publish a message of the given type with firmware-style fields"""
+        message = {"type": msg_type, "device": self.device, "timestamp": int(self.clock.monotonic() * 1000)}
+        message.update(fields)
+        return self.transport.publish(self.publish_topic, json.dumps(message))
+
+    def announce(self):
+        return self.send(self.connect_type, message=f"{self.name} module ready")
+
+    def heartbeat(self):
+        if self.name == "display":
+            return self.send("HEARTBEAT", active=self.game_active, paused=self.paused)
+        fields = {"game_active": self.game_active, "game_paused": self.paused}
+        fields["game_completed" if self.name == "wire" else "game_won"] = self.completed
+        return self.send("HEARTBEAT", **fields)
+
+    def complete(self, report=True):
+        """Finish this module's puzzle, optionally losing the completion event"""
+        self.completed = True
+        if not report:
+            return None
+        if self.name == "wire":
+            return self.send("PUZZLE_COMPLETED", message="Wire cutting puzzle completed successfully!")
+        if self.name == "maze":
+            return self.send("MAZE_COMPLETED", message="Player completed the maze!")
+        if self.name == "button":
+            return self.send("BUTTON_GAME_WON", press_duration=2000, target_time=2000, difference=0)
+        return None
+
+    def commands(self, command=None):
+        """Commands received so far, optionally filtered by type"""
+        return [entry for entry in self.received if command is None or entry[1] == command]
+
+
+def create_loopback_modules(broker, names=None, clock=None):
+    """Create and connect simulated modules on a LoopbackBroker"""
+    modules = {}
+    for name in names or MODULES:
+        module = SimulatedModule(name, LoopbackTransport(broker), clock)
+        module.connect()
+        modules[name] = module
+    return modules
+
+
+def pump(*transports, max_rounds=1000):
+    """Deliver pending loopback messages until every transport is idle"""
+    for _ in range(max_rounds):
+        if not sum(transport.drain() for transport in transports):
+            return
+    raise RuntimeError("Loopback transports did not settle")
+
+
+class VirtualRig:
+    """
+    The orchestrator module plus all four simulated modules on a loopback
+    broker, running on a VirtualClock. Online modules send a heartbeat
+    every `heartbeat_interval` simulated seconds; run() moves time forward.
+
+    The rig swaps in its clock and config file as the orchestrator's
+    module globals; close() (or leaving a `with` block) puts them back.
+    """
+
+    # Rigs not closed yet, oldest first
+    open_rigs = []
+
+    def __init__(self, orchestrator, clock, config_file=None, heartbeat_interval=2):
+        self.orchestrator = orchestrator
+        self.clock = clock
+        self._saved = (orchestrator.clock, orchestrator.CONFIG_FILE)
+        VirtualRig.open_rigs.append(self)
+        orchestrator.clock = clock
+        if config_file:
+            orchestrator.CONFIG_FILE = config_file
+
+        self.broker = LoopbackBroker()
+        self.client = LoopbackTransport(self.broker)
+        # Not connected yet, so the reset commands go nowhere
+        orchestrator.reset_all_games(self.client)
+        for module in orchestrator.modules_connected:
+            orchestrator.modules_connected[module] = False
+            orchestrator.module_last_seen[module] = 0
+
+        self.client.on_connect = orchestrator.on_connect
+        self.client.on_message = orchestrator.on_message
+        self.client.connect()
+        self.modules = create_loopback_modules(self.broker, clock=clock)
+        self.transports = [self.client] + [module.transport for module in self.modules.values()]
+        self.online = set()
+        self.pump()
+        clock.every(heartbeat_interval, self._heartbeats)
+
+    def pump(self):
+        pump(*self.transports)
+
+    def close(self):
+        """Disconnect everything and restore the orchestrator's clock and config file"""
+        if self not in VirtualRig.open_rigs:
+            return
+        VirtualRig.open_rigs.remove(self)
+        orchestrator = self.orchestrator
+        if orchestrator.heartbeat_job is not None:
+            orchestrator.heartbeat_job.cancel()
+            orchestrator.heartbeat_job = None
+        for transport in self.transports:
+            transport.disconnect()
+        orchestrator.clock, orchestrator.CONFIG_FILE = self._saved
+
+    @classmethod
+    def close_all(cls):
+        """Close every open rig, newest first"""
+        for rig in reversed(list(cls.open_rigs)):
+            rig.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _heartbeats(self):
+        for name in sorted(self.online):
+            self.modules[name].heartbeat()
+        self.pump()
+
+    def announce(self, *names):
+        """Bring modules online, as after a (re)boot"""
+        for name in names or self.modules:
+            self.online.add(name)
+            self.modules[name].announce()
+        self.pump()
+
+    def drop(self, *names):
+        """Take modules offline: they stop sending anything"""
+        self.online.difference_update(names)
+
+    def restart_broker(self):
+        """Drop every connection and reconnect, as after a broker restart"""
+        for transport in self.transports:
+            transport.disconnect()
+        self.pump()
+        for transport in self.transports:
+            transport.connect()
+        self.pump()
+        # The boards announce themselves again after reconnecting
+        if self.online:
+            self.announce(*sorted(self.online))
+
+    def send(self, name, msg_type, **fields):
+        self.modules[name].send(msg_type, **fields)
+        self.pump()
+
+    def at(self, delay, callback, *args):
+        """Run callback(*args) after `delay` simulated seconds, then deliver messages"""
+        def run():
+            callback(*args)
+            self.pump()
+        return self.clock.call_later(delay, run)
+
+    def run(self, seconds):
+        self.clock.advance(seconds)
+        self.pump()
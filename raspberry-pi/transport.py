@@ -0,0 +1,470 @@
+"""
+Transport layer for the orchestrator and the test/benchmark scripts.
+
+Everything in mqtt.py talks to a `client` object through a small
+paho-shaped interface: publish/subscribe, connect/disconnect, the loop
+methods and the on_connect/on_message callbacks. Two backends provide it:
+
+- PahoTransport wraps a real paho client talking to a broker.
+- LoopbackTransport passes messages between transports attached to the same
+  in-process LoopbackBroker through queues, so the orchestrator, simulated
+  modules and benchmarks can run in one process with no broker or network.
+
+A third mode, "embedded", is a LoopbackTransport on a broker that also
+serves the ESP32 modules over TCP (see embedded_broker.py).
+"""
+
+import os
+import queue
+import threading
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_QUEUED = 1
+MQTT_ERR_NO_CONN = 4
+
+DEFAULT_BROKER = "192.168.1.201"
+DEFAULT_PORT = 1883
+
+# Outbound topics sent often enough to be worth an MQTT v5 topic alias
+ALIAS_PREFIXES = ("rpi/to/esp",)
+
+# CONNACK reason code from a broker that doesn't speak MQTT v5
+UNSUPPORTED_PROTOCOL_VERSION = 132
+
+
+def get_broker_address():
+    """Broker host/port, overridable with MQTT_BROKER and MQTT_PORT"""
+    return (os.environ.get("MQTT_BROKER", DEFAULT_BROKER),
+            int(os.environ.get("MQTT_PORT", DEFAULT_PORT)))
+
+
+def get_broker_list():
+    """Brokers to try in order, from MQTT_BROKERS ("host[:port],...") or get_broker_address()"""
+    brokers = []
+    for entry in os.environ.get("MQTT_BROKERS", "").split(","):
+        if entry.strip():
+            host, _, port = entry.strip().partition(":")
+            brokers.append((host, int(port or DEFAULT_PORT)))
+    return brokers or [get_broker_address()]
+
+
+def topic_matches(subscription, topic):
+    """Check an MQTT subscription filter (with + and # wildcards) against a topic"""
+    if subscription == topic:
+        return True
+    sub_parts = subscription.split("/")
+    topic_parts = topic.split("/")
+    for i, part in enumerate(sub_parts):
+        if part == "#":
+            return True
+        if i >= len(topic_parts):
+            return False
+        if part != "+" and part != topic_parts[i]:
+            return False
+    return len(sub_parts) == len(topic_parts)
+
+
+class PublishResult:
+    """Result of a publish call, mirrors paho's MQTTMessageInfo fields we use"""
+
+    __slots__ = ("rc", "mid")
+
+    def __init__(self, rc, mid=0):
+        self.rc = rc
+        self.mid = mid
+
+
+class Properties:
+    """
+    MQTT v5 publish properties for the non-paho backends, with the same
+    attribute names as paho's Properties (ResponseTopic, CorrelationData)
+    """
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class Message:
+    """Inbound message handed to on_message, mirrors paho's MQTTMessage"""
+
+    __slots__ = ("topic", "payload", "qos", "retain", "properties")
+
+    def __init__(self, topic, payload, qos=0, retain=False, properties=None):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.properties = properties
+
+
+class Transport:
+    """
+    Interface shared by all backends.
+
+    on_connect(client, userdata, flags, rc) and on_message(client, userdata, msg)
+    are called with the transport itself as `client`, so handlers can reply
+    through the same object they were given.
+    """
+
+    on_connect = None
+    on_message = None
+    on_disconnect = None
+
+    def __init__(self, userdata=None):
+        self.userdata = userdata
+
+    def connect(self, host, port=DEFAULT_PORT, keepalive=60):
+        raise NotImplementedError
+
+    def disconnect(self):
+        raise NotImplementedError
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        raise NotImplementedError
+
+    def subscribe(self, topic, qos=0):
+        raise NotImplementedError
+
+    def subscribe_private(self, topic, qos=0):
+        """Subscribe outside any shared subscription, for topics only this client publishes on"""
+        return self.subscribe(topic, qos)
+
+    def respond(self, request, topic, payload, qos=0):
+        """
+        Reply to a request message: on its MQTT v5 ResponseTopic with the
+        same CorrelationData if it has one, otherwise on the fixed `topic`
+        """
+        response_topic = getattr(request.properties, "ResponseTopic", None)
+        if not response_topic:
+            return self.publish(topic, payload, qos)
+        return self.publish(response_topic, payload, qos, properties=self._response_properties(request.properties))
+
+    def _response_properties(self, request_properties):
+        correlation = getattr(request_properties, "CorrelationData", None)
+        return Properties(CorrelationData=correlation) if correlation is not None else None
+
+    def loop_forever(self):
+        raise NotImplementedError
+
+    def loop_start(self):
+        raise NotImplementedError
+
+    def loop_stop(self):
+        raise NotImplementedError
+
+    def is_connected(self):
+        raise NotImplementedError
+
+
+class TopicAliases:
+    """
+    Client-side MQTT v5 topic alias table for one connection. The first
+    publish on a topic carries the topic and its new alias, later ones only
+    the alias; aliases are handed out up to the broker's TopicAliasMaximum.
+    """
+
+    def __init__(self, maximum=0, prefixes=ALIAS_PREFIXES):
+        self.maximum = maximum
+        self.prefixes = tuple(prefixes)
+        self.aliases = {}
+
+    def reset(self, maximum):
+        """A new connection: nothing is mapped any more"""
+        self.maximum = maximum
+        self.aliases = {}
+
+    def lookup(self, topic):
+        """(alias, established) for topic, alias None if it doesn't get one"""
+        alias = self.aliases.get(topic)
+        if alias is not None:
+            return alias, True
+        if len(self.aliases) >= self.maximum or not topic.startswith(self.prefixes):
+            return None, False
+        alias = self.aliases[topic] = len(self.aliases) + 1
+        return alias, False
+
+
+class PahoTransport(Transport):
+    """
+    Transport backed by a paho-mqtt client and a real broker.
+
+    protocol "5" (the default) connects with MQTT v5 and falls back to 3.1.1
+    if the broker refuses it. On v5 connections the hot rpi/to/esp* topics
+    are sent as topic aliases, subscriptions join the `share_group` shared
+    subscription if one is set (so several orchestrator workers can split
+    e.g. +/to/rpi between them), and respond() follows ResponseTopic and
+    CorrelationData.
+    """
+
+    def __init__(self, userdata=None, client_id="", protocol="5", share_group=None, alias_prefixes=ALIAS_PREFIXES):
+        super().__init__(userdata)
+        import paho.mqtt.client as paho
+        from paho.mqtt.packettypes import PacketTypes
+        from paho.mqtt.properties import Properties as PahoProperties
+
+        self._paho = paho
+        self._new_properties = lambda: PahoProperties(PacketTypes.PUBLISH)
+        self._client_id = client_id
+        self._address = None
+        self._threaded = False
+        self._connect_timeout = None
+        self.share_group = share_group
+        self.aliases = TopicAliases(0, alias_prefixes)
+        # Held across the paho publish call so the packet that establishes an
+        # alias is always queued before the ones that only use it
+        self._alias_lock = threading.Lock()
+        self._client = self._create_client(paho.MQTTv5 if str(protocol) == "5" else paho.MQTTv311)
+
+    def _create_client(self, version):
+        paho = self._paho
+        if hasattr(paho, "CallbackAPIVersion"):
+            # paho-mqtt 2.x needs the callback API version spelled out
+            client = paho.Client(paho.CallbackAPIVersion.VERSION1, client_id=self._client_id, protocol=version)
+        else:
+            client = paho.Client(client_id=self._client_id, protocol=version)
+        client.on_connect = self._handle_connect
+        client.on_message = self._handle_message
+        client.on_disconnect = self._handle_disconnect
+        if self._connect_timeout is not None:
+            client.connect_timeout = self._connect_timeout
+        return client
+
+    @property
+    def connect_timeout(self):
+        return self._client.connect_timeout
+
+    @connect_timeout.setter
+    def connect_timeout(self, seconds):
+        """Seconds to wait for the TCP connection and CONNACK"""
+        self._connect_timeout = seconds
+        self._client.connect_timeout = seconds
+
+    @property
+    def v5(self):
+        return self._client.protocol == self._paho.MQTTv5
+
+    def _handle_connect(self, client, userdata, flags, rc, properties=None):
+        rc = getattr(rc, "value", rc)
+        if self.v5 and rc == UNSUPPORTED_PROTOCOL_VERSION:
+            self._fall_back()
+            return
+        with self._alias_lock:
+            self.aliases.reset(getattr(properties, "TopicAliasMaximum", 0) if rc == 0 and self.v5 else 0)
+        if self.on_connect:
+            self.on_connect(self, self.userdata, flags, rc)
+
+    def _handle_message(self, client, userdata, msg):
+        if self.on_message:
+            self.on_message(self, self.userdata, msg)
+
+    def _handle_disconnect(self, client, userdata, rc, properties=None):
+        if self.on_disconnect:
+            self.on_disconnect(self, self.userdata, getattr(rc, "value", rc))
+
+    def _fall_back(self):
+        """The broker only speaks 3.1.1: carry on with a 3.1.1 client"""
+        previous = self._client
+        self._client = self._create_client(self._paho.MQTTv311)
+        self._client.connect_async(*self._address)
+        # Ends the v5 client's network loop, loop_forever() then runs the new one
+        previous.disconnect()
+        if self._threaded:
+            self._client.loop_start()
+
+    def connect(self, host, port=DEFAULT_PORT, keepalive=60):
+        self._address = (host, port, keepalive)
+        return self._client.connect(host, port, keepalive)
+
+    def disconnect(self):
+        return self._client.disconnect()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        if not self.v5:
+            return self._client.publish(topic, payload, qos, retain)
+        properties = self._paho_properties(properties)
+        with self._alias_lock:
+            alias, established = self.aliases.lookup(topic)
+            if alias is None:
+                return self._client.publish(topic, payload, qos, retain, properties)
+            properties = properties or self._new_properties()
+            properties.TopicAlias = alias
+            return self._client.publish("" if established else topic, payload, qos, retain, properties)
+
+    def _paho_properties(self, properties):
+        if properties is None or not isinstance(properties, Properties):
+            return properties
+        converted = self._new_properties()
+        for name, value in vars(properties).items():
+            setattr(converted, name, value)
+        return converted
+
+    def subscribe(self, topic, qos=0):
+        if self.share_group and self.v5:
+            topic = f"$share/{self.share_group}/{topic}"
+        return self._client.subscribe(topic, qos)
+
+    def subscribe_private(self, topic, qos=0):
+        return self._client.subscribe(topic, qos)
+
+    def loop_forever(self):
+        while True:
+            client = self._client
+            result = client.loop_forever()
+            # Swapped for a 3.1.1 client while running: keep going on that one
+            if self._client is client:
+                return result
+
+    def loop_start(self):
+        self._threaded = True
+        return self._client.loop_start()
+
+    def loop_stop(self):
+        self._threaded = False
+        return self._client.loop_stop()
+
+    def is_connected(self):
+        return self._client.is_connected()
+
+
+class LoopbackBroker:
+    """In-process message router shared by LoopbackTransport instances"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = []
+        self.messages_routed = 0
+
+    def subscribe(self, transport, topic):
+        with self._lock:
+            if (topic, transport) not in self._subscriptions:
+                self._subscriptions.append((topic, transport))
+
+    def unsubscribe_all(self, transport):
+        with self._lock:
+            self._subscriptions = [s for s in self._subscriptions if s[1] is not transport]
+
+    def route(self, topic, payload, qos=0, retain=False, properties=None):
+        """Queue a message for every matching subscriber, delivered once per transport"""
+        message = Message(topic, payload, qos, retain, properties)
+        delivered = set()
+        with self._lock:
+            subscriptions = self._subscriptions
+        for pattern, transport in subscriptions:
+            if id(transport) in delivered or not topic_matches(pattern, topic):
+                continue
+            delivered.add(id(transport))
+            # The same Message object is shared by all receivers - no copies
+            transport._inbox.put(message)
+        self.messages_routed += 1
+        return len(delivered)
+
+
+_STOP = object()
+
+
+class LoopbackTransport(Transport):
+    """Transport that exchanges messages through a LoopbackBroker"""
+
+    def __init__(self, broker, userdata=None):
+        super().__init__(userdata)
+        self.broker = broker
+        self._inbox = queue.SimpleQueue()
+        self._connected = False
+        self._thread = None
+        self._mid = 0
+
+    def connect(self, host=None, port=DEFAULT_PORT, keepalive=60):
+        self._connected = True
+        self._inbox.put(("CONNACK", 0))
+        return MQTT_ERR_SUCCESS
+
+    def disconnect(self):
+        was_connected = self._connected
+        self._connected = False
+        self.broker.unsubscribe_all(self)
+        if was_connected:
+            self._inbox.put(("DISCONNECT", 0))
+        return MQTT_ERR_SUCCESS
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self._mid += 1
+        if not self._connected:
+            return PublishResult(MQTT_ERR_NO_CONN, self._mid)
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.broker.route(topic, payload, qos, retain, properties)
+        return PublishResult(MQTT_ERR_SUCCESS, self._mid)
+
+    def subscribe(self, topic, qos=0):
+        self._mid += 1
+        if not self._connected:
+            return MQTT_ERR_NO_CONN, self._mid
+        self.broker.subscribe(self, topic)
+        return MQTT_ERR_SUCCESS, self._mid
+
+    def is_connected(self):
+        return self._connected
+
+    def _dispatch(self, item):
+        if isinstance(item, Message):
+            if self.on_message:
+                self.on_message(self, self.userdata, item)
+        elif item[0] == "CONNACK":
+            if self.on_connect:
+                self.on_connect(self, self.userdata, {}, item[1])
+        elif item[0] == "DISCONNECT":
+            if self.on_disconnect:
+                self.on_disconnect(self, self.userdata, item[1])
+
+    def loop(self, timeout=1.0):
+        """Deliver at most one pending message, waiting up to timeout seconds"""
+        try:
+            item = self._inbox.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        if item is _STOP:
+            return None
+        self._dispatch(item)
+        return True
+
+    def drain(self):
+        """Deliver every pending message on the calling thread, returns the count"""
+        count = 0
+        while True:
+            try:
+                item = self._inbox.get_nowait()
+            except queue.Empty:
+                return count
+            if item is _STOP:
+                continue
+            self._dispatch(item)
+            count += 1
+
+    def loop_forever(self):
+        while self.loop(timeout=None) is not None:
+            pass
+
+    def loop_start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.loop_forever, daemon=True)
+            self._thread.start()
+
+    def loop_stop(self):
+        if self._thread is not None:
+            self._inbox.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+
+def create_transport(kind=None, broker=None, userdata=None):
+    """Create a transport by name ("paho", "loopback" or "embedded"), default from MQTT_TRANSPORT"""
+    kind = kind or os.environ.get("MQTT_TRANSPORT", "paho")
+    if kind == "loopback":
+        return LoopbackTransport(broker or LoopbackBroker(), userdata)
+    if kind == "embedded":
+        from embedded_broker import EmbeddedTransport
+        return EmbeddedTransport(broker, userdata)
+    if kind == "paho":
+        return PahoTransport(userdata, protocol=os.environ.get("MQTT_PROTOCOL", "5"),
+                             share_group=os.environ.get("MQTT_SHARE_GROUP"))
+    raise ValueError(f"Unknown transport: {kind}")
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Soak run: thousands of game cycles through one long-lived orchestrator,
+watching for resource growth.
+
+The orchestrator and the simulated modules run on a VirtualClock, so every
+cycle plays a whole round (start countdown, penalties, victory, X-out or
+timeout) in about a millisecond. On top of that, every few cycles the
+broker restarts, a module drops out until the game pauses, or a config
+update is pushed.
+
+Every `sample_every` cycles the run records RSS, threads, open file
+descriptors, live GC objects, pending clock jobs and on_message handler
+latency. The series is written as CSV so runs of different releases can be
+compared. A metric that keeps growing over the run fails it.
+
+    python soak_orchestrator.py [cycles] [report.csv]
+"""
+
+import csv
+import gc
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+from clock import VirtualClock
+from simulated_modules import VirtualRig
+from transport import LoopbackTransport
+
+CYCLES = 2000
+SAMPLE_EVERY = 50
+
+COLUMNS = ("cycle", "elapsed_s", "rss_kb", "threads", "fds", "gc_objects", "clock_jobs",
+           "latency_p50_us", "latency_p99_us")
+
+# metric: (relative growth, absolute growth) allowed between the start and
+# the end of the run when the series is also monotonic
+GROWTH_LIMITS = {
+    "rss_kb": (0.10, 2048),
+    "threads": (0.0, 0),
+    "fds": (0.0, 0),
+    "gc_objects": (0.05, 2000),
+    "clock_jobs": (0.0, 0),
+    "latency_p50_us": (1.0, 50),
+}
+
+
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        # Peak rather than current, but still shows steady growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def open_fds():
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def grows(series, relative, absolute, monotonic_share=0.9):
+    """True if series mostly never goes down and ends clearly above its start"""
+    if len(series) < 3:
+        return False
+    steps = list(zip(series, series[1:]))
+    rising = sum(1 for before, after in steps if after >= before)
+    limit = series[0] * (1 + relative) + absolute
+    return rising >= monotonic_share * len(steps) and series[-1] > limit
+
+
+class Soak:
+    """One orchestrator on a VirtualRig, driven through game cycles"""
+
+    def __init__(self, seed=0, sample_every=SAMPLE_EVERY):
+        self.rng = random.Random(seed)
+        self.sample_every = sample_every
+        self.samples = []
+        self.latencies = []
+        self.started = time.perf_counter()
+
+        config_dir = tempfile.mkdtemp()
+        self.config_file = os.path.join(config_dir, "config.json")
+        shutil.copy(os.path.join(os.path.dirname(orchestrator.__file__), "config.json"), self.config_file)
+        self.rig = VirtualRig(orchestrator, VirtualClock(), self.config_file)
+
+        handler = self.rig.client.on_message
+
+        def timed_on_message(client, userdata, msg):
+            start = time.perf_counter()
+            handler(client, userdata, msg)
+            self.latencies.append(time.perf_counter() - start)
+
+        self.rig.client.on_message = timed_on_message
+        self.admin = LoopbackTransport(self.rig.broker)
+        self.admin.connect()
+        self.rig.transports.append(self.admin)
+        self.rig.announce()
+
+    # One round
+    def play_round(self):
+        rig = self.rig
+        orchestrator.reset_all_games(rig.client)
+        orchestrator.start_all_games(rig.client)
+        rig.pump()
+        roll = self.rng.random()
+        if roll < 0.6:
+            for name in ("wire", "maze", "button"):
+                rig.run(self.rng.uniform(1, 20))
+                if self.rng.random() < 0.5:
+                    rig.send("maze", "WALL_HIT", maze_id="maze_2", position_x=1, position_y=1)
+                rig.modules[name].complete()
+                rig.pump()
+        elif roll < 0.95:
+            # Penalties further apart than the admission rate limit
+            for _ in range(3):
+                rig.run(2)
+                rig.send("wire", "WRONG_CUT_ALERT", wire=self.rng.randrange(4))
+        else:
+            rig.run(orchestrator.game_clock.remaining(rig.clock.time()) + orchestrator.CLOCK_GRACE + 2)
+        rig.run(2)
+
+    # Disturbances
+    def restart_broker(self):
+        self.rig.restart_broker()
+
+    def module_dropout(self):
+        name = self.rng.choice(sorted(self.rig.modules))
+        self.rig.drop(name)
+        self.rig.run(orchestrator.HEARTBEAT_TIMEOUT + 4)
+        self.rig.announce(name)
+        self.rig.run(2)
+
+    def config_update(self, cycle):
+        with open(self.config_file) as f:
+            config = json.load(f)
+        config["timer_settings"]["game_duration"] = 360 + 40 * (cycle % 2)
+        self.admin.publish("config/update", json.dumps(config))
+        self.rig.pump()
+
+    def sample(self, cycle):
+        gc.collect()
+        self.samples.append({
+            "cycle": cycle,
+            "elapsed_s": round(time.perf_counter() - self.started, 3),
+            "rss_kb": rss_kb(),
+            "threads": threading.active_count(),
+            "fds": open_fds(),
+            "gc_objects": len(gc.get_objects()),
+            "clock_jobs": self.rig.clock.pending(),
+            "latency_p50_us": round(percentile(self.latencies, 0.5) * 1e6, 1),
+            "latency_p99_us": round(percentile(self.latencies, 0.99) * 1e6, 1),
+        })
+        self.latencies = []
+
+    def run(self, cycles):
+        for cycle in range(1, cycles + 1):
+            self.play_round()
+            if cycle % 7 == 0:
+                self.restart_broker()
+            if cycle % 11 == 0:
+                self.module_dropout()
+            if cycle % 13 == 0:
+                self.config_update(cycle)
+            # The simulated boards keep what they received, the real ones don't
+            for module in self.rig.modules.values():
+                module.received.clear()
+            if cycle % self.sample_every == 0:
+                self.sample(cycle)
+        return self.samples
+
+    def growth(self, warmup=0.2):
+        """Metrics that grew steadily over the run, after a warm-up share of samples"""
+        samples = self.samples[int(len(self.samples) * warmup):]
+        failures = {}
+        for metric, (relative, absolute) in GROWTH_LIMITS.items():
+            series = [sample[metric] for sample in samples if sample[metric] is not None]
+            if grows(series, relative, absolute):
+                failures[metric] = (series[0], series[-1])
+        return failures
+
+    def write_report(self, path):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(self.samples)
+
+
+def run_soak(cycles=CYCLES, report=None, sample_every=SAMPLE_EVERY, seed=0):
+    """Run the soak, returns (samples, failing metrics)"""
+    stream = orchestrator.log.stream
+    devnull = open(os.devnull, "w")
+    orchestrator.log.stream = devnull
+    soak = None
+    try:
+        soak = Soak(seed, sample_every)
+        soak.run(cycles)
+        orchestrator.log.flush()
+    finally:
+        if soak is not None:
+            soak.rig.close()
+        orchestrator.log.stream = stream
+        devnull.close()
+    if report:
+        soak.write_report(report)
+    return soak.samples, soak.growth()
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else CYCLES
+    report = sys.argv[2] if len(sys.argv) > 2 else "soak_report.csv"
+    samples, failures = run_soak(cycles, report)
+    first, last = samples[0], samples[-1]
+    print(f"Soak: {cycles} cycles in {last['elapsed_s']}s, report written to {report}")
+    for metric in COLUMNS[2:]:
+        print(f"  {metric:15} {first[metric]!s:>10} -> {last[metric]!s:>10}")
+    if failures:
+        for metric, (start, end) in failures.items():
+            print(f"FAIL: {metric} kept growing, {start} -> {end}")
+        sys.exit(1)
+    print("No steady growth detected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the inbound admission stage (rate limiting and dedup)
+"""
+
+import collections
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from admission import Admission
+
+Record = collections.namedtuple("Record", "type device timestamp")
+
+
+def test_token_bucket_absorbs_bursts():
+    admission = Admission(rate=1.0, burst=2, modules={"maze": {"rate": 0.5, "burst": 1}})
+    # A noisy joystick: 50 wall hits within half a second
+    admitted = [admission.admit("maze", Record("WALL_HIT", "ESP32_Maze", 1000 + i), 100 + i * 0.01)
+                for i in range(50)]
+    assert admitted.count(True) == 1
+    assert admission.counters["rate_limited"] == 49
+
+    # Other modules have their own bucket and the default burst
+    assert admission.admit("wire", Record("WRONG_CUT_ALERT", "ESP32_Wire", 5), 100)
+    assert admission.admit("wire", Record("WRONG_CUT_ALERT", "ESP32_Wire", 6), 100)
+    assert not admission.admit("wire", Record("WRONG_CUT_ALERT", "ESP32_Wire", 7), 100)
+
+    # Tokens refill over time
+    assert admission.admit("maze", Record("WALL_HIT", "ESP32_Maze", 2000), 102.5)
+
+
+def test_duplicates_are_dropped_within_a_bounded_window():
+    admission = Admission(rate=1000, burst=1000, dedup_window=4)
+    event = Record("BUTTON_GAME_LOST", "ESP32_Button", 4242)
+    assert admission.admit("button", event, 0)
+    assert not admission.admit("button", event, 0)
+    assert admission.counters["duplicate"] == 1
+
+    for timestamp in range(10):
+        admission.admit("button", Record("BUTTON_GAME_LOST", "ESP32_Button", timestamp + 1), 0)
+    assert len(admission._seen) == 4
+    # Pushed out of the window, so it counts again
+    assert admission.admit("button", event, 0)
+
+
+def test_other_types_and_disabled_admission_pass():
+    admission = Admission(rate=0.001, burst=1)
+    heartbeat = Record("HEARTBEAT", "ESP32_Maze", 1)
+    assert all(admission.admit("maze", heartbeat, 0) for _ in range(10))
+
+    admission.configure(enabled=False)
+    wall_hit = Record("WALL_HIT", "ESP32_Maze", 1)
+    assert all(admission.admit("maze", wall_hit, 0) for _ in range(10))
+    assert admission.suppressed == 0
+
+    # Without a rate only duplicates are dropped
+    admission = Admission()
+    assert all(admission.admit("maze", Record("WALL_HIT", "ESP32_Maze", 1 + i), 0) for i in range(10))
+    assert not admission.admit("maze", Record("WALL_HIT", "ESP32_Maze", 1), 0)
+    assert admission.counters == {"admitted": 10, "duplicate": 1, "rate_limited": 0}
+
+
+if __name__ == "__main__":
+    test_token_bucket_absorbs_bursts()
+    test_duplicates_are_dropped_within_a_bounded_window()
+    test_other_types_and_disabled_admission_pass()
+    print("Admission tests passed")
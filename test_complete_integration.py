@@ -6,9 +6,10 @@ Run this after starting the main mqtt.py broker
 
 import paho.mqtt.client as mqtt
 import json
+import os
 import time
 
-BROKER = "192.168.1.201"
+BROKER = os.environ.get("MQTT_BROKER", "192.168.1.201")
 
 def on_connect(client, userdata, flags, rc):
     print(f"Test client connected with result code {rc}")
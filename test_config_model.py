@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for the compiled config model
+"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+from config_model import TimerSettings, compile_config, default_config
+from transport import LoopbackBroker, LoopbackTransport
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi", "config.json")
+
+
+def test_compiles_shipped_config():
+    with open(CONFIG_FILE) as f:
+        config = json.load(f)
+    model = compile_config(config)
+    assert model.timer.game_duration == config["timer_settings"]["game_duration"]
+    assert model.button.button_id == "button_1" and model.button.target_time == 2000
+    assert model.maze.maze_id == "maze_2" and model.wire.puzzle_id == "puzzle_1"
+    assert model.wire.steps[0].correct_wire == 0 and model.wire.total_steps == 1
+    assert not model.warnings
+
+    # The grid round-trips to the layout the firmware expects
+    maze = model.maze
+    layout = config["maze_ID"]["maze_2"]["maze_layout"]
+    assert (maze.width, maze.height, len(maze.grid)) == (16, 8, 128)
+    assert maze.layout() == layout
+    assert maze.cell(0, 0) == 1 and maze.cell(1, 1) == 0
+    message = maze.message()
+    assert message["maze_layout"] == layout and message["checkpoint_2_y"] == 5
+
+
+def test_defaults_are_defined_once():
+    model = compile_config({})
+    assert model.timer == TimerSettings() and model.timer.game_duration == 360
+    assert default_config()["timer_settings"]["game_duration"] == 360
+    assert model.button.enabled and model.maze is None
+    assert model.warnings == ("No enabled button found, using defaults",)
+
+    model = compile_config({"timer_settings": {"warning_time": 30, "unknown": 1}})
+    assert model.timer.game_duration == 360 and model.timer.warning_time == 30
+
+
+def test_first_maze_used_and_bad_entries_skipped():
+    model = compile_config({"maze_ID": {
+        "maze_a": {"maze_layout": [[1, 1], [1]]},
+        "maze_b": {"name": "B", "maze_layout": [[1, 0], [0, 1]]},
+    }})
+    assert list(model.mazes) == ["maze_b"] and model.maze.maze_id == "maze_b"
+    assert any("maze_a" in warning for warning in model.warnings)
+
+
+def test_partial_maze_leaves_firmware_defaults():
+    broker = LoopbackBroker()
+    maze, client = LoopbackTransport(broker), LoopbackTransport(broker)
+    for transport in (maze, client):
+        transport.connect()
+        transport.drain()
+    maze.subscribe("rpi/to/esp3")
+    received = []
+    maze.on_message = lambda client, userdata, msg: received.append(json.loads(msg.payload))
+
+    model = compile_config({"maze_ID": {"maze_x": {"enabled": True, "start_x": 2, "start_y": 3}}})
+    orchestrator.send_maze_config(client, model)
+    maze.drain()
+    # No end, checkpoints, name or layout in the config, so none in the command
+    assert received == [{"type": "UPDATE_MAZE_CONFIG", "command": "UPDATE_MAZE_CONFIG", "enabled": True,
+                         "start_x": 2, "start_y": 3, "maze_id": "maze_x"}]
+
+
+if __name__ == "__main__":
+    test_compiles_shipped_config()
+    test_defaults_are_defined_once()
+    test_first_maze_used_and_bad_entries_skipped()
+    test_partial_maze_leaves_firmware_defaults()
+    print("Config model tests passed")
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Tests for broker failover and the offline publish buffer
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+from connection_manager import ConnectionManager, OfflineBuffer, backoff_delay
+from embedded_broker import EmbeddedBroker, SocketClient
+from ringlog import RingLog
+from transport import MQTT_ERR_QUEUED, LoopbackBroker, LoopbackTransport, PahoTransport
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def command(msg_type, **fields):
+    return json.dumps(dict(fields, type=msg_type))
+
+
+def quiet_log():
+    return RingLog(stream=open(os.devnull, "w"))
+
+
+class FlakyBroker(LoopbackBroker):
+    """Loopback broker that can hang: still 'connected' but routing nothing"""
+
+    up = True
+
+    def route(self, topic, payload, qos=0, retain=False, properties=None):
+        if self.up:
+            super().route(topic, payload, qos, retain, properties)
+
+
+class HostLoopback(LoopbackTransport):
+    """LoopbackTransport that picks its broker by host name"""
+
+    def __init__(self, brokers):
+        super().__init__(None)
+        self.brokers = brokers
+
+    def connect(self, host=None, port=1883, keepalive=60):
+        if not self.brokers[host].up:
+            raise ConnectionRefusedError(host)
+        self.broker = self.brokers[host]
+        return super().connect(host, port, keepalive)
+
+
+def test_offline_buffer_collapses_and_keeps_priorities():
+    buffer = OfflineBuffer(capacity=4)
+    buffer.add("rpi/to/esp2", command("PAUSE_TIMER"))
+    buffer.add("rpi/to/esp2", command("RESUME_TIMER"))
+    assert len(buffer) == 0
+    buffer.add("rpi/to/esp2", command("RESUME_TIMER"))
+    buffer.add("rpi/to/esp4", command("UPDATE_BUTTON_CONFIG", target_time=1000))
+    buffer.add("rpi/to/esp4", command("UPDATE_BUTTON_CONFIG", target_time=3000))
+    buffer.add("rpi/to/esp2", command("GAME_OVER"))
+    buffer.add("rpi/status", "status 1")
+    # Full: the status message goes before any command does
+    buffer.add("rpi/to/esp", command("STOP_GAME"))
+    assert buffer.stats["collapsed"] == 3 and buffer.stats["dropped"] == 1
+
+    sent = []
+    buffer.drain(lambda topic, payload, qos, retain, properties: sent.append((topic, json.loads(payload))))
+    # Most important first, but GAME_OVER doesn't overtake the RESUME_TIMER for the same topic
+    assert [(topic, data["type"]) for topic, data in sent] == [
+        ("rpi/to/esp2", "RESUME_TIMER"),
+        ("rpi/to/esp2", "GAME_OVER"),
+        ("rpi/to/esp", "STOP_GAME"),
+        ("rpi/to/esp4", "UPDATE_BUTTON_CONFIG"),
+    ]
+    assert sent[3][1]["target_time"] == 3000 and len(buffer) == 0
+
+    # A start goes out early and takes the config queued before it along
+    buffer.add("rpi/status", "status 2")
+    buffer.add("rpi/to/esp4", command("UPDATE_BUTTON_CONFIG"))
+    buffer.add("rpi/to/esp3", command("UPDATE_MAZE_CONFIG"))
+    buffer.add("rpi/to/esp4", command("START_GAME"))
+    sent = []
+    buffer.drain(lambda topic, payload, qos, retain, properties: sent.append((topic, payload)))
+    assert [topic for topic, payload in sent] == ["rpi/to/esp4", "rpi/to/esp4", "rpi/to/esp3", "rpi/status"]
+
+    delays = [backoff_delay(attempt, 0.1, 1.0) for attempt in range(8)]
+    assert 0.05 <= delays[0] <= 0.1 and all(0.5 <= delay <= 1.0 for delay in delays[4:])
+
+
+def test_fails_over_between_brokers_and_drains_buffer():
+    primary = EmbeddedBroker("127.0.0.1", 0).start()
+    backup = EmbeddedBroker("127.0.0.1", 0).start()
+    display = SocketClient(client_id="display")
+    received = []
+    display.on_connect = lambda client, userdata, flags, rc: client.subscribe("rpi/to/esp2")
+    display.on_message = lambda client, userdata, msg: received.append(json.loads(msg.payload)["type"])
+    manager = ConnectionManager(lambda: PahoTransport(protocol="3.1.1"),
+                                [("127.0.0.1", primary.port), ("127.0.0.1", backup.port)],
+                                log=quiet_log())
+    connects = []
+    manager.on_connect = lambda client, userdata, flags, rc: connects.append(manager.broker)
+    try:
+        display.connect("127.0.0.1", primary.port, 60)
+        display.loop_start()
+        assert wait_until(lambda: primary.sessions.get("display") and primary.sessions["display"].subscriptions)
+
+        # Nothing connected yet, so these wait in the buffer
+        assert manager.publish("rpi/to/esp2", command("PAUSE_TIMER")).rc == MQTT_ERR_QUEUED
+        manager.publish("rpi/to/esp2", command("RESUME_TIMER"))
+        manager.publish("rpi/to/esp2", command("GAME_OVER"))
+        manager.connect(keepalive=60)
+        manager.loop_start()
+        assert wait_until(lambda: received == ["GAME_OVER"])
+        assert connects == [("127.0.0.1", primary.port)]
+
+        # The display follows the primary down and reconnects to the backup
+        display.loop_stop()
+        primary.stop()
+        lost = time.monotonic()
+        assert wait_until(lambda: len(connects) == 2)
+        assert time.monotonic() - lost < orchestrator.HEARTBEAT_INTERVAL
+        assert connects[1] == ("127.0.0.1", backup.port)
+        assert manager.failovers == 1 and manager.last_failover < orchestrator.HEARTBEAT_INTERVAL
+
+        display.connect("127.0.0.1", backup.port, 60)
+        display.loop_start()
+        assert wait_until(lambda: backup.sessions.get("display") and backup.sessions["display"].subscriptions)
+        manager.publish("rpi/to/esp2", command("VICTORY"))
+        assert wait_until(lambda: received == ["GAME_OVER", "VICTORY"])
+    finally:
+        manager.loop_stop()
+        display.loop_stop()
+        primary.stop()
+        backup.stop()
+
+
+def test_hung_broker_is_detected_by_health_check():
+    brokers = {"a": FlakyBroker(), "b": FlakyBroker()}
+    # Shipped timings
+    manager = ConnectionManager(lambda: HostLoopback(brokers), [("a", 1883), ("b", 1883)], log=quiet_log())
+    manager.on_connect = lambda client, userdata, flags, rc: client.subscribe("esp/to/rpi")
+    received = []
+    manager.on_message = lambda client, userdata, msg: received.append(msg.payload)
+    manager.connect()
+    manager.loop_start()
+    try:
+        assert wait_until(lambda: manager.broker == ("a", 1883))
+        # a hangs without closing the connection, then refuses new ones
+        brokers["a"].up = False
+        hung = time.monotonic()
+        assert wait_until(lambda: manager.broker == ("b", 1883), timeout=orchestrator.HEARTBEAT_INTERVAL)
+        assert time.monotonic() - hung < orchestrator.HEARTBEAT_INTERVAL
+        assert manager.failovers == 1 and manager.last_failover < orchestrator.HEARTBEAT_INTERVAL
+
+        # Resubscribed on b, and the health probes never reach on_message
+        wire = LoopbackTransport(brokers["b"])
+        wire.connect()
+        wire.publish("esp/to/rpi", "hello")
+        assert wait_until(lambda: received == [b"hello"])
+        time.sleep(0.1)
+        assert received == [b"hello"]
+    finally:
+        manager.loop_stop()
+
+
+def test_slow_handler_does_not_fail_over():
+    brokers = {"a": FlakyBroker(), "b": FlakyBroker()}
+    manager = ConnectionManager(lambda: HostLoopback(brokers), [("a", 1883), ("b", 1883)],
+                                log=quiet_log(), health_interval=0.02, health_timeout=0.1)
+    manager.on_connect = lambda client, userdata, flags, rc: client.subscribe("esp/to/rpi")
+    handled = []
+
+    def on_message(client, userdata, msg):
+        # Like check_all_modules_connected sleeping between activation sends
+        time.sleep(0.3)
+        handled.append(msg.payload)
+
+    manager.on_message = on_message
+    manager.connect()
+    manager.loop_start()
+    try:
+        assert wait_until(lambda: manager.broker == ("a", 1883))
+        wire = LoopbackTransport(brokers["a"])
+        wire.connect()
+        wire.publish("esp/to/rpi", "one")
+        wire.publish("esp/to/rpi", "two")
+        assert wait_until(lambda: handled == [b"one", b"two"])
+        assert manager.broker == ("a", 1883) and manager.failovers == 0
+    finally:
+        manager.loop_stop()
+
+
+if __name__ == "__main__":
+    test_offline_buffer_collapses_and_keeps_priorities()
+    test_fails_over_between_brokers_and_drains_buffer()
+    test_hung_broker_is_detected_by_health_check()
+    test_slow_handler_does_not_fail_over()
+    print("All connection manager tests passed")
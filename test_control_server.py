@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for the operator control API (HTTP + WebSocket push)
+"""
+
+import base64
+import http.client
+import json
+import os
+import socket
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from control_server import ControlServer
+
+
+def start_server(token=None):
+    state = {"x_count": 0}
+    calls = []
+
+    def add_x(reason="MANUAL"):
+        calls.append(reason)
+        state["x_count"] += 1
+
+    server = ControlServer(lambda: dict(state), {"x": add_x}, port=0, push_interval=0.01, token=token).start()
+    return server, state, calls
+
+
+def request(server, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection(server.host, server.port, timeout=5)
+    connection.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers or {})
+    response = connection.getresponse()
+    result = response.status, json.loads(response.read())
+    connection.close()
+    return result
+
+
+def read_frame(sock):
+    header = sock.recv(2)
+    length = header[1] & 0x7F
+    if length == 126:
+        length = int.from_bytes(sock.recv(2), "big")
+    data = b""
+    while len(data) < length:
+        data += sock.recv(length - len(data))
+    return json.loads(data)
+
+
+def test_http_state_and_actions():
+    server, state, calls = start_server()
+    try:
+        assert request(server, "GET", "/state") == (200, {"x_count": 0})
+        status, response = request(server, "POST", "/x", {"reason": "TEST"})
+        assert status == 200 and response["status"] == "success"
+        assert calls == ["TEST"]
+        assert request(server, "GET", "/nope")[0] == 404
+        assert request(server, "GET", "/x")[0] == 405
+        assert request(server, "POST", "/x", {"bogus": 1})[0] == 400
+    finally:
+        server.stop()
+
+
+def test_websocket_pushes_state_changes():
+    server, state, calls = start_server()
+    try:
+        sock = socket.create_connection((server.host, server.port), timeout=5)
+        key = base64.b64encode(os.urandom(16)).decode()
+        sock.sendall((
+            "GET /ws HTTP/1.1\r\nHost: test\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n"
+        ).encode())
+        handshake = b""
+        while b"\r\n\r\n" not in handshake:
+            handshake += sock.recv(1)
+        assert b"101 Switching Protocols" in handshake
+        assert read_frame(sock) == {"x_count": 0}
+
+        state["x_count"] = 2
+        server.notify()
+        server.notify()  # coalesced into one push
+        assert read_frame(sock) == {"x_count": 2}
+        sock.close()
+    finally:
+        server.stop()
+
+
+def test_token_is_required_when_set():
+    server, state, calls = start_server(token="s3cret")
+    try:
+        assert request(server, "POST", "/x", {"reason": "LAN"})[0] == 401
+        assert request(server, "GET", "/state", headers={"X-Control-Token": "wrong"})[0] == 401
+        assert request(server, "POST", "/x", {"reason": "OK"}, {"Authorization": "Bearer s3cret"})[0] == 200
+        assert request(server, "GET", "/state?token=s3cret") == (200, {"x_count": 1})
+        assert calls == ["OK"]
+
+        sock = socket.create_connection((server.host, server.port), timeout=5)
+        sock.sendall(b"GET /ws HTTP/1.1\r\nHost: test\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                     b"Sec-WebSocket-Key: x\r\n\r\n")
+        assert b"401 Unauthorized" in sock.recv(1024)
+        sock.close()
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    test_http_state_and_actions()
+    test_websocket_pushes_state_changes()
+    test_token_is_required_when_set()
+    print("Control server tests passed")
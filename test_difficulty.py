@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for the adaptive difficulty engine and its streaming statistics
+"""
+
+import collections
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from config_model import ButtonConfig
+from difficulty import DifficultyEngine, P2Quantile, WindowedQuantile
+
+Press = collections.namedtuple("Press", "type button_id difference")
+Event = collections.namedtuple("Event", "type maze_id")
+
+
+def test_p2_quantile_tracks_exact_quantile():
+    rng = random.Random(3)
+    samples = [abs(rng.gauss(0, 400)) for _ in range(20000)]
+    for p in (0.4, 0.6, 0.8):
+        estimate = P2Quantile(p)
+        for x in samples:
+            estimate.update(x)
+        exact = sorted(samples)[int(p * len(samples))]
+        assert abs(estimate.value - exact) / exact < 0.03, (p, estimate.value, exact)
+
+
+def test_windowed_quantile_forgets_old_samples():
+    rng = random.Random(4)
+    estimate = WindowedQuantile(0.5, window=200)
+    for _ in range(1000):
+        estimate.update(rng.uniform(0, 100))
+    assert 40 < estimate.value < 60
+    # Players got better: after one window only the new presses count
+    for _ in range(200):
+        estimate.update(rng.uniform(0, 10))
+    assert estimate.value < 10
+
+
+def test_button_buffer_hits_target_success_rate():
+    rng = random.Random(5)
+    engine = DifficultyEngine("easy")
+    button = ButtonConfig("button_1", target_time=2000, buffer=500, enabled=True)
+    assert engine.tune_button(button) is button  # no samples yet
+    for _ in range(2000):
+        difference = int(abs(rng.gauss(0, 400)))
+        won = difference < button.buffer
+        engine.observe(Press("BUTTON_GAME_WON" if won else "BUTTON_GAME_LOST", "button_1", difference))
+    tuned = engine.tune_button(button)
+    assert tuned.target_time == 2000 and tuned.buffer % 50 == 0
+
+    wins = sum(abs(rng.gauss(0, 400)) < tuned.buffer for _ in range(20000)) / 20000
+    assert abs(wins - engine.target) < 0.05, (tuned, wins)
+
+
+def test_maze_choice_and_duration_follow_round_outcomes():
+    engine = DifficultyEngine("medium", min_rounds=3)
+    mazes = ["maze_1", "maze_2", "maze_3"]
+    assert engine.choose_maze(mazes, "maze_2") == "maze_2"
+
+    # maze_2 is always solved and every round is won: too easy
+    for _ in range(4):
+        engine.begin_round("maze_2")
+        engine.observe(Event("WALL_HIT", "maze_2"))
+        engine.observe(Event("MAZE_COMPLETED", "maze_2"))
+        engine.end_round("VICTORY")
+    assert engine.choose_maze(mazes, "maze_2") == "maze_1"
+    assert engine.mazes["maze_2"].wall_hits.value == 1
+    assert engine.game_duration(360) < 360
+
+    # Aborted rounds are ignored
+    offset = engine.duration_offset
+    engine.begin_round("maze_1")
+    engine.end_round("ABORTED")
+    assert "maze_1" not in engine.mazes and engine.duration_offset == offset
+
+
+if __name__ == "__main__":
+    test_p2_quantile_tracks_exact_quantile()
+    test_windowed_quantile_forgets_old_samples()
+    test_button_buffer_hits_target_success_rate()
+    test_maze_choice_and_duration_follow_round_outcomes()
+    print("Difficulty tests passed")
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests for the embedded MQTT broker and the in-process orchestrator transport
+"""
+
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+from clock import VirtualClock
+from embedded_broker import CONNECT, EmbeddedBroker, EmbeddedTransport, SocketClient, encode_string, packet
+from simulated_modules import SimulatedModule
+from transport import create_transport
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def connect_client(broker, received, *topics):
+    """A TCP client subscribed to topics, returned once the broker has its subscriptions"""
+    client = SocketClient()
+
+    def on_connect(client, userdata, flags, rc):
+        for topic in topics:
+            client.subscribe(topic, 1)
+
+    client.on_connect = on_connect
+    client.on_message = lambda client, userdata, msg: received.append(msg)
+    client.connect("127.0.0.1", broker.port, 60)
+    client.loop_start()
+    assert wait_until(lambda: client.client_id in broker.sessions
+                      and len(broker.sessions[client.client_id].subscriptions) == len(topics))
+    return client
+
+
+def test_publish_subscribe_over_tcp():
+    broker = EmbeddedBroker("127.0.0.1", 0).start()
+    try:
+        received = []
+        connect_client(broker, received, "+/to/rpi", "rpi/#")
+        sender = connect_client(broker, [])
+
+        sender.publish("esp3/to/rpi", '{"type": "WALL_HIT"}')
+        sender.publish("esp2/to/rpi", "qos1", qos=1)
+        sender.publish("other/topic", "ignored")
+        sender.publish("rpi/state", "retained", retain=True)
+        assert wait_until(lambda: len(received) == 3)
+        assert [msg.topic for msg in received] == ["esp3/to/rpi", "esp2/to/rpi", "rpi/state"]
+        assert received[0].payload == b'{"type": "WALL_HIT"}' and received[1].qos == 1
+
+        # A late subscriber gets the retained message
+        late = []
+        connect_client(broker, late, "rpi/state")
+        assert wait_until(lambda: late and late[0].retain and late[0].payload == b"retained")
+    finally:
+        broker.stop()
+
+
+def test_last_will_and_bad_protocol():
+    broker = EmbeddedBroker("127.0.0.1", 0).start()
+    try:
+        received = []
+        connect_client(broker, received, "status/#")
+
+        # Connection with a will, then dropped without DISCONNECT
+        body = (encode_string("MQTT") + bytes((4, 0x06)) + (15).to_bytes(2, "big")
+                + encode_string("board") + encode_string("status/board") + encode_string("offline"))
+        raw = socket.create_connection(("127.0.0.1", broker.port))
+        raw.sendall(packet(CONNECT, body))
+        assert raw.recv(4) == bytes((0x20, 2, 0, 0))
+        raw.close()
+        assert wait_until(lambda: received and received[0].payload == b"offline")
+
+        # MQTT 5 is refused with "unacceptable protocol version"
+        raw = socket.create_connection(("127.0.0.1", broker.port))
+        raw.sendall(packet(CONNECT, encode_string("MQTT") + bytes((5, 2, 0, 15)) + encode_string("v5")))
+        assert raw.recv(4) == bytes((0x20, 2, 0, 1))
+        raw.close()
+    finally:
+        broker.stop()
+
+
+def test_orchestrator_hosts_the_broker():
+    config_file = os.path.join(tempfile.mkdtemp(), "config.json")
+    shutil.copy(os.path.join(os.path.dirname(orchestrator.__file__), "config.json"), config_file)
+    orchestrator.CONFIG_FILE = config_file
+    orchestrator.clock = VirtualClock()
+    client = create_transport("embedded")
+    assert isinstance(client, EmbeddedTransport)
+    orchestrator.reset_all_games(client)
+    for module in orchestrator.modules_connected:
+        orchestrator.modules_connected[module] = False
+    client.on_connect = orchestrator.on_connect
+    client.on_message = orchestrator.on_message
+    client.connect("192.168.1.201", 0, 60)
+    client.loop_start()
+    broker = client.broker
+    try:
+        # The maze board connects over TCP and gets its config back
+        maze = SimulatedModule("maze", SocketClient())
+        maze.transport.connect("127.0.0.1", broker.port, 60)
+        maze.transport.loop_start()
+        assert wait_until(lambda: broker.sessions and all(s.subscriptions for s in broker.sessions.values()))
+        maze.announce()
+        assert wait_until(lambda: maze.commands("UPDATE_MAZE_CONFIG"))
+        config = maze.commands("UPDATE_MAZE_CONFIG")[0][2]
+        assert config["maze_id"] == "maze_2" and len(config["maze_layout"]) == 8
+        assert orchestrator.modules_connected["maze"]
+        maze.transport.loop_stop()
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        broker.stop()
+
+
+if __name__ == "__main__":
+    test_publish_subscribe_over_tcp()
+    test_last_will_and_bad_protocol()
+    test_orchestrator_hosts_the_broker()
+    print("Embedded broker tests passed")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Tests for the orchestrator's model of the display countdown
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from game_clock import GameClock
+
+
+def test_countdown_speeds_up_with_x_marks():
+    clock = GameClock()
+    clock.start(300, now=0)
+    assert clock.remaining(100) == 200
+
+    # 1 X: a game second every 750 ms
+    clock.set_x_count(1, now=100)
+    assert clock.remaining(175) == 100
+
+    # 2 X: a game second every 500 ms
+    clock.set_x_count(2, now=175)
+    assert clock.remaining(200) == 50
+    assert clock.expires_at(200) == 225
+    assert not clock.expired(224.9)
+    assert clock.expired(225)
+
+
+def test_pause_and_resume_freeze_the_countdown():
+    clock = GameClock()
+    clock.start(60, now=1000)
+    clock.pause(now=1010)
+    assert clock.remaining(5000) == 50
+    assert not clock.expired(5000)
+    # X marks arriving while paused only affect the speed after resuming
+    clock.set_x_count(2, now=2000)
+    clock.resume(now=6000)
+    assert clock.remaining(6010) == 30
+    assert clock.remaining_seconds(6100) == 0
+    assert clock.expired(6100, grace=2)
+
+
+def test_stop_freezes_remaining_time():
+    clock = GameClock()
+    clock.start(100, now=0)
+    clock.stop(now=40)
+    assert clock.remaining(1000) == 60
+    assert not clock.expired(1000)
+    assert clock.snapshot(1000) == {"duration": 100, "remaining": 60, "running": False,
+                                    "paused": False, "x_count": 0}
+
+
+if __name__ == "__main__":
+    test_countdown_speeds_up_with_x_marks()
+    test_pause_and_resume_freeze_the_countdown()
+    test_stop_freezes_remaining_time()
+    print("Game clock tests passed")
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+In-process integration test: orchestrator plus simulated modules on the
+loopback transport. Needs no broker, network or hardware.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+from clock import VirtualClock
+from simulated_modules import VirtualRig, pump
+
+
+def setup_rig():
+    """Start a fresh orchestrator with all four simulated modules connected"""
+    config_dir = tempfile.mkdtemp()
+    config_file = os.path.join(config_dir, "config.json")
+    shutil.copy(os.path.join(os.path.dirname(orchestrator.__file__), "config.json"), config_file)
+    # Simulated time, so activation delays don't sleep and no checker threads pile up
+    rig = VirtualRig(orchestrator, VirtualClock(), config_file)
+    return rig.client, rig.modules, rig.transports
+
+
+def teardown_function(function):
+    VirtualRig.close_all()
+
+
+def test_activation_and_penalty():
+    """All modules connecting activates the rig, a wall hit reaches the display as X"""
+    client, modules, transports = setup_rig()
+    for module in modules.values():
+        module.announce()
+    pump(*transports)
+
+    for module in modules.values():
+        assert module.commands("ACTIVATE"), module.name
+    assert modules["maze"].commands("UPDATE_MAZE_CONFIG")
+    assert modules["button"].commands("UPDATE_BUTTON_CONFIG")
+
+    modules["maze"].send("WALL_HIT", maze_id="maze_2", position_x=2, position_y=1)
+    pump(*transports)
+    assert len(modules["display"].commands("X")) == 1
+    assert modules["display"].x_count == 1
+
+    state = orchestrator.get_state_snapshot()
+    assert state["activated"] and state["x_count"] == 1
+    assert all(module["connected"] for module in state["modules"].values())
+
+
+def test_penalty_burst_is_suppressed():
+    """Duplicated deliveries are dropped; with a rate limit a burst of wall hits costs a single X"""
+    client, modules, transports = setup_rig()
+    for module in modules.values():
+        module.announce()
+    pump(*transports)
+
+    # Shipped config: distinct wall hits all count, even close together
+    for position in range(2):
+        modules["maze"].send("WALL_HIT", maze_id="maze_2", position_x=position, position_y=1)
+        modules["maze"].clock.advance(0.2)
+    pump(*transports)
+    assert len(modules["display"].commands("X")) == 2
+
+    orchestrator.admission.configure(rate=1.0, burst=1, modules={"maze": {"rate": 0.5, "burst": 1}})
+    orchestrator.admission.reset()
+    for module in modules.values():
+        module.received.clear()
+    suppressed = orchestrator.admission.suppressed
+
+    for position in range(20):
+        modules["maze"].send("WALL_HIT", maze_id="maze_2", position_x=position, position_y=1)
+    duplicate = {"type": "WRONG_CUT_ALERT", "device": "ESP32_Wire", "timestamp": 777,
+                 "wrong_wire_cut": "BLUE", "expected_wire": "RED"}
+    modules["wire"].transport.publish("esp/to/rpi", json.dumps(duplicate))
+    modules["wire"].transport.publish("esp/to/rpi", json.dumps(duplicate))
+    pump(*transports)
+
+    assert len(modules["display"].commands("X")) == 2
+    assert orchestrator.get_state_snapshot()["suppressed_events"] - suppressed == 20
+
+
+def test_lost_completion_is_reconciled():
+    """A completion event that never arrives is picked up from the heartbeat"""
+    client, modules, transports = setup_rig()
+    for module in modules.values():
+        module.announce()
+    pump(*transports)
+
+    modules["wire"].complete()
+    modules["maze"].complete()
+    modules["button"].complete(report=False)
+    pump(*transports)
+    assert not modules["display"].commands("VICTORY")
+
+    modules["button"].heartbeat()
+    pump(*transports)
+    assert modules["display"].commands("VICTORY")
+    assert orchestrator.reconciler.corrections >= 1
+
+
+def test_rounds_are_recorded():
+    """A won round ends up on the leaderboard with its events"""
+    client, modules, transports = setup_rig()
+    store = orchestrator.open_session_store({"session_store": {
+        "enabled": True, "path": os.path.join(os.path.dirname(orchestrator.CONFIG_FILE), "sessions.db")}})
+    try:
+        for module in modules.values():
+            module.announce()
+        pump(*transports)
+        session = orchestrator.current_session
+        assert session is not None
+
+        modules["maze"].send("WALL_HIT", maze_id="maze_2", position_x=2, position_y=1)
+        pump(*transports)
+        for name in ("wire", "maze", "button"):
+            modules[name].complete()
+        pump(*transports)
+        assert orchestrator.current_session is None
+
+        store.flush()
+        board = store.leaderboard()
+        assert board[0]["session_id"] == session
+        assert board[0]["maze_id"] == orchestrator.active_maze_id
+        assert board[0]["x_count"] == 1
+        events = [event["type"] for event in store.session_events(session)]
+        assert events[0] == "WALL_HIT" and "X_ADDED" in events and "BUTTON_GAME_WON" in events
+    finally:
+        orchestrator.session_store = None
+        store.close()
+
+
+if __name__ == "__main__":
+    test_activation_and_penalty()
+    test_penalty_burst_is_suppressed()
+    test_lost_completion_is_reconciled()
+    test_rounds_are_recorded()
+    print("Loopback integration tests passed")
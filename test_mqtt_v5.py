@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Tests for the MQTT v5 features: topic aliases, request/response correlation
+and the fallback to 3.1.1
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+from clock import VirtualClock
+from embedded_broker import EmbeddedBroker
+from simulated_modules import VirtualRig
+from transport import LoopbackTransport, PahoTransport, Properties, TopicAliases
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def teardown_function(function):
+    VirtualRig.close_all()
+
+
+def test_topic_aliases_for_hot_topics_only():
+    aliases = TopicAliases(maximum=2)
+    assert aliases.lookup("rpi/to/esp2") == (1, False)
+    assert aliases.lookup("rpi/to/esp2") == (1, True)
+    assert aliases.lookup("config/response") == (None, False)
+    assert aliases.lookup("rpi/to/esp3") == (2, False)
+    # Out of aliases: the topic is sent in full
+    assert aliases.lookup("rpi/to/esp4") == (None, False)
+
+    # Aliases belong to one connection
+    aliases.reset(10)
+    assert aliases.lookup("rpi/to/esp4") == (1, False)
+    aliases.reset(0)
+    assert aliases.lookup("rpi/to/esp2") == (None, False)
+
+
+def test_config_request_is_answered_on_its_response_topic():
+    config_file = os.path.join(tempfile.mkdtemp(), "config.json")
+    shutil.copy(os.path.join(os.path.dirname(orchestrator.__file__), "config.json"), config_file)
+    rig = VirtualRig(orchestrator, VirtualClock(), config_file)
+    requester = LoopbackTransport(rig.broker)
+    requester.connect()
+    requester.drain()
+    requester.subscribe("replies/#")
+    requester.subscribe("config/response")
+    replies = []
+    requester.on_message = lambda client, userdata, msg: replies.append(msg)
+    rig.transports.append(requester)
+
+    requester.publish("config/request", "", properties=Properties(ResponseTopic="replies/tool-1",
+                                                                  CorrelationData=b"req-42"))
+    rig.pump()
+    assert [msg.topic for msg in replies] == ["replies/tool-1"]
+    assert replies[0].properties.CorrelationData == b"req-42"
+    assert "timer_settings" in json.loads(replies[0].payload)
+
+    # 3.1.1 requests get the fixed topic, as before
+    requester.publish("config/request", "")
+    rig.pump()
+    assert replies[-1].topic == "config/response" and replies[-1].properties is None
+
+
+def test_falls_back_to_311_when_broker_refuses_v5():
+    broker = EmbeddedBroker("127.0.0.1", 0).start()
+    client = PahoTransport(protocol="5", share_group="orchestrators")
+    connected = threading.Event()
+    received = []
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe("esp3/to/rpi")
+            connected.set()
+
+    client.on_connect = on_connect
+    client.on_message = lambda client, userdata, msg: received.append(msg)
+    try:
+        client.connect("127.0.0.1", broker.port, 60)
+        client.loop_start()
+        assert connected.wait(10)
+        assert not client.v5 and client.aliases.maximum == 0
+        # No $share prefix on a 3.1.1 connection
+        assert wait_until(lambda: any(session.subscriptions for session in broker.sessions.values()))
+        assert "esp3/to/rpi" in next(iter(broker.sessions.values())).subscriptions
+
+        client.publish("esp3/to/rpi", "hello")
+        client.publish("rpi/to/esp3", "no alias")
+        assert wait_until(lambda: received)
+        assert received[0].payload == b"hello"
+    finally:
+        client.loop_stop()
+        client.disconnect()
+        broker.stop()
+
+
+def test_private_subscriptions_skip_the_share_group():
+    client = PahoTransport(protocol="5", share_group="orchestrators")
+    subscribed = []
+    client._client.subscribe = lambda topic, qos=0: subscribed.append(topic) or (0, 1)
+    client.subscribe("esp3/to/rpi")
+    # The health probe topic, as ConnectionManager subscribes it
+    client.subscribe_private("rpi/health/abc")
+    assert subscribed == ["$share/orchestrators/esp3/to/rpi", "rpi/health/abc"]
+
+
+if __name__ == "__main__":
+    test_topic_aliases_for_hot_topics_only()
+    test_config_request_is_answered_on_its_response_topic()
+    test_falls_back_to_311_when_broker_refuses_v5()
+    test_private_subscriptions_skip_the_share_group()
+    print("MQTT v5 tests passed")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Tests for the outbound priority lanes
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from connection_manager import ConnectionManager
+from outbound import CONFIGURATION, CRITICAL, DIAGNOSTICS, FEEDBACK, Lane, OutboundScheduler, classify
+from ringlog import RingLog
+from transport import MQTT_ERR_QUEUED, LoopbackBroker, LoopbackTransport
+
+
+def command(msg_type, **fields):
+    return json.dumps(dict(fields, type=msg_type))
+
+
+def recorder(broker):
+    """A transport subscribed to every module topic, returns (transport, received)"""
+    transport = LoopbackTransport(broker)
+    transport.connect()
+    transport.drain()
+    transport.subscribe("rpi/to/#")
+    received = []
+    transport.on_message = lambda client, userdata, msg: received.append(
+        (msg.topic, json.loads(msg.payload)["type"]))
+    return transport, received
+
+
+class GatedTransport(LoopbackTransport):
+    """Loopback transport whose publishes wait until the gate opens"""
+
+    def __init__(self, broker):
+        super().__init__(broker)
+        self.entered = threading.Event()
+        self.gate = threading.Event()
+
+    def publish(self, topic, payload=None, qos=0, retain=False, properties=None):
+        self.entered.set()
+        self.gate.wait(5)
+        return super().publish(topic, payload, qos, retain, properties)
+
+
+def test_classify_and_lane_fairness():
+    assert classify("rpi/to/esp2", command("GAME_OVER"))[0] == CRITICAL
+    assert classify("rpi/to/esp2", command("X"))[0] == FEEDBACK
+    assert classify("rpi/to/esp3", command("UPDATE_MAZE_CONFIG"))[0] == CONFIGURATION
+    assert classify("config/response", "{}")[0] == CONFIGURATION
+    assert classify("rpi/to/esp", command("SOMETHING_NEW"))[0] == FEEDBACK
+    assert classify("rpi/profile/result", "done")[0] == DIAGNOSTICS
+
+    lane = Lane(capacity=4)
+    for n in range(3):
+        lane.push("esp3", ("esp3", n))
+    lane.push("esp4", ("esp4", 0))
+    # Full: the busiest module loses its oldest message, the other keeps its one
+    assert lane.push("esp3", ("esp3", 3)) == ("esp3", 0)
+    assert lane.push("esp4", ("esp4", 1)) == ("esp3", 1)
+    # esp3 and esp4 are tied, esp3 is next in turn
+    assert lane.push("esp2", ("esp2", 0)) == ("esp3", 2)
+    # Dropping messages didn't change whose turn it is
+    assert [lane.pop() for _ in range(4)] == [("esp3", 3), ("esp4", 0), ("esp2", 0), ("esp4", 1)]
+    lane = Lane(capacity=10)
+    for n in range(3):
+        lane.push("esp3", ("esp3", n))
+    lane.push("esp4", ("esp4", 0))
+    # Modules take turns
+    assert [lane.pop() for _ in range(4)] == [("esp3", 0), ("esp4", 0), ("esp3", 1), ("esp3", 2)]
+
+
+def test_critical_commands_overtake_config_pushes():
+    broker = LoopbackBroker()
+    listener, received = recorder(broker)
+    transport = GatedTransport(broker)
+    scheduler = OutboundScheduler(transport, capacity={"configuration": 8})
+    scheduler.connect(None)
+    try:
+        # The first push holds up the link, so everything after it queues
+        assert scheduler.publish("rpi/to/esp3", command("UPDATE_MAZE_CONFIG", n=0)).rc == MQTT_ERR_QUEUED
+        assert transport.entered.wait(5)
+        for n in range(1, 20):
+            scheduler.publish("rpi/to/esp3", command("UPDATE_MAZE_CONFIG", n=n))
+        scheduler.publish("rpi/to/esp4", command("UPDATE_BUTTON_CONFIG"))
+        scheduler.publish("rpi/to/esp4", command("START_GAME"))
+        scheduler.publish("rpi/to/esp2", command("X"))
+        scheduler.publish("rpi/to/esp2", command("GAME_OVER"))
+        scheduler.publish("rpi/to/esp2", command("X"))
+        scheduler.publish("rpi/to/esp2", command("RESET_X"))
+        # The button config took the place of a maze push, not the other way round
+        assert scheduler.pending() == 13
+        transport.gate.set()
+        assert scheduler.flush()
+        listener.drain()
+    finally:
+        scheduler.stop()
+
+    assert received[:7] == [
+        ("rpi/to/esp3", "UPDATE_MAZE_CONFIG"),
+        # The button config was queued before START_GAME, so it goes first with it
+        ("rpi/to/esp4", "UPDATE_BUTTON_CONFIG"),
+        ("rpi/to/esp2", "GAME_OVER"),
+        ("rpi/to/esp4", "START_GAME"),
+        # Both X marks were queued before RESET_X, so they can't arrive after it
+        ("rpi/to/esp2", "X"),
+        ("rpi/to/esp2", "X"),
+        ("rpi/to/esp2", "RESET_X"),
+    ]
+    assert received[7:] == [("rpi/to/esp3", "UPDATE_MAZE_CONFIG")] * 7
+    assert scheduler.stats["dropped"][CONFIGURATION] == 12 and scheduler.stats["promoted"] == 3
+
+    # Disabled: publishes go straight through
+    scheduler.configure(enabled=False)
+    scheduler.connect(None)
+    scheduler.publish("rpi/to/esp2", command("VICTORY"))
+    listener.drain()
+    assert received[-1] == ("rpi/to/esp2", "VICTORY")
+    scheduler.stop()
+
+
+def test_offline_publishes_are_buffered_by_the_connection_manager():
+    broker = LoopbackBroker()
+    listener, received = recorder(broker)
+    manager = ConnectionManager(lambda: LoopbackTransport(broker), [("loopback", 1883)],
+                                log=RingLog(stream=open(os.devnull, "w")))
+    scheduler = OutboundScheduler(manager, rate=1000)
+    scheduler.start()
+    try:
+        # No broker yet: the scheduler passes everything on unpaced, the buffer collapses it
+        scheduler.publish("rpi/to/esp3", command("UPDATE_MAZE_CONFIG", n=1))
+        scheduler.publish("rpi/to/esp3", command("UPDATE_MAZE_CONFIG", n=2))
+        scheduler.publish("rpi/to/esp2", command("PAUSE_TIMER"))
+        scheduler.publish("rpi/to/esp2", command("RESUME_TIMER"))
+        scheduler.publish("rpi/to/esp2", command("GAME_OVER"))
+        assert scheduler.flush() and scheduler.pending() == 0
+        assert len(manager.buffer) == 2
+
+        scheduler.connect(None)
+        manager.loop_start()
+        assert scheduler.flush()
+        deadline = time.monotonic() + 5
+        while len(received) < 2 and time.monotonic() < deadline:
+            listener.loop(0.01)
+    finally:
+        manager.loop_stop()
+        scheduler.stop()
+    assert received == [("rpi/to/esp2", "GAME_OVER"), ("rpi/to/esp3", "UPDATE_MAZE_CONFIG")]
+
+
+if __name__ == "__main__":
+    test_classify_and_lane_fairness()
+    test_critical_commands_overtake_config_pushes()
+    test_offline_publishes_are_buffered_by_the_connection_manager()
+    print("All outbound tests passed")
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for on-demand profiling over MQTT
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+import profiling
+from clock import VirtualClock
+from simulated_modules import VirtualRig
+from transport import LoopbackTransport
+
+
+def setup_rig(output_dir="profiles", enabled=True):
+    config_dir = tempfile.mkdtemp()
+    config_file = os.path.join(config_dir, "config.json")
+    shutil.copy(os.path.join(os.path.dirname(orchestrator.__file__), "config.json"), config_file)
+    with open(config_file) as f:
+        config = json.load(f)
+    config["profiling"]["enabled"] = enabled
+    config["profiling"]["output_dir"] = os.path.join(config_dir, output_dir)
+    with open(config_file, "w") as f:
+        json.dump(config, f)
+    rig = VirtualRig(orchestrator, VirtualClock(), config_file)
+
+    admin = LoopbackTransport(rig.broker)
+    admin.connect()
+    admin.drain()
+    admin.subscribe(profiling.RESULT_TOPIC)
+    results = []
+    admin.on_message = lambda client, userdata, msg: results.append(json.loads(msg.payload))
+    rig.transports.append(admin)
+    return rig, admin, results
+
+
+def wait_for(results, rig, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not results and time.monotonic() < deadline:
+        time.sleep(0.01)
+        rig.pump()
+    return results
+
+
+def teardown_function(function):
+    VirtualRig.close_all()
+
+
+def test_profile_session_over_mqtt():
+    rig, admin, results = setup_rig()
+    handler = rig.client.on_message
+    admin.publish(orchestrator.PROFILE_TOPIC, json.dumps({"duration": 0.3, "top": 5}))
+    rig.pump()
+    assert profiling.active_session() is not None
+    assert rig.client.on_message is not handler
+
+    # A second request while one runs is refused
+    admin.publish(orchestrator.PROFILE_TOPIC, json.dumps({"duration": 5}))
+    rig.pump()
+    assert results.pop() == {"type": "PROFILE_BUSY"}
+
+    rig.announce()
+    for position in range(5):
+        rig.modules["maze"].send("WALL_HIT", maze_id="maze_2", position_x=position, position_y=1)
+    rig.pump()
+
+    summary = wait_for(results, rig)[0]
+    assert summary["type"] == "PROFILE_RESULT" and summary["messages"] > 5
+    assert "esp3/to/rpi" in summary["topics"]
+    assert len(summary["top_functions"]) == 5
+    assert any("handle_message" in entry["function"] for entry in summary["top_functions"])
+    assert summary["samples"] > 0 and summary["top_stacks"]
+    assert os.path.exists(summary["files"]["pstats"]) and os.path.exists(summary["files"]["collapsed"])
+
+    # Nothing is left behind once the session ended
+    assert rig.client.on_message is handler
+    assert profiling.active_session() is None
+
+
+def test_duration_is_capped_and_stop_ends_early():
+    rig, admin, results = setup_rig()
+    admin.publish(orchestrator.PROFILE_TOPIC, json.dumps({"duration": 100000, "mode": "sample"}))
+    rig.pump()
+    session = profiling.active_session()
+    assert session.duration == 60
+
+    admin.publish(orchestrator.PROFILE_TOPIC, json.dumps({"action": "stop"}))
+    summary = wait_for(results, rig)[0]
+    assert summary["mode"] == "sample" and summary["duration"] < 5
+    assert profiling.active_session() is None
+
+    admin.publish(orchestrator.PROFILE_TOPIC, json.dumps({"mode": "bogus"}))
+    rig.pump()
+    assert results[-1]["type"] == "PROFILE_ERROR"
+
+
+def test_unwritable_output_is_reported():
+    rig, admin, results = setup_rig(output_dir="config.json")  # a file, not a directory
+    admin.publish(orchestrator.PROFILE_TOPIC, json.dumps({"duration": 0.1, "mode": "sample"}))
+    rig.pump()
+    summary = wait_for(results, rig)[0]
+    assert summary["type"] == "PROFILE_ERROR" and "Could not write" in summary["message"]
+    assert summary["files"] == {} and profiling.active_session() is None
+
+    # Disabled, as shipped: requests are ignored
+    rig, admin, results = setup_rig(enabled=False)
+    admin.publish(orchestrator.PROFILE_TOPIC, json.dumps({"duration": 0.1}))
+    rig.pump()
+    assert profiling.active_session() is None and not results
+
+
+if __name__ == "__main__":
+    test_profile_session_over_mqtt()
+    test_duration_is_capped_and_stop_ends_early()
+    test_unwritable_output_is_reported()
+    print("Profiling tests passed")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the Reconciler: completions and resends from status reports
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from reconcile import Reconciler
+
+
+def report(**fields):
+    return SimpleNamespace(**fields)
+
+
+def test_missed_completion_is_accepted_once():
+    reconciler = Reconciler(["wire", "maze", "button", "display"])
+    assert reconciler.observe("maze", report(game_won=False)) == []
+    assert reconciler.observe("maze", report(game_won=True)) == [("accept_completion", "maze", None)]
+    assert reconciler.observe("maze", report(game_won=True)) == []
+    assert reconciler.corrections_by_kind == {"accept_completion": 1}
+
+
+def test_stale_completion_after_reset_is_ignored():
+    reconciler = Reconciler(["wire", "maze", "button", "display"])
+    reconciler.mark_completed("wire")
+    reconciler.observe("button", report(game_won=True))
+    reconciler.reset()
+
+    # Heartbeats sent before the modules processed RESET_GAME
+    assert reconciler.observe("wire", report(game_completed=True)) == []
+    assert reconciler.observe("button", report(game_won=True)) == []
+    # The first report after the reset acknowledges it
+    assert reconciler.observe("wire", report(game_completed=False)) == []
+    assert reconciler.observe("wire", report(game_completed=True)) == [("accept_completion", "wire", None)]
+
+    # A module that wasn't completed has nothing stale to report
+    assert reconciler.observe("maze", report(game_won=True)) == [("accept_completion", "maze", None)]
+    # A completion event also shows the module is in the new round
+    reconciler.mark_completed("button")
+    assert reconciler.observe("button", report(game_won=True)) == []
+
+
+def test_drift_is_resent_after_threshold():
+    reconciler = Reconciler(["wire", "display"], mismatch_threshold=2)
+    reconciler.expect_paused("wire", True)
+    assert reconciler.observe("wire", report(game_paused=False)) == []
+    assert reconciler.observe("wire", report(game_paused=False)) == [("resend", "wire", "PAUSE_TIMER")]
+    # The streak starts over after a resend and when the module agrees
+    assert reconciler.observe("wire", report(game_paused=False)) == []
+    assert reconciler.observe("wire", report(game_paused=True)) == []
+    assert reconciler.observe("wire", report(game_paused=False)) == []
+
+    reconciler.expect_paused("wire", False)
+    assert reconciler.observe("wire", report(game_paused=True)) == []
+    assert reconciler.observe("wire", report(game_paused=True)) == [("resend", "wire", "RESUME_TIMER")]
+
+    # Display still counting after the game ended gets the outcome again
+    reconciler.expect_outcome("GAME_OVER")
+    assert reconciler.observe("display", report(active=True, paused=False)) == []
+    assert reconciler.observe("display", report(active=True, paused=False)) == [("resend", "display", "GAME_OVER")]
+    assert reconciler.observe("display", report(active=False, paused=False)) == []
+    assert reconciler.corrections_by_kind == {"resend": 3}
+
+
+if __name__ == "__main__":
+    test_missed_completion_is_accepted_once()
+    test_stale_completion_after_reset_is_ignored()
+    test_drift_is_resent_after_threshold()
+    print("All reconcile tests passed")
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Tests for the ring-buffered logger used by the orchestrator
+"""
+
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from ringlog import DEBUG, RingLog
+
+
+def test_levels_filter_output_but_keep_history():
+    """Records below the output level are captured for dumps but not written"""
+    stream = io.StringIO()
+    log = RingLog(capacity=16, levels={"raw": "warning"}, stream=stream)
+    log.debug("raw", "Payload: %s", "{}")
+    log.info("game", "WALL HIT IN MAZE!", maze_id="maze_2")
+    log.flush()
+
+    output = stream.getvalue()
+    assert "WALL HIT IN MAZE! maze_id=maze_2" in output
+    assert "Payload" not in output
+    assert [r.level for r in log.recent(10)] == [DEBUG, 20]
+
+
+def test_ring_buffer_is_bounded_and_dump_prints_last_records():
+    stream = io.StringIO()
+    # Slow writer, so anything written must have come from flush()
+    log = RingLog(capacity=4, levels={"raw": "error"}, stream=stream, flush_interval=60)
+    for i in range(10):
+        log.debug("raw", "message %d", i)
+    assert len(log.recent(0)) == 4
+
+    log.dump(2, title="GAME OVER")
+    # Left to the writer thread, not written by the caller
+    assert stream.getvalue() == ""
+    log.resize(8)
+    log.flush()
+    output = stream.getvalue()
+    assert "GAME OVER: last 2 records" in output
+    assert "message 9" in output and "message 8" in output
+    assert "message 7" not in output
+
+
+def test_background_writer_drains_records():
+    stream = io.StringIO()
+    log = RingLog(stream=stream, flush_interval=0.01)
+    log.info("game", "VICTORY")
+    deadline = time.time() + 2
+    while not stream.getvalue() and time.time() < deadline:
+        time.sleep(0.01)
+    assert "[game] INFO VICTORY" in stream.getvalue()
+
+
+if __name__ == "__main__":
+    test_levels_filter_output_but_keep_history()
+    test_ring_buffer_is_bounded_and_dump_prints_last_records()
+    test_background_writer_drains_records()
+    print("Ring log tests passed")
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Scenario suite on simulated time: heartbeat timeouts, pause/resume, the
+start countdown and the game clock, with the orchestrator and simulated
+modules on a VirtualClock. Hours of game time run in milliseconds.
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+from clock import VirtualClock
+from simulated_modules import VirtualRig
+
+MODULES = ("wire", "display", "maze", "button")
+
+
+def setup_rig(game_duration=400):
+    config_dir = tempfile.mkdtemp()
+    config_file = os.path.join(config_dir, "config.json")
+    shutil.copy(os.path.join(os.path.dirname(orchestrator.__file__), "config.json"), config_file)
+    rig = VirtualRig(orchestrator, VirtualClock(), config_file)
+    rig.announce()
+    assert orchestrator.activation_sent
+    assert orchestrator.game_clock.duration == game_duration
+    return rig
+
+
+def teardown_function(function):
+    VirtualRig.close_all()
+
+
+def test_dropout_pauses_and_reconnect_resumes():
+    rig = setup_rig()
+    rig.run(30)
+    assert not orchestrator.games_paused
+
+    rig.drop("maze")
+    rig.run(9)
+    assert not orchestrator.games_paused  # not timed out yet
+    rig.run(4)
+    assert orchestrator.games_paused and not orchestrator.modules_connected["maze"]
+    assert rig.modules["display"].paused and orchestrator.game_clock.paused
+    paused_remaining = orchestrator.game_clock.remaining(rig.clock.time())
+
+    # However long the outage, no game time passes
+    rig.run(3600)
+    assert orchestrator.game_clock.remaining(rig.clock.time()) == paused_remaining
+
+    rig.announce("maze")
+    rig.run(2)
+    assert not orchestrator.games_paused and not rig.modules["display"].paused
+    assert orchestrator.game_clock.remaining(rig.clock.time()) < paused_remaining
+
+
+def test_reconnect_during_countdown():
+    rig = setup_rig()
+    rig.drop("button")
+    rig.run(14)
+    assert orchestrator.games_paused
+
+    # The button comes back 1.5s into the 3s start countdown
+    rig.at(1.5, rig.announce, "button")
+    orchestrator.start_all_games(rig.client)
+    rig.pump()
+    rig.run(2)
+
+    assert not orchestrator.games_paused
+    assert all(orchestrator.modules_connected.values())
+    for name in ("wire", "maze", "button"):
+        assert rig.modules[name].commands("START_GAME"), name
+    assert rig.modules["display"].commands("START_TIMER")
+    assert orchestrator.game_clock.running and not orchestrator.game_clock.paused
+
+
+def test_timer_finished_while_paused():
+    rig = setup_rig()
+    rig.drop("wire")
+    rig.run(14)
+    assert orchestrator.games_paused
+
+    # The display ran out before it saw the pause
+    rig.send("display", "TIMER_FINISHED", x_count=0, max_x_count=3)
+    assert orchestrator.reconciler.outcome == "GAME_OVER"
+    assert all(rig.modules[name].commands("GAME_OVER") for name in MODULES)
+    assert not orchestrator.game_clock.running
+
+    # A reconnect afterwards must not restart anything
+    rig.announce("wire")
+    rig.run(10)
+    assert orchestrator.reconciler.outcome == "GAME_OVER"
+    assert not orchestrator.game_clock.running
+    assert len(rig.modules["display"].commands("GAME_OVER")) == 1
+
+
+def test_lost_timer_finished_is_enforced_by_game_clock():
+    rig = setup_rig()
+    started = rig.clock.time()
+    rig.run(399)
+    assert orchestrator.reconciler.outcome is None
+
+    rig.run(10)
+    assert orchestrator.reconciler.outcome == "GAME_OVER"
+    game_over = rig.modules["display"].commands("GAME_OVER")
+    assert game_over and game_over[0][2]["reason"] == "orchestrator_clock"
+    assert 400 <= orchestrator.game_clock.duration <= rig.clock.time() - started
+
+
+def test_x_marks_speed_up_the_clock():
+    rig = setup_rig()
+    rig.run(100)  # 300s left
+    rig.send("maze", "WALL_HIT", maze_id="maze_2", position_x=1, position_y=1)
+    rig.run(75)   # 100 game seconds at 750ms
+    rig.send("maze", "WALL_HIT", maze_id="maze_2", position_x=1, position_y=1)
+    assert orchestrator.x_count == 2
+    assert abs(orchestrator.game_clock.remaining(rig.clock.time()) - 200) < 1
+
+    rig.run(98)   # 196 game seconds at 500ms
+    assert orchestrator.reconciler.outcome is None
+    rig.run(6)
+    assert orchestrator.reconciler.outcome == "GAME_OVER"
+
+
+def test_hours_of_flapping_modules():
+    """Random dropouts and reconnects with invariants checked every heartbeat"""
+    real_start = time.perf_counter()
+    for seed in range(100):
+        rng = random.Random(seed)
+        rig = setup_rig()
+        remaining = orchestrator.game_clock.remaining(rig.clock.time())
+        offline_since = {}
+        online_since = {name: rig.clock.time() for name in MODULES}
+
+        for _ in range(90):
+            if orchestrator.reconciler.outcome is not None:
+                break
+            name = rng.choice(MODULES)
+            if name in rig.online and rng.random() < 0.1:
+                rig.drop(name)
+                offline_since[name] = rig.clock.time()
+                online_since.pop(name, None)
+            elif name not in rig.online and rng.random() < 0.3:
+                rig.announce(name)
+                online_since[name] = rig.clock.time()
+                offline_since.pop(name, None)
+            rig.run(2)
+
+            now = rig.clock.time()
+            game_clock = orchestrator.game_clock
+            assert game_clock.paused == orchestrator.games_paused, seed
+            assert rig.modules["display"].paused == orchestrator.games_paused, seed
+            if any(now - since > orchestrator.HEARTBEAT_TIMEOUT + 2 for since in offline_since.values()):
+                assert orchestrator.games_paused, seed
+            if not offline_since and all(now - since >= 2 for since in online_since.values()):
+                assert not orchestrator.games_paused, seed
+            current = game_clock.remaining(now)
+            assert current <= remaining, seed
+            remaining = current
+        rig.close()
+
+    # 100 rounds of 3 simulated minutes
+    assert time.perf_counter() - real_start < 30
+
+
+def test_closed_rig_restores_the_orchestrator():
+    clock, config_file = orchestrator.clock, orchestrator.CONFIG_FILE
+    with setup_rig() as rig:
+        assert orchestrator.clock is rig.clock
+    assert orchestrator.clock is clock and orchestrator.CONFIG_FILE == config_file
+    assert orchestrator.heartbeat_job is None and not rig.client.is_connected()
+
+
+if __name__ == "__main__":
+    test_dropout_pauses_and_reconnect_resumes()
+    test_reconnect_during_countdown()
+    test_timer_finished_while_paused()
+    test_lost_timer_finished_is_enforced_by_game_clock()
+    test_x_marks_speed_up_the_clock()
+    test_hours_of_flapping_modules()
+    test_closed_rig_restores_the_orchestrator()
+    print("Scenario tests passed")
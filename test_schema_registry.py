@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for the message schema registry, including a seeded fuzz test
+"""
+
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from schemas import SCHEMAS, SchemaRegistry
+
+FUZZ_ITERATIONS = 20000
+
+
+def test_valid_messages_decode_to_typed_records():
+    registry = SchemaRegistry()
+    record = registry.decode(json.dumps({
+        "type": "BUTTON_GAME_WON",
+        "press_duration": 2100,
+        "target_time": 2000,
+        "difference": 100.0,
+        "device": "ESP32_Button",
+    }).encode())
+    assert record.type == "BUTTON_GAME_WON"
+    assert record.press_duration == 2100
+    assert record.difference == 100 and isinstance(record.difference, int)
+    assert record.buffer is None
+    assert record.message == ""
+
+    heartbeat = registry.decode('{"type": "HEARTBEAT", "active": true, "paused": false}')
+    assert heartbeat.active is True and heartbeat.paused is False
+    assert heartbeat.game_won is None
+    assert registry.counters["decoded"] == 2
+
+
+def test_invalid_messages_are_counted_and_dropped():
+    registry = SchemaRegistry()
+    assert registry.decode(b"not json") is None
+    assert registry.decode(b"1") is None
+    assert registry.decode(b'{"type": "NOPE"}') is None
+    assert registry.decode(b'{"type": ["WALL_HIT"]}') is None
+    assert registry.decode(b'{"type": "WALL_HIT", "position_x": "3"}') is None
+    assert registry.decode(b'{"type": "X_ADDED", "x_count": Infinity}') is None
+    assert registry.decode(b"\xff\xfe") is None
+    assert registry.counters == {
+        "decoded": 0,
+        "invalid_json": 2,
+        "not_object": 1,
+        "unknown_type": 2,
+        "invalid_fields": 2,
+    }
+    assert registry.dropped == 7
+
+
+def random_value(rng, depth=0):
+    choice = rng.randrange(9)
+    if choice == 0:
+        return None
+    if choice == 1:
+        return rng.choice([True, False])
+    if choice == 2:
+        return rng.randint(-2**40, 2**40)
+    if choice == 3:
+        return rng.choice([rng.uniform(-1e6, 1e6), float("nan"), float("inf"), 1e300])
+    if choice == 4:
+        return "".join(chr(rng.randrange(0x20, 0x3000)) for _ in range(rng.randrange(12)))
+    if choice == 5 and depth < 3:
+        return [random_value(rng, depth + 1) for _ in range(rng.randrange(4))]
+    if choice == 6 and depth < 3:
+        return {str(rng.randrange(10)): random_value(rng, depth + 1) for _ in range(rng.randrange(4))}
+    if choice == 7:
+        return rng.choice(list(SCHEMAS))
+    return ""
+
+
+def random_payload(rng):
+    kind = rng.randrange(5)
+    if kind == 0:
+        return bytes(rng.randrange(256) for _ in range(rng.randrange(64)))
+    if kind == 1:
+        return json.dumps(random_value(rng)).encode()
+    # Start from a real schema and corrupt some of its fields
+    msg_type = rng.choice(list(SCHEMAS))
+    message = {"type": msg_type}
+    for name in SCHEMAS[msg_type]:
+        if rng.random() < 0.7:
+            message[name] = random_value(rng)
+    if kind == 3:
+        message["type"] = random_value(rng)
+    payload = json.dumps(message).encode()
+    if kind == 4 and payload:
+        # Truncate or flip a byte
+        cut = rng.randrange(len(payload))
+        payload = payload[:cut] + bytes([rng.randrange(256)]) + payload[cut + 1:]
+    return payload
+
+
+def test_fuzz_decoder_never_raises():
+    rng = random.Random(1234)
+    registry = SchemaRegistry()
+    for _ in range(FUZZ_ITERATIONS):
+        record = registry.decode(random_payload(rng))
+        if record is not None:
+            fields = SCHEMAS[record.type]
+            for name, (kind, default) in fields.items():
+                value = getattr(record, name)
+                if value is None or value == default:
+                    continue
+                expected = {"int": int, "bool": bool, "str": str}.get(kind)
+                if expected:
+                    assert value.__class__ is expected, (record, name)
+    assert sum(registry.counters.values()) == FUZZ_ITERATIONS
+    assert registry.counters["decoded"] > 0 and registry.dropped > 0
+
+
+if __name__ == "__main__":
+    test_valid_messages_decode_to_typed_records()
+    test_invalid_messages_are_counted_and_dropped()
+    test_fuzz_decoder_never_raises()
+    print("Schema registry tests passed")
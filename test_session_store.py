@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the SQLite session store and leaderboard
+"""
+
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+from ringlog import RingLog
+from session_store import INSERT_EVENT, INSERT_SESSION, SessionStore, connect
+
+
+def play(store, started_at, elapsed, outcome="VICTORY", maze_id="maze_1", button_id="button_1"):
+    session = store.begin_session(started_at, maze_id=maze_id, button_id=button_id, duration=360)
+    store.record_event(session, "WALL_HIT", started_at + elapsed / 2, module="maze", x_count=1)
+    store.end_session(session, outcome, started_at + elapsed, time_remaining=int(360 - elapsed), x_count=1)
+    return session
+
+
+def test_leaderboard_orders_and_filters():
+    store = SessionStore(os.path.join(tempfile.mkdtemp(), "sessions.db"))
+    play(store, 1000, 200)
+    fastest = play(store, 2000, 90)
+    play(store, 3000, 60, outcome="GAME_OVER")
+    play(store, 4000, 120, maze_id="maze_2")
+    late = play(store, 90000, 150)
+    store.flush()
+
+    board = store.leaderboard()
+    assert [row["elapsed"] for row in board] == [90, 120, 150, 200]
+    assert board[0]["session_id"] == fastest
+
+    combo = store.leaderboard(maze_id="maze_1", button_id="button_1")
+    assert [row["elapsed"] for row in combo] == [90, 150, 200]
+    assert [row["session_id"] for row in store.leaderboard(since=50000)] == [late]
+    assert len(store.leaderboard(limit=2, until=50000)) == 2
+
+    assert store.session_events(fastest) == [
+        {"type": "WALL_HIT", "module": "maze", "elapsed": 45, "x_count": 1}]
+    store.close()
+
+
+def test_reopening_continues_session_ids():
+    path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    store = SessionStore(path)
+    first = play(store, 1000, 100)
+    store.close()
+
+    store = SessionStore(path)
+    assert play(store, 2000, 100) == first + 1
+    store.flush()
+    assert store.session_count() == 2
+    store.close()
+
+
+def test_failed_batch_is_logged_and_counted():
+    stream = io.StringIO()
+    path = os.path.join(tempfile.mkdtemp(), "sessions.db")
+    store = SessionStore(path, log=RingLog(stream=stream))
+    session = play(store, 1000, 100)
+    store.flush()
+
+    # A batch reusing that session id fails as a whole
+    connection = connect(path)
+    store._write_batch(connection, [
+        (INSERT_SESSION, (session, None, 2000, "maze_1", "button_1", 360)),
+        (INSERT_EVENT, (session, 2050, 50, "WALL_HIT", "maze", 1)),
+    ])
+    connection.close()
+    store.log.flush()
+    assert store.rows_dropped == 2 and store.session_count() == 1
+    assert "dropped a batch of 2 rows" in stream.getvalue()
+    store.close()
+
+
+if __name__ == "__main__":
+    test_leaderboard_orders_and_filters()
+    test_reopening_continues_session_ids()
+    test_failed_batch_is_logged_and_counted()
+    print("Session store tests passed")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for the sharded orchestrator: routing, pinning and shared counters
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+from sharding import (INBOUND_TOPICS, HashRing, RoomBridge, SharedCounters, ShardedOrchestrator, WorkerShard,
+                      mosquitto_bridge_config, split_room_topic)
+from transport import LoopbackBroker, LoopbackTransport, Message
+
+
+def test_hash_ring_is_balanced_and_stable():
+    rooms = [f"room-{i}" for i in range(4000)]
+    ring = HashRing(range(4))
+    before = {room: ring.node_for(room) for room in rooms}
+    per_node = [list(before.values()).count(node) for node in range(4)]
+    assert min(per_node) > 700, per_node
+
+    # Adding a fifth worker only moves the rooms it takes over
+    ring.add(4)
+    moved = [room for room in rooms if ring.node_for(room) != before[room]]
+    assert all(ring.node_for(room) == 4 for room in moved)
+    assert len(moved) < len(rooms) * 0.35
+
+
+def test_room_topics():
+    assert split_room_topic("rooms/escape-1/esp3/to/rpi") == ("escape-1", "esp3/to/rpi")
+    assert split_room_topic("rooms/escape-1/rpi/to/esp3") == (None, None)
+    assert split_room_topic("esp3/to/rpi") == (None, None)
+    assert split_room_topic("rooms/escape-1/rpi/admin/profile") == ("escape-1", "rpi/admin/profile")
+    # Every topic the orchestrator listens on reaches the workers
+    assert set(INBOUND_TOPICS) == set(orchestrator.INBOUND_TOPICS)
+
+    config = mosquitto_bridge_config("escape-1", "central.local")
+    assert 'topic esp3/to/rpi out 0 "" rooms/escape-1/' in config.splitlines()
+    assert 'topic rpi/to/# in 0 "" rooms/escape-1/' in config.splitlines()
+
+
+def test_room_bridge_maps_bare_topics():
+    rig_broker, central_broker = LoopbackBroker(), LoopbackBroker()
+    local, central = LoopbackTransport(rig_broker), LoopbackTransport(central_broker)
+    bridge = RoomBridge("escape-1", local, central)
+    firmware, front = LoopbackTransport(rig_broker), LoopbackTransport(central_broker)
+    received = []
+    for transport in (local, central, firmware, front):
+        transport.connect()
+        transport.drain()
+    firmware.subscribe("rpi/to/esp3")
+    front.subscribe("rooms/+/esp3/to/rpi")
+    firmware.on_message = front.on_message = lambda client, userdata, msg: received.append(msg.topic)
+
+    firmware.publish("esp3/to/rpi", b"{}")
+    local.drain()
+    front.drain()
+    front.publish("rooms/escape-1/rpi/to/esp3", b"{}")
+    front.publish("rooms/escape-2/rpi/to/esp3", b"{}")
+    central.drain()
+    firmware.drain()
+    assert received == ["rooms/escape-1/esp3/to/rpi", "rpi/to/esp3"]
+    assert bridge.relayed == 2
+
+
+def test_rooms_get_their_own_orchestrator():
+    config_file = os.path.join(tempfile.mkdtemp(), "config.json")
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi", "config.json"), config_file)
+    transport = LoopbackTransport(LoopbackBroker())
+    transport.connect()
+    shard = WorkerShard(0, transport, SharedCounters(1), config_file, heartbeats=False)
+    first, second = shard.open_room("escape-1"), shard.open_room("escape-2")
+    assert first.orchestrator is not second.orchestrator
+    assert sys.modules["mqtt@escape-1"] is first.orchestrator
+    assert first.orchestrator.log is second.orchestrator.log is shard.log
+
+    display_connected = json.dumps({"type": "DISPLAY_CONNECTED", "device": "ESP32_Display"})
+    first.orchestrator.on_message(first.client, None, Message("esp2/to/rpi", display_connected))
+    assert first.orchestrator.modules_connected["display"]
+    assert not second.orchestrator.modules_connected["display"]
+
+    shard.close()
+    assert "mqtt@escape-1" not in sys.modules and not shard.rooms
+    assert shard.counters.total("rooms") == 0
+
+
+def test_rooms_are_pinned_to_workers():
+    config_file = os.path.join(tempfile.mkdtemp(), "config.json")
+    shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi", "config.json"), config_file)
+    front = ShardedOrchestrator(workers=2, config_file=config_file, transport_kind="loopback",
+                                log_file=os.devnull, heartbeats=False).start()
+    try:
+        rooms = [f"room-{i}" for i in range(6)]
+        for timestamp in range(5):
+            for room in rooms:
+                heartbeat = {"type": "HEARTBEAT", "device": "ESP32_Maze", "timestamp": timestamp}
+                assert front.dispatch(f"rooms/{room}/esp3/to/rpi", json.dumps(heartbeat).encode())
+        assert not front.dispatch("esp3/to/rpi", b"{}")
+        assert front.wait_idle()
+
+        totals = front.counters.totals()
+        assert totals["messages"] == 30
+        # Each room was opened exactly once, on the worker the ring picked
+        assert totals["rooms"] == len(rooms)
+        for worker in range(2):
+            assert front.counters.get(worker, "rooms") == sum(front.worker_for(room) == worker for room in rooms)
+    finally:
+        front.stop()
+
+
+if __name__ == "__main__":
+    test_hash_ring_is_balanced_and_stable()
+    test_room_topics()
+    test_room_bridge_maps_bare_topics()
+    test_rooms_get_their_own_orchestrator()
+    test_rooms_are_pinned_to_workers()
+    print("Sharding tests passed")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the soak harness and the resource leaks it guards against
+"""
+
+import csv
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "raspberry-pi"))
+
+import mqtt as orchestrator
+from clock import SystemClock
+from ringlog import RingLog
+from soak_orchestrator import COLUMNS, grows, run_soak
+from transport import LoopbackBroker, LoopbackTransport
+
+
+def heartbeat_threads():
+    return [thread for thread in threading.enumerate() if thread.name == "heartbeat-checker"]
+
+
+def test_reconnects_keep_one_heartbeat_thread():
+    saved_clock, orchestrator.clock = orchestrator.clock, SystemClock(orchestrator.log)
+    client = LoopbackTransport(LoopbackBroker())
+    client.connect()
+    try:
+        for _ in range(5):
+            orchestrator.on_connect(client, None, {}, 0)
+        assert len(heartbeat_threads()) == 1
+    finally:
+        orchestrator.heartbeat_job.cancel()
+        orchestrator.heartbeat_job.thread.join(1)
+        orchestrator.heartbeat_job = None
+        orchestrator.clock = saved_clock
+    assert not heartbeat_threads()
+
+
+def test_failing_periodic_job_keeps_running():
+    calls = []
+
+    def job():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            raise RuntimeError("broker gone")
+
+    periodic = SystemClock(RingLog(stream=io.StringIO())).every(0.01, job, name="flaky-job")
+    try:
+        deadline = time.monotonic() + 5
+        while len(calls) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        periodic.cancel()
+    assert len(calls) >= 3
+    failures = [record for record in periodic.log.recent() if record.message == "Periodic job %s failed"]
+    assert len(failures) == 1 and failures[0].exc_info[1].args == ("broker gone",)
+
+
+def test_growth_detection():
+    assert grows([10, 11, 12, 13, 15, 16], 0.1, 0)
+    assert not grows([10, 11, 12, 13, 15, 16], 0.1, 10)
+    assert not grows([10, 14, 9, 15, 10, 16, 9], 0.1, 0)  # noisy, not a trend
+    assert not grows([5, 5, 5, 5], 0.0, 0)
+
+
+def test_short_soak_is_flat():
+    report = os.path.join(tempfile.mkdtemp(), "soak.csv")
+    samples, failures = run_soak(150, report, sample_every=10)
+    assert not failures, failures
+    assert len(samples) == 15 and samples[-1]["clock_jobs"] == samples[0]["clock_jobs"]
+    with open(report) as f:
+        rows = list(csv.DictReader(f))
+    assert tuple(rows[0]) == COLUMNS and len(rows) == 15
+
+
+if __name__ == "__main__":
+    test_reconnects_keep_one_heartbeat_thread()
+    test_failing_periodic_job_keeps_running()
+    test_growth_detection()
+    test_short_soak_is_flat()
+    print("Soak tests passed")